@@ -0,0 +1,59 @@
+import apiClient from './index';
+
+/**
+ * EVM批量查询余额（服务端 Multicall3 / JSON-RPC 批量请求）
+ * @param {Object} params 查询参数
+ * @param {number} params.chainId 链ID（与 rpc 至少传一个）
+ * @param {string} params.rpc 自定义RPC地址（可选）
+ * @param {string} params.project 项目标识（与 addresses 至少传一个）
+ * @param {Array} params.addresses 地址列表（可选）
+ * @param {Array} params.tokens ERC20代币合约地址列表（可选）
+ */
+export function getEvmBalances(params) {
+  return apiClient.post('/chain/evm/balances', params);
+}
+
+/**
+ * 批量查询ERC20代币信息（symbol、decimals，服务端缓存）
+ * @param {Object} params 查询参数
+ * @param {number} params.chainId 链ID（与 rpc 至少传一个，只传 rpc 时由节点确定）
+ * @param {string} params.rpc 自定义RPC地址（可选）
+ * @param {Array} params.tokens ERC20代币合约地址列表
+ */
+export function getEvmTokens(params) {
+  return apiClient.post('/chain/evm/tokens', params);
+}
+
+/**
+ * Solana批量查询余额（服务端 getMultipleAccounts 批量读取）
+ * @param {Object} params 查询参数
+ * @param {string} params.rpc 自定义RPC地址（可选）
+ * @param {string} params.project 项目标识（与 addresses 至少传一个）
+ * @param {Array} params.addresses 地址列表（可选）
+ * @param {Array} params.mints SPL代币mint地址列表（可选）
+ * @param {boolean} params.allTokens 扫描地址下全部代币账户（可选）
+ */
+export function getSolBalances(params) {
+  return apiClient.post('/chain/sol/balances', params);
+}
+
+/**
+ * EVM批量转账（服务端解密私钥、本地管理nonce、批量广播）
+ * @param {Object} params 转账参数
+ * @param {number} params.chainId 链ID（与 rpc 至少传一个）
+ * @param {string} params.rpc 自定义RPC地址（可选）
+ * @param {string} params.pwd 加密密码
+ * @param {Array} params.items 转账列表 [{ from, to, amount }]
+ * @param {string} params.token ERC20合约地址（可选，不传为原生币）
+ * @param {boolean} params.async 异步执行，返回 { jobId }（可选）
+ */
+export function evmTransferBatch(params) {
+  return apiClient.post('/chain/evm/transfer/batch', params);
+}
+
+export default {
+  getEvmBalances,
+  getEvmTokens,
+  getSolBalances,
+  evmTransferBatch
+};
@@ -22,6 +22,42 @@ export async function withdraw(params) {
   });
 }
 
+/**
+ * 批量提现（后端同一交易所共用客户端，按并发数和限速执行）
+ * @param {Object} params 提现参数
+ * @param {string} params.pwd 加密密码
+ * @param {Array} params.items 提现列表 [{ exchange, toAddress, network, coin, amount, interval }]
+ * @param {number} params.concurrency 每个交易所的并发数（可选）
+ * @param {number} params.interval 每笔完成后的等待秒数（可选）
+ * @param {boolean} params.async 是否异步执行（可选，返回 jobId）
+ */
+export function withdrawBatch(params) {
+  return apiClient.post('/exchange/withdraw/batch', params);
+}
+
+/**
+ * 批量查询提现手续费
+ * @param {Object} params 查询参数
+ * @param {string} params.exchange 交易所名称
+ * @param {string} params.pwd 加密密码
+ * @param {Array} params.pairs 查询列表 [{ coin, network }]
+ */
+export function getWithdrawFees(params) {
+  return apiClient.post('/exchange/withdraw/fees', params);
+}
+
+/**
+ * 多账户余额汇总
+ * @param {Object} params 查询参数
+ * @param {string} params.pwd 加密密码
+ * @param {Array} params.exchanges 交易所名称列表（可选，不传查询全部）
+ * @param {string} params.coin 代币符号（可选）
+ * @param {number} params.timeout 单账户超时秒数（可选）
+ */
+export function getExchangeBalances(params) {
+  return apiClient.post('/exchange/balances', params);
+}
+
 /**
  * 获取交易所名称列表
  */
@@ -73,6 +109,9 @@ export function getProjectAddresses() {
 
 export default {
   withdraw,
+  withdrawBatch,
+  getWithdrawFees,
+  getExchangeBalances,
   getExchangeNames,
   getExchangeOne,
   insertExchange,
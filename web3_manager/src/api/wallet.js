@@ -21,6 +21,8 @@ export function getProjectStats() {
  * @param {string} params.address 钱包地址（可选）
  * @param {string} params.project 项目标识（可选）
  * @param {string} params.pwd 密码（自动加密）
+ * @param {number} params.pageSize 每页数量（可选，传入后按游标分页返回 { list, nextCursor, total }）
+ * @param {string} params.cursor 分页游标（可选，取上一页返回的 nextCursor）
  */
 export function walletList(params) {
   return apiClient.post('/wallet/list', params);
@@ -98,6 +100,14 @@ export function oneMapping(sourceAddress) {
   });
 }
 
+/**
+ * 查询后台任务状态
+ * @param {string} jobId 任务id（async 模式下创建/导入接口返回）
+ */
+export function getJob(jobId) {
+  return apiClient.get(`/jobs/${jobId}`);
+}
+
 /**
  * 管理员查询钱包私钥
  * @param {string} address 钱包地址
@@ -109,6 +119,15 @@ export function adminGetWalletByAddress(address, pwd) {
   });
 }
 
+/**
+ * 管理员查询缓存统计
+ * 返回 { caches: [...], exchangeClients: {...}, asyncExchangeClients: {...} }，
+ * 早期版本 data 直接是缓存数组，现在数组在 data.caches 中
+ */
+export function adminGetCacheStats() {
+  return apiClient.get('/admin/cache/stats');
+}
+
 export default {
   getWalletProjects,
   walletList,
@@ -118,5 +137,7 @@ export default {
   batchImportMapping,
   batchQueryMapping,
   oneMapping,
-  adminGetWalletByAddress
+  getJob,
+  adminGetWalletByAddress,
+  adminGetCacheStats
 };
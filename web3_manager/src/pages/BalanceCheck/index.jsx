@@ -11,6 +11,7 @@ import {
 import { ethers } from 'ethers';
 import * as XLSX from 'xlsx';
 import { walletList, getWalletProjects } from '../../api/wallet';
+import { getEvmTokens } from '../../api/chain';
 import { handleApiError } from '../../api/errorHandler';
 import './index.css';
 
@@ -98,13 +99,14 @@ export default function BalanceCheck() {
 
     setLoading(true);
     try {
-      const provider = new ethers.JsonRpcProvider(rpcUrl);
-      const abi = ["function symbol() view returns (string)", "function decimals() view returns (uint8)"];
-      const contract = new ethers.Contract(tokenAddress, abi, provider);
-      const [symbol, decimals] = await Promise.all([
-        contract.symbol(),
-        contract.decimals()
-      ]);
+      const res = await getEvmTokens({
+        chainId: isCustomRpc ? undefined : network.chainId,
+        rpc: rpcUrl,
+        tokens: [tokenAddress]
+      });
+      const info = res.success ? res.data.tokens[0] : null;
+      if (!info || info.decimals === null) throw new Error(res.msg || res.error);
+      const { symbol, decimals } = info;
       setTokenSymbol(symbol);
       setTokenDecimals(Number(decimals));
       setMessage({ type: 'success', text: `代币信息获取成功: ${symbol} (精度: ${decimals})` });
@@ -18,6 +18,7 @@ import {
 import { ethers } from 'ethers';
 import * as XLSX from 'xlsx';
 import { walletList } from '../../api/wallet';
+import { getEvmTokens } from '../../api/chain';
 import { decryptPrivateKey } from '../../utils/crypto';
 import PasswordInput from '../../components/PasswordInput';
 import './index.css';
@@ -69,12 +70,15 @@ export default function Distribution() {
       if (rpcUrl) {
         const fetchTokenInfo = async (addr) => {
           try {
-            const provider = new ethers.JsonRpcProvider(rpcUrl);
-            const abi = ["function symbol() view returns (string)", "function decimals() view returns (uint8)"];
-            const contract = new ethers.Contract(addr, abi, provider);
-            const [symbol, decimals] = await Promise.all([contract.symbol(), contract.decimals()]);
-            setTokenSymbol(symbol);
-            setTokenDecimals(Number(decimals));
+            const res = await getEvmTokens({
+              chainId: isCustomRpc ? undefined : network.chainId,
+              rpc: rpcUrl,
+              tokens: [addr]
+            });
+            const info = res.success ? res.data.tokens[0] : null;
+            if (!info || info.decimals === null) throw new Error(res.msg || res.error);
+            setTokenSymbol(info.symbol);
+            setTokenDecimals(Number(info.decimals));
           } catch (e) { console.error(e); }
         };
         fetchTokenInfo(tokenAddress);
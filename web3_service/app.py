@@ -12,12 +12,20 @@ if sys.platform == 'win32':
     except:
         pass
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import service_wallet
 import service_exchange_withdraw
+import service_exchange_async
+import service_chain_evm
+import service_chain_sol
+import service_chain_transfer
+import service_job
+import utils_rpc
 import response_invoke
+import utils_db
 import utils_encrypt
+import json
 import logging
 from datetime import datetime
 from logging import StreamHandler
@@ -61,6 +69,10 @@ app.config['RESTFUL_JSON'] = {'ensure_ascii': False}
 
 CORS(app)
 
+# 交易所接口使用异步实现（ccxt.async_support + 单事件循环线程），默认使用同步实现
+EXCHANGE_ASYNC = os.getenv('EXCHANGE_ASYNC', 'false').lower() == 'true'
+exchange_service = service_exchange_async if EXCHANGE_ASYNC else service_exchange_withdraw
+
 # 请求处理前后添加编码设置
 @app.before_request
 def before_request():
@@ -110,6 +122,23 @@ def walletList():
     pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
     logger.info('[walletList] pwd decrypt success, len=%d', len(pwd_decrypted) if pwd_decrypted else 0)
 
+    # 流式模式：逐行输出NDJSON，内存占用与钱包数量无关
+    if data.get('stream') is True or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        logger.info('[walletList] stream mode')
+        wallets = service_wallet.walletListStream(address, project, pwd_decrypted)
+        lines = (json.dumps(wallet, ensure_ascii=False) + '\n' for wallet in wallets)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    # 分页模式：传入pageSize时按游标分页返回
+    if data.get('pageSize'):
+        try:
+            result = service_wallet.walletPage(address, project, pwd_decrypted, data.get('pageSize'), data.get('cursor'))
+        except ValueError as e:
+            logger.warning('[walletList] invalid page params: %s', e)
+            return jsonify(response_invoke.resp_invoke_fail(str(e)))
+        logger.info('[walletList] Return page of %d wallets, total=%d', len(result['list']), result['total'])
+        return jsonify(response_invoke.resp_invoke_ok(result))
+
     result = service_wallet.walletList(address, project, pwd_decrypted)
     logger.info('[walletList] Return %d wallets', len(result))
 
@@ -147,6 +176,14 @@ def insertWalletList():
     pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
     logger.info('[insertWalletList] pwd decrypt success')
 
+    # 异步模式：立即返回任务id，通过 /jobs/<job_id> 查询进度
+    if data.get('async') is True:
+        job_id = service_job.submitJob('wallet_insert', {
+            'walletList': wallet_list, 'project': project, 'remark': remark, 'pwd': pwd_decrypted
+        }, total=len(wallet_list))
+        logger.info('[insertWalletList] submit job=%s', job_id)
+        return response_invoke.resp_invoke_ok({'jobId': job_id})
+
     result = service_wallet.insertWalletList(wallet_list, project, remark, pwd_decrypted)
     logger.info('[insertWalletList] insert result=%s', result)
     return response_invoke.resp_invoke_ok(result)
@@ -161,12 +198,23 @@ def createWalletList():
     pwd = data.get('pwd')
     project = data.get('project')
     remark = data.get('remark')
-    logger.info('[createWalletList] type=%s, number=%d, project=%s, remark=%s, pwd_len=%d', wallet_type, wallet_num, project, remark, len(pwd) if pwd else 0)
+    workers = int(data['workers']) if data.get('workers') else None
+    hd = data.get('hd') is True
+    logger.info('[createWalletList] type=%s, number=%d, project=%s, remark=%s, workers=%s, hd=%s, pwd_len=%d', wallet_type, wallet_num, project, remark, workers, hd, len(pwd) if pwd else 0)
     
     pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
     logger.info('[createWalletList] pwd decrypt success')
 
-    result = service_wallet.createWalletList(wallet_type, wallet_num, project, remark, pwd_decrypted)
+    # 异步模式：立即返回任务id，通过 /jobs/<job_id> 查询进度
+    if data.get('async') is True:
+        job_id = service_job.submitJob('wallet_create', {
+            'type': wallet_type, 'number': wallet_num, 'project': project, 'remark': remark,
+            'pwd': pwd_decrypted, 'workers': workers, 'hd': hd
+        }, total=wallet_num)
+        logger.info('[createWalletList] submit job=%s', job_id)
+        return response_invoke.resp_invoke_ok({'jobId': job_id})
+
+    result = service_wallet.createWalletList(wallet_type, wallet_num, project, remark, pwd_decrypted, workers=workers, hd=hd)
     logger.info('[createWalletList] create result=%s', result)
     return response_invoke.resp_invoke_ok(result)
 
@@ -194,6 +242,22 @@ def walletQueryByAddress(address):
     return jsonify(resp)
 
 
+@app.route('/admin/cache/stats')
+def cacheStats():
+    logger.info('[cacheStats] Get cache statistics')
+    result = service_wallet.getCacheStats()
+    resp = response_invoke.resp_invoke_ok(result)
+    return jsonify(resp)
+
+
+@app.route('/admin/rpc/stats')
+def rpcStats():
+    logger.info('[rpcStats] Get rpc pool statistics')
+    result = utils_rpc.getRpcPoolStats()
+    resp = response_invoke.resp_invoke_ok(result)
+    return jsonify(resp)
+
+
 # <<<<================钱包相关======================
 
 # ================钱包映射相关======================>>>>
@@ -207,6 +271,14 @@ def batchImportWalletMapping():
     remark = data.get('remark', '')
     logger.info('[batchImportWalletMapping] mapping_count=%d, project=%s', len(mapping_list), project)
 
+    # 异步模式：立即返回任务id，通过 /jobs/<job_id> 查询进度
+    if data.get('async') is True:
+        job_id = service_job.submitJob('mapping_import', {
+            'mappingList': mapping_list, 'project': project, 'remark': remark
+        }, total=len(mapping_list))
+        logger.info('[batchImportWalletMapping] submit job=%s', job_id)
+        return response_invoke.resp_invoke_ok({'jobId': job_id})
+
     result = service_wallet.batchImportWalletMapping(mapping_list, project, remark)
     logger.info('[batchImportWalletMapping] Success import %d records', result['successCount'])
     return response_invoke.resp_invoke_ok(result)
@@ -237,6 +309,21 @@ def oneWalletMapping():
 
 # <<<<================钱包映射相关======================
 
+# ================后台任务相关======================>>>>
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def jobOne(job_id):
+    logger.info('[jobOne] Request start, job_id=%s', job_id)
+    result = service_job.getJob(job_id)
+    if not result:
+        logger.warning('[jobOne] Job not found: %s', job_id)
+        return response_invoke.resp_invoke_fail(f'任务不存在: {job_id}')
+    logger.info('[jobOne] status=%s, processed=%s/%s', result['status'], result['processed'], result['total'])
+    return response_invoke.resp_invoke_ok(result)
+
+
+# <<<<================后台任务相关======================
+
 # ================交易所信息相关======================>>>>
 
 @app.route('/exchange/names', methods=['GET'])
@@ -340,13 +427,43 @@ def exchangeWithdraw():
     pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
     logger.info('[exchangeWithdraw] pwd decrypt success')
 
-    result = service_exchange_withdraw.withdraw(exchange_name, pwd_decrypted, to_address, network, coin, amount)
+    result = exchange_service.withdraw(exchange_name, pwd_decrypted, to_address, network, coin, amount)
     logger.info('[exchangeWithdraw] withdraw result=%s', result)
 
     if result['success']:
         return response_invoke.resp_invoke_ok(result['data'])
     else:
-        return response_invoke.resp_invoke_fail(result['msg'])
+        # 结果未知（status=unknown）时同时返回提现信息，便于前端提示核实
+        return response_invoke.resp_invoke_fail(result['msg'], result.get('data'))
+
+
+@app.route('/exchange/withdraw/batch', methods=['POST'])
+def exchangeWithdrawBatch():
+    logger.info('[exchangeWithdrawBatch] Request start')
+    data = request.get_json(silent=True) or {}
+    pwd = data.get('pwd')
+    items = data.get('items', [])
+    concurrency = data.get('concurrency')
+    interval = data.get('interval')
+
+    logger.info('[exchangeWithdrawBatch] item_count=%d, concurrency=%s, interval=%s', len(items), concurrency, interval)
+
+    pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
+    logger.info('[exchangeWithdrawBatch] pwd decrypt success')
+
+    # 异步模式：立即返回任务id，通过 /jobs/<job_id> 查询进度和每笔结果
+    if data.get('async') is True:
+        job_id = service_job.submitJob('exchange_withdraw_batch', {
+            'pwd': pwd_decrypted, 'items': items, 'concurrency': concurrency, 'interval': interval
+        }, total=len(items))
+        logger.info('[exchangeWithdrawBatch] submit job=%s', job_id)
+        return response_invoke.resp_invoke_ok({'jobId': job_id})
+
+    result = service_exchange_withdraw.withdraw_batch(pwd_decrypted, items, concurrency, interval)
+    unknown = sum(1 for r in result if service_exchange_withdraw.is_withdraw_unknown(r))
+    logger.info('[exchangeWithdrawBatch] success=%d, failed=%d, unknown=%d',
+                sum(1 for r in result if r['success']), sum(1 for r in result if not r['success']) - unknown, unknown)
+    return response_invoke.resp_invoke_ok(result)
 
 
 @app.route('/exchange/withdraw/fee', methods=['POST'])
@@ -363,7 +480,7 @@ def getWithdrawFee():
     pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
     logger.info('[getWithdrawFee] pwd decrypt success')
 
-    result = service_exchange_withdraw.get_withdraw_fee(exchange_name, pwd_decrypted, coin, network)
+    result = exchange_service.get_withdraw_fee(exchange_name, pwd_decrypted, coin, network)
     logger.info('[getWithdrawFee] result=%s', result)
 
     if result['success']:
@@ -372,6 +489,27 @@ def getWithdrawFee():
         return response_invoke.resp_invoke_fail(result['msg'])
 
 
+@app.route('/exchange/withdraw/fees', methods=['POST'])
+def getWithdrawFees():
+    logger.info('[getWithdrawFees] Request start')
+    data = request.get_json(silent=True) or {}
+    exchange_name = data.get('exchange')
+    pwd = data.get('pwd')
+    pairs = data.get('pairs', [])
+
+    logger.info('[getWithdrawFees] exchange=%s, pair_count=%d', exchange_name, len(pairs))
+
+    pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
+    logger.info('[getWithdrawFees] pwd decrypt success')
+
+    result = exchange_service.get_withdraw_fees(exchange_name, pwd_decrypted, pairs)
+
+    if result['success']:
+        return response_invoke.resp_invoke_ok(result['data'])
+    else:
+        return response_invoke.resp_invoke_fail(result['msg'])
+
+
 @app.route('/exchange/balance', methods=['POST'])
 def getExchangeBalance():
     logger.info('[getExchangeBalance] Request start')
@@ -385,7 +523,7 @@ def getExchangeBalance():
     pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
     logger.info('[getExchangeBalance] pwd decrypt success')
 
-    result = service_exchange_withdraw.get_balance(exchange_name, pwd_decrypted, coin)
+    result = exchange_service.get_balance(exchange_name, pwd_decrypted, coin)
     logger.info('[getExchangeBalance] result=%s', result)
 
     if result['success']:
@@ -394,8 +532,162 @@ def getExchangeBalance():
         return response_invoke.resp_invoke_fail(result['msg'])
 
 
+@app.route('/exchange/balances', methods=['POST'])
+def getExchangeBalances():
+    logger.info('[getExchangeBalances] Request start')
+    data = request.get_json(silent=True) or {}
+    exchanges = data.get('exchanges') or []
+    pwd = data.get('pwd')
+    coin = data.get('coin')
+    timeout = data.get('timeout')
+
+    logger.info('[getExchangeBalances] exchange_count=%d, coin=%s, timeout=%s', len(exchanges), coin, timeout)
+
+    pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
+    logger.info('[getExchangeBalances] pwd decrypt success')
+
+    result = exchange_service.get_balances(pwd_decrypted, exchanges, coin, timeout)
+
+    if result['success']:
+        logger.info('[getExchangeBalances] coin_count=%d, account_count=%d',
+                    len(result['data']['coins']), len(result['data']['accounts']))
+        return response_invoke.resp_invoke_ok(result['data'])
+    else:
+        return response_invoke.resp_invoke_fail(result['msg'])
+
+
 # <<<<================交易所提现相关======================
 
+# ================链上查询相关======================>>>>
+
+@app.route('/chain/evm/balances', methods=['POST'])
+def chainEvmBalances():
+    logger.info('[chainEvmBalances] Request start')
+    data = request.get_json(silent=True) or {}
+    chain_id = data.get('chainId')
+    rpc = data.get('rpc')
+    project = data.get('project')
+    addresses = data.get('addresses') or []
+    tokens = data.get('tokens') or []
+
+    logger.info('[chainEvmBalances] chainId=%s, project=%s, address_count=%d, token_count=%d, custom_rpc=%s',
+                chain_id, project, len(addresses), len(tokens), bool(rpc))
+
+    if chain_id is None and not rpc:
+        return response_invoke.resp_invoke_fail('chainId和rpc不能同时为空')
+    if not project and not addresses:
+        return response_invoke.resp_invoke_fail('project和addresses不能同时为空')
+
+    result = service_chain_evm.getBalances(chain_id, addresses, project, tokens, rpc)
+
+    if result['success']:
+        logger.info('[chainEvmBalances] count=%d, failed=%d, elapsed=%ss',
+                    len(result['data']['list']), result['data']['failed'], result['data']['elapsed'])
+        return response_invoke.resp_invoke_ok(result['data'])
+    else:
+        return response_invoke.resp_invoke_fail(result['msg'])
+
+
+@app.route('/chain/evm/tokens', methods=['POST'])
+def chainEvmTokens():
+    logger.info('[chainEvmTokens] Request start')
+    data = request.get_json(silent=True) or {}
+    chain_id = data.get('chainId')
+    rpc = data.get('rpc')
+    tokens = data.get('tokens') or []
+
+    logger.info('[chainEvmTokens] chainId=%s, token_count=%d, custom_rpc=%s', chain_id, len(tokens), bool(rpc))
+
+    if chain_id is None and not rpc:
+        return response_invoke.resp_invoke_fail('chainId和rpc不能同时为空')
+
+    result = service_chain_evm.getTokens(chain_id, tokens, rpc)
+
+    if result['success']:
+        return response_invoke.resp_invoke_ok(result['data'])
+    else:
+        return response_invoke.resp_invoke_fail(result['msg'])
+
+
+@app.route('/chain/sol/balances', methods=['POST'])
+def chainSolBalances():
+    logger.info('[chainSolBalances] Request start')
+    data = request.get_json(silent=True) or {}
+    rpc = data.get('rpc')
+    project = data.get('project')
+    addresses = data.get('addresses') or []
+    mints = data.get('mints') or []
+    all_tokens = bool(data.get('allTokens', False))
+
+    logger.info('[chainSolBalances] project=%s, address_count=%d, mint_count=%d, allTokens=%s, custom_rpc=%s',
+                project, len(addresses), len(mints), all_tokens, bool(rpc))
+
+    if not project and not addresses:
+        return response_invoke.resp_invoke_fail('project和addresses不能同时为空')
+
+    result = service_chain_sol.getBalances(addresses, project, mints, all_tokens, rpc)
+
+    if result['success']:
+        logger.info('[chainSolBalances] count=%d, failed=%d, elapsed=%ss',
+                    len(result['data']['list']), result['data']['failed'], result['data']['elapsed'])
+        return response_invoke.resp_invoke_ok(result['data'])
+    else:
+        return response_invoke.resp_invoke_fail(result['msg'])
+
+
+# <<<<================链上查询相关======================
+
+# ================链上转账相关======================>>>>
+
+@app.route('/chain/evm/transfer/batch', methods=['POST'])
+def chainEvmTransferBatch():
+    logger.info('[chainEvmTransferBatch] Request start')
+    data = request.get_json(silent=True) or {}
+    chain_id = data.get('chainId')
+    rpc = data.get('rpc')
+    pwd = data.get('pwd')
+    items = data.get('items') or []
+    token = data.get('token')
+    params = {
+        'chainId': chain_id,
+        'items': items,
+        'token': token,
+        'decimals': data.get('decimals'),
+        'rpcUrl': rpc,
+        'project': data.get('project'),
+        'concurrency': data.get('concurrency'),
+        'gasPriceMultiplier': data.get('gasPriceMultiplier'),
+        'gasLimit': data.get('gasLimit'),
+        'waitReceipts': data.get('waitReceipts', True) is not False
+    }
+
+    logger.info('[chainEvmTransferBatch] chainId=%s, token=%s, item_count=%d, custom_rpc=%s',
+                chain_id, token, len(items), bool(rpc))
+
+    if chain_id is None and not rpc:
+        return response_invoke.resp_invoke_fail('chainId和rpc不能同时为空')
+
+    pwd_decrypted = utils_encrypt.decrypt_pwd(pwd)
+    logger.info('[chainEvmTransferBatch] pwd decrypt success')
+    params['pwd'] = pwd_decrypted
+
+    # 异步模式：立即返回任务id，通过 /jobs/<job_id> 查询进度和每笔结果
+    if data.get('async') is True:
+        job_id = service_job.submitJob('evm_transfer_batch', params, total=len(items))
+        logger.info('[chainEvmTransferBatch] submit job=%s', job_id)
+        return response_invoke.resp_invoke_ok({'jobId': job_id})
+
+    result = service_chain_transfer.batchTransfer(**params)
+
+    if result['success']:
+        logger.info('[chainEvmTransferBatch] summary=%s', result['data']['summary'])
+        return response_invoke.resp_invoke_ok(result['data'])
+    else:
+        return response_invoke.resp_invoke_fail(result['msg'])
+
+
+# <<<<================链上转账相关======================
+
 
 # <<<<================钱包映射相关======================
 
@@ -405,5 +697,9 @@ def hello_world():
 
 
 if __name__ == '__main__':
+    # 推荐使用 python main.py 启动：直接运行本文件时，钱包生成进程池的每个子进程都会重新导入整个应用
+    logger.warning('建议使用 python main.py 启动服务')
     logger.info('Start Web3 Wallet Service')
+    utils_db.initDb()
+    service_job.recoverJobs()
     app.run(host='0.0.0.0', port=30000)
@@ -2,7 +2,7 @@ import json
 import os
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, TIMESTAMP, Float
+from sqlalchemy import create_engine, Column, Integer, String, TIMESTAMP, Float, Index, Text
 from sqlalchemy.orm import Query
 
 MYSQL_HOST = os.getenv('MYSQL_HOST', '127.0.0.1')
@@ -12,11 +12,31 @@ MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '1q2w3e4r5t')
 MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'lumao')
 
 DB_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+
+# 连接池配置（进程内共享一个engine）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
 Base = declarative_base()
 
 
 class Wallet(Base):
+    '''
+    钱包
+    idx_address: 按地址查询
+    uk_project_address: 项目内地址唯一，用于去重
+    idx_project_index: 按项目查询、取最大index、分页
+    derivation_path: HD批量模式的派生路径（如 m/44'/60'/0'/0/5），其他钱包为NULL
+    '''
     __tablename__ = 'wallet'
+    __table_args__ = (
+        Index('idx_address', 'address'),
+        Index('uk_project_address', 'project', 'address', unique=True),
+        Index('idx_project_index', 'project', 'index'),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     index = Column(Integer)
     address = Column(String(50))
@@ -25,6 +45,21 @@ class Wallet(Base):
     phrase = Column(String(256))
     project = Column(String(50))
     remark = Column(String(50))
+    derivation_path = Column(String(64))
+
+
+class ProjectStats(Base):
+    '''
+    项目统计（随钱包插入在同一事务内维护）
+    wallet_count: 项目钱包数量
+    max_index: 项目最大index
+    '''
+    __tablename__ = 'project_stats'
+
+    project = Column(String(50), primary_key=True)
+    wallet_count = Column(Integer, nullable=False, default=0)
+    max_index = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP)
 
 
 class ExchangeInfo(Base):
@@ -56,6 +91,48 @@ class WalletMapping(Base):
     updated_at = Column(TIMESTAMP)
 
 
+class Job(Base):
+    '''
+    后台任务
+    job_type: 任务类型（wallet_create, wallet_insert, mapping_import, exchange_withdraw_batch, evm_transfer_batch）
+    status: pending, running, success, failed
+    progress: 进度详情（JSON）
+    result: 执行结果（JSON）
+    '''
+    __tablename__ = 'job'
+
+    id = Column(String(32), primary_key=True)
+    job_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, index=True)
+    total = Column(Integer)
+    processed = Column(Integer, default=0)
+    progress = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP)
+    updated_at = Column(TIMESTAMP)
+
+
+class TokenMetadata(Base):
+    '''
+    代币元数据（symbol、decimals 链上不可变，读取一次后持久化）
+    chain_id: 链ID
+    address: 代币合约地址（小写）
+    uk_chain_address: 同一链上代币地址唯一
+    '''
+    __tablename__ = 'token_metadata'
+    __table_args__ = (
+        Index('uk_chain_address', 'chain_id', 'address', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chain_id = Column(Integer, nullable=False)
+    address = Column(String(50), nullable=False)
+    symbol = Column(String(64))
+    decimals = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP)
+
+
 class AlchemyJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         # 判断是否是Query
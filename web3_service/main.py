@@ -0,0 +1,21 @@
+# coding:utf-8
+'''
+Description: 服务启动入口（python main.py）
+钱包生成进程池的子进程（forkserver/spawn 启动）会以 __mp_main__ 重新导入启动脚本，
+本脚本在模块级不做任何事，子进程不会创建 Flask 应用、数据库连接池和缓存
+'''
+
+
+def main():
+    import app
+    import service_job
+    import utils_db
+
+    app.logger.info('Start Web3 Wallet Service')
+    utils_db.initDb()
+    service_job.recoverJobs()
+    app.app.run(host='0.0.0.0', port=30000)
+
+
+if __name__ == '__main__':
+    main()
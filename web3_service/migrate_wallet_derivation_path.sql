@@ -0,0 +1,5 @@
+-- 为已有的 wallet 表补充 HD 派生路径列
+-- 新建库直接使用 sql.sql 或由服务启动时自动建表，无需执行此脚本
+
+ALTER TABLE `wallet`
+    ADD COLUMN `derivation_path` varchar(64) DEFAULT NULL COMMENT 'HD派生路径';
@@ -0,0 +1,40 @@
+-- 为已有的 wallet 表补充索引
+-- 新建库直接使用 sql.sql 或由服务启动时自动建表，无需执行此脚本
+--
+-- ！！！警告！！！
+-- 唯一索引 uk_project_address 要求同一项目下地址不重复。重复行中保存着加密私钥/助记词，
+-- 本脚本不会自动删除任何钱包：先查看重复行并备份到 wallet_duplicates_backup，
+-- 人工核对备份无误后，再手动执行第3步的删除语句（默认已注释），最后执行第4步添加索引。
+-- 存在重复行时第4步会因唯一索引冲突而失败，不会影响数据。
+
+-- 1. 查看同一项目下的重复地址（保留id最小的一条，以下为将被移除的行）
+SELECT w1.`id`, w1.`index`, w1.`address`, w1.`project`, w1.`remark`, w2.`id` AS keep_id
+FROM `wallet` w1
+         JOIN `wallet` w2
+              ON w1.`project` = w2.`project`
+                  AND w1.`address` = w2.`address`
+                  AND w1.`id` > w2.`id`;
+
+-- 2. 备份重复行（完整保留私钥、助记词等字段）
+CREATE TABLE IF NOT EXISTS `wallet_duplicates_backup` LIKE `wallet`;
+
+INSERT IGNORE INTO `wallet_duplicates_backup`
+SELECT DISTINCT w1.*
+FROM `wallet` w1
+         JOIN `wallet` w2
+              ON w1.`project` = w2.`project`
+                  AND w1.`address` = w2.`address`
+                  AND w1.`id` > w2.`id`;
+
+SELECT COUNT(*) AS backup_count FROM `wallet_duplicates_backup`;
+
+-- 3. 核对备份后手动执行：只删除已备份的重复行
+-- DELETE w
+-- FROM `wallet` w
+--          JOIN `wallet_duplicates_backup` b ON b.`id` = w.`id`;
+
+-- 4. 添加索引
+ALTER TABLE `wallet`
+    ADD KEY `idx_address` (`address`),
+    ADD UNIQUE KEY `uk_project_address` (`project`, `address`),
+    ADD KEY `idx_project_index` (`project`, `index`);
@@ -0,0 +1,11 @@
+# coding:utf-8
+'''
+Description: 根据 wallet 表重建 project_stats
+Usage: python rebuild_project_stats.py
+'''
+import utils_db
+
+if __name__ == '__main__':
+    utils_db.initDb()
+    count = utils_db.rebuildProjectStats()
+    print(f'project_stats 重建完成: {count} 个项目')
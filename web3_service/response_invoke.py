@@ -17,10 +17,10 @@ def resp_invoke_ok(data):
     return resp
 
 
-def resp_invoke_fail(msg):
+def resp_invoke_fail(msg, data=None):
     resp = {
         "code": -1,
-        "data": None,
+        "data": data,
         "msg": msg
     }
     return resp
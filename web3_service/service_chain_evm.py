@@ -0,0 +1,429 @@
+# coding:utf-8
+'''
+Description: EVM链上余额批量查询
+优先使用 Multicall3 aggregate3 把原生币/ERC20余额打包到少量 eth_call 中，
+节点未部署 Multicall3 时（如本地 anvil）退回 JSON-RPC 批量请求
+'''
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from decimal import Decimal
+
+from eth_abi import decode, encode
+
+import utils_cache
+import utils_db
+import utils_rpc
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# Multicall3 合约地址（主流链相同）
+MULTICALL3_ADDRESS = os.getenv('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11')
+# 单次 aggregate3 打包的调用数
+MULTICALL_CHUNK_SIZE = int(os.getenv('MULTICALL_CHUNK_SIZE', '300'))
+# 单个HTTP请求中打包的 aggregate3 eth_call 数
+MULTICALL_PER_REQUEST = int(os.getenv('MULTICALL_PER_REQUEST', '5'))
+# 并发HTTP请求数
+EVM_SCAN_CONCURRENCY = int(os.getenv('EVM_SCAN_CONCURRENCY', '4'))
+# 单次最多查询的地址数
+EVM_SCAN_MAX_ADDRESSES = int(os.getenv('EVM_SCAN_MAX_ADDRESSES', '20000'))
+# 代币元数据进程内缓存条数
+TOKEN_METADATA_CACHE_SIZE = int(os.getenv('TOKEN_METADATA_CACHE_SIZE', '10000'))
+# 单次最多查询的代币数
+TOKEN_METADATA_MAX_TOKENS = int(os.getenv('TOKEN_METADATA_MAX_TOKENS', '500'))
+
+# 函数选择器
+SELECTOR_AGGREGATE3 = bytes.fromhex('82ad56cb')      # aggregate3((address,bool,bytes)[])
+SELECTOR_GET_ETH_BALANCE = bytes.fromhex('4d2301cc')  # getEthBalance(address)
+SELECTOR_BALANCE_OF = bytes.fromhex('70a08231')       # balanceOf(address)
+SELECTOR_DECIMALS = bytes.fromhex('313ce567')         # decimals()
+SELECTOR_SYMBOL = bytes.fromhex('95d89b41')           # symbol()
+
+ADDRESS_PATTERN = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+# 检查 Multicall3 时的锁，结果记录在节点池的 capabilities 中
+_multicallLock = threading.Lock()
+
+# 代币元数据缓存，key 为 (chainId, 小写代币地址)，数据库表 token_metadata 持久化
+_tokenCache = utils_cache.LRUCache('tokenMetadata', TOKEN_METADATA_CACHE_SIZE)
+
+
+def isEvmAddress(address):
+    return bool(address) and bool(ADDRESS_PATTERN.match(address))
+
+
+def encodeCall(selector, types=None, args=None):
+    '''
+    编码合约调用数据
+    :param selector: 4字节函数选择器
+    :param types: 参数类型列表
+    :param args: 参数值列表
+    :return: bytes
+    '''
+    if not types:
+        return selector
+    return selector + encode(types, args)
+
+
+def decodeUint(data):
+    if not data or len(data) < 32:
+        raise ValueError('返回数据为空')
+    return decode(['uint256'], data)[0]
+
+
+def decodeSymbol(data):
+    '''
+    解码 symbol()，兼容返回 bytes32 的旧合约（如 MKR）
+    '''
+    if len(data) == 32:
+        return data.rstrip(b'\x00').decode('utf-8', errors='ignore')
+    return decode(['string'], data)[0]
+
+
+def formatUnits(raw, decimals):
+    '''
+    按精度格式化数量
+    :param raw: 最小单位整数
+    :param decimals: 精度
+    :return: 字符串，如 "1.5"
+    '''
+    value = Decimal(raw).scaleb(-int(decimals))
+    text = format(value.normalize(), 'f')
+    return text
+
+
+def hasMulticall3(client):
+    '''
+    检查节点是否部署了 Multicall3（结果按节点池缓存）
+    '''
+    with _multicallLock:
+        if 'multicall3' in client.capabilities:
+            return client.capabilities['multicall3']
+    try:
+        code = client.call('eth_getCode', [MULTICALL3_ADDRESS, 'latest'])
+        supported = bool(code) and code not in ('0x', '0x0')
+    except Exception as e:
+        logger.warning(f'[hasMulticall3] 检查 Multicall3 失败: {e}')
+        return False
+    with _multicallLock:
+        client.capabilities['multicall3'] = supported
+    logger.info(f'[hasMulticall3] {client.name} Multicall3={supported}')
+    return supported
+
+
+def executeCalls(client, calls):
+    '''
+    批量执行合约只读调用
+    :param client: utils_rpc.RpcPool
+    :param calls: [(target, callData), ...]，target 为 None 时表示查询 callData 中地址的原生币余额
+    :return: [(是否成功, 返回数据bytes 或 错误信息), ...]，与 calls 顺序一致
+    '''
+    if not calls:
+        return []
+
+    if hasMulticall3(client):
+        # 原生币余额通过 Multicall3.getEthBalance 读取
+        subCalls = [((target or MULTICALL3_ADDRESS).lower(), True, data) for (target, data) in calls]
+        chunks = [subCalls[i:i + MULTICALL_CHUNK_SIZE] for i in range(0, len(subCalls), MULTICALL_CHUNK_SIZE)]
+        requests = [('eth_call', [{
+            'to': MULTICALL3_ADDRESS,
+            'data': '0x' + encodeCall(SELECTOR_AGGREGATE3, ['(address,bool,bytes)[]'], [chunk]).hex()
+        }, 'latest']) for chunk in chunks]
+        responses = utils_rpc.runBatches(client, requests, MULTICALL_PER_REQUEST, EVM_SCAN_CONCURRENCY)
+
+        results = []
+        for (chunk, response) in zip(chunks, responses):
+            if isinstance(response, Exception):
+                results.extend([(False, str(response))] * len(chunk))
+                continue
+            try:
+                for (success, data) in decode(['(bool,bytes)[]'], bytes.fromhex(response[2:]))[0]:
+                    results.append((success, data if success else '调用失败'))
+            except Exception as e:
+                results.extend([(False, f'解码失败: {e}')] * len(chunk))
+        return results
+
+    # 无 Multicall3：每个调用作为一条 JSON-RPC 请求批量发送
+    requests = []
+    for (target, data) in calls:
+        if target is None:
+            address = '0x' + data[-20:].hex()
+            requests.append(('eth_getBalance', [address, 'latest']))
+        else:
+            requests.append(('eth_call', [{'to': target, 'data': '0x' + data.hex()}, 'latest']))
+    responses = utils_rpc.runBatches(client, requests, utils_rpc.RPC_BATCH_SIZE, EVM_SCAN_CONCURRENCY)
+
+    results = []
+    for ((target, _), response) in zip(calls, responses):
+        if isinstance(response, Exception):
+            results.append((False, str(response)))
+            continue
+        try:
+            if target is None:
+                # eth_getBalance 返回十六进制数量，转为与 getEthBalance 一致的32字节
+                results.append((True, int(response, 16).to_bytes(32, 'big')))
+            else:
+                results.append((True, bytes.fromhex(response[2:])))
+        except Exception as e:
+            results.append((False, f'解码失败: {e}'))
+    return results
+
+
+def fetchTokenMetadata(client, tokens):
+    '''
+    批量读取ERC20代币的 symbol 和 decimals
+    :param client: utils_rpc.RpcPool
+    :param tokens: 代币地址列表
+    :return: {代币地址: {"symbol", "decimals"}}，读取失败的代币 decimals 为 None
+    '''
+    calls = []
+    for token in tokens:
+        calls.append((token, SELECTOR_SYMBOL))
+        calls.append((token, SELECTOR_DECIMALS))
+    results = executeCalls(client, calls)
+
+    metadata = {}
+    for (i, token) in enumerate(tokens):
+        symbolOk, symbolData = results[i * 2]
+        decimalsOk, decimalsData = results[i * 2 + 1]
+        try:
+            symbol = decodeSymbol(symbolData) if symbolOk else None
+        except Exception:
+            symbol = None
+        try:
+            decimals = decodeUint(decimalsData) if decimalsOk else None
+        except Exception:
+            decimals = None
+        metadata[token] = {'symbol': symbol, 'decimals': decimals}
+    return metadata
+
+
+def resolveChainId(client, chainId=None):
+    '''
+    确定代币元数据缓存使用的链ID：按链配置的节点池使用其所属链；
+    自定义节点每次读取 eth_chainId，不信任调用方传入的 chainId，避免把其他链的元数据写入缓存
+    :param client: utils_rpc.RpcPool
+    :param chainId: 调用方传入的链ID（可选），与自定义节点不一致时抛出 ValueError
+    :return: 整数链ID，无法确定时返回None（不使用缓存）
+    '''
+    if client.chainId is not None:
+        try:
+            return int(client.chainId)
+        except (TypeError, ValueError):
+            return None
+    try:
+        nodeChainId = int(client.call('eth_chainId', []), 16)
+    except Exception as e:
+        logger.warning(f'[resolveChainId] 读取链ID失败: {e}')
+        return None
+    if chainId is not None and str(chainId) != str(nodeChainId):
+        raise ValueError(f'节点链ID {nodeChainId} 与 chainId {chainId} 不一致')
+    return nodeChainId
+
+
+def getTokenMetadata(client, chainId, tokens):
+    '''
+    读取ERC20代币的 symbol 和 decimals，依次查进程内LRU缓存、token_metadata 表，
+    仍未命中的代币通过 fetchTokenMetadata 打包读取后回写（读取失败的不缓存）
+    :param client: utils_rpc.RpcPool
+    :param chainId: resolveChainId 返回的链ID，为None时不使用缓存
+    :param tokens: 代币地址列表
+    :return: {代币地址: {"symbol", "decimals"}}，读取失败的代币 decimals 为 None
+    '''
+    tokens = list(dict.fromkeys(tokens or []))
+    if not tokens:
+        return {}
+    if chainId is None:
+        return fetchTokenMetadata(client, tokens)
+
+    metadata = {}
+    misses = []
+    for token in tokens:
+        hit, value = _tokenCache.get((chainId, token.lower()))
+        if hit:
+            metadata[token] = value
+        else:
+            misses.append(token)
+    if not misses:
+        return metadata
+
+    # 数据库不可用时直接读链，不影响查询
+    try:
+        stored = utils_db.queryTokenMetadata(chainId, list({token.lower() for token in misses}))
+    except Exception as e:
+        logger.warning(f'[getTokenMetadata] 读取代币元数据表失败: {e}')
+        stored = {}
+    pending = []
+    for token in misses:
+        value = stored.get(token.lower())
+        if value is None:
+            pending.append(token)
+            continue
+        _tokenCache.set((chainId, token.lower()), value)
+        metadata[token] = value
+
+    if pending:
+        fetched = fetchTokenMetadata(client, pending)
+        loaded = {}
+        for token in pending:
+            value = fetched[token]
+            metadata[token] = value
+            if value['decimals'] is not None:
+                _tokenCache.set((chainId, token.lower()), value)
+                loaded[token.lower()] = value
+        try:
+            utils_db.batchInsertTokenMetadata(chainId, loaded)
+        except Exception as e:
+            logger.warning(f'[getTokenMetadata] 保存代币元数据失败: {e}')
+        logger.info(f'[getTokenMetadata] chainId={chainId}, 缓存命中={len(tokens) - len(misses)}, '
+                    f'数据库命中={len(misses) - len(pending)}, 链上读取={len(pending)}, 失败={len(pending) - len(loaded)}')
+    return metadata
+
+
+def getTokenCacheStats():
+    '''
+    获取代币元数据缓存统计
+    '''
+    return _tokenCache.stats()
+
+
+def getTokens(chainId, tokens, rpcUrl=None):
+    '''
+    查询ERC20代币元数据
+    :param chainId: 链ID
+    :param tokens: 代币地址列表
+    :param rpcUrl: 自定义RPC地址（可选，默认按 chainId 取配置的节点）
+    :return: {'success', 'msg', 'data'}
+    '''
+    tokens = list(dict.fromkeys(tokens or []))
+    invalidTokens = [token for token in tokens if not isEvmAddress(token)]
+    if invalidTokens:
+        return {'success': False, 'msg': f'代币地址格式错误: {invalidTokens[0]}', 'data': None}
+    if not tokens:
+        return {'success': False, 'msg': '代币地址不能为空', 'data': None}
+    if len(tokens) > TOKEN_METADATA_MAX_TOKENS:
+        return {'success': False, 'msg': f'单次最多查询 {TOKEN_METADATA_MAX_TOKENS} 个代币', 'data': None}
+
+    try:
+        client = utils_rpc.getRpcClient(chainId, rpcUrl)
+    except ValueError as e:
+        return {'success': False, 'msg': str(e), 'data': None}
+
+    try:
+        chainId = resolveChainId(client, chainId)
+    except ValueError as e:
+        return {'success': False, 'msg': str(e), 'data': None}
+
+    try:
+        metadata = getTokenMetadata(client, chainId, tokens)
+    except Exception as e:
+        logger.error(f'[getTokens] 查询失败: {e}')
+        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+    return {
+        'success': True,
+        'msg': 'ok',
+        'data': {
+            'chainId': chainId,
+            'tokens': [{'token': token, **metadata[token]} for token in tokens]
+        }
+    }
+
+
+def getBalances(chainId, addresses=None, project=None, tokens=None, rpcUrl=None):
+    '''
+    批量查询EVM地址的原生币和ERC20余额
+    :param chainId: 链ID
+    :param addresses: 地址列表（与 project 二选一）
+    :param project: 项目名称，查询该项目下全部钱包
+    :param tokens: ERC20代币地址列表（可选）
+    :param rpcUrl: 自定义RPC地址（可选，默认按 chainId 取配置的节点）
+    :return: {'success', 'msg', 'data'}
+    '''
+    if not addresses and project:
+        addresses = utils_db.queryProjectAddresses(project)
+    addresses = list(dict.fromkeys(addresses or []))
+    tokens = list(dict.fromkeys(tokens or []))
+
+    invalid = [address for address in addresses if not isEvmAddress(address)]
+    addresses = [address for address in addresses if isEvmAddress(address)]
+    invalidTokens = [token for token in tokens if not isEvmAddress(token)]
+    if invalidTokens:
+        return {'success': False, 'msg': f'代币地址格式错误: {invalidTokens[0]}', 'data': None}
+    if not addresses:
+        return {'success': False, 'msg': '没有可查询的EVM地址', 'data': None}
+    if len(addresses) > EVM_SCAN_MAX_ADDRESSES:
+        return {'success': False, 'msg': f'单次最多查询 {EVM_SCAN_MAX_ADDRESSES} 个地址', 'data': None}
+
+    try:
+        client = utils_rpc.getRpcClient(chainId, rpcUrl)
+        chainId = resolveChainId(client, chainId)
+    except ValueError as e:
+        return {'success': False, 'msg': str(e), 'data': None}
+
+    logger.info(f'[getBalances] 查询余额: chainId={chainId}, 地址数={len(addresses)}, 代币数={len(tokens)}, '
+                f'忽略无效地址={len(invalid)}')
+    started = time.monotonic()
+
+    try:
+        tokenMetadata = getTokenMetadata(client, chainId, tokens) if tokens else {}
+
+        # 每个地址：原生币余额 + 每个代币的 balanceOf
+        calls = []
+        for address in addresses:
+            owner = address.lower()
+            calls.append((None, encodeCall(SELECTOR_GET_ETH_BALANCE, ['address'], [owner])))
+            for token in tokens:
+                calls.append((token, encodeCall(SELECTOR_BALANCE_OF, ['address'], [owner])))
+        results = executeCalls(client, calls)
+    except Exception as e:
+        logger.error(f'[getBalances] 查询失败: {e}')
+        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+
+    def toBalance(result, decimals):
+        ok, data = result
+        if not ok:
+            return {'raw': None, 'balance': None, 'error': data}
+        try:
+            raw = decodeUint(data)
+        except Exception as e:
+            return {'raw': None, 'balance': None, 'error': f'解码失败: {e}'}
+        return {'raw': str(raw), 'balance': formatUnits(raw, decimals) if decimals is not None else None}
+
+    step = 1 + len(tokens)
+    items = []
+    failed = 0
+    for (i, address) in enumerate(addresses):
+        row = results[i * step:(i + 1) * step]
+        item = {'address': address, 'native': toBalance(row[0], 18), 'tokens': []}
+        for (token, result) in zip(tokens, row[1:]):
+            item['tokens'].append({'token': token, **toBalance(result, tokenMetadata[token]['decimals'])})
+        if any(balance.get('error') for balance in [item['native']] + item['tokens']):
+            failed += 1
+        items.append(item)
+
+    elapsed = round(time.monotonic() - started, 3)
+    logger.info(f'[getBalances] 查询完成: 地址数={len(items)}, 部分失败={failed}, 耗时={elapsed}s')
+    return {
+        'success': True,
+        'msg': 'ok',
+        'data': {
+            'chainId': chainId,
+            'tokens': [{'token': token, **tokenMetadata[token]} for token in tokens],
+            'list': items,
+            'invalid': invalid,
+            'failed': failed,
+            'elapsed': elapsed
+        }
+    }
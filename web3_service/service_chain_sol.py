@@ -0,0 +1,294 @@
+# coding:utf-8
+'''
+Description: Solana链上余额批量查询
+SOL余额通过 getMultipleAccounts（每次100个地址）读取；
+SPL代币余额按 owner+mint 推导关联代币账户（ATA）后同样用 getMultipleAccounts 批量读取，
+或通过 getTokenAccountsByOwner 扫描地址下全部代币账户
+'''
+
+import logging
+import os
+import sys
+import time
+from decimal import Decimal
+
+from solders.pubkey import Pubkey
+
+import utils_db
+import utils_rpc
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# getMultipleAccounts 单次最多100个地址（节点限制）
+SOL_ACCOUNTS_PER_CALL = min(100, int(os.getenv('SOL_ACCOUNTS_PER_CALL', '100')))
+# 单个HTTP请求中打包的RPC调用数
+SOL_CALLS_PER_REQUEST = int(os.getenv('SOL_CALLS_PER_REQUEST', '5'))
+# 并发HTTP请求数
+SOL_SCAN_CONCURRENCY = int(os.getenv('SOL_SCAN_CONCURRENCY', '4'))
+# 单次最多查询的地址数
+SOL_SCAN_MAX_ADDRESSES = int(os.getenv('SOL_SCAN_MAX_ADDRESSES', '20000'))
+
+LAMPORTS_DECIMALS = 9
+TOKEN_PROGRAM_ID = Pubkey.from_string('TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA')
+TOKEN_2022_PROGRAM_ID = Pubkey.from_string('TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb')
+ASSOCIATED_TOKEN_PROGRAM_ID = Pubkey.from_string('ATokenGPvbdGVxr1b2hvZbsiqW5xWH25efTNsLJA8knL')
+
+
+def parsePubkey(address):
+    '''
+    解析Solana地址
+    :return: Pubkey，格式错误返回None
+    '''
+    try:
+        return Pubkey.from_string(address)
+    except Exception:
+        return None
+
+
+def getAssociatedTokenAddress(owner, mint, programId=TOKEN_PROGRAM_ID):
+    '''
+    推导关联代币账户地址
+    :param owner: 钱包 Pubkey
+    :param mint: 代币 Pubkey
+    :param programId: 代币程序（Token / Token-2022）
+    :return: Pubkey
+    '''
+    return Pubkey.find_program_address([bytes(owner), bytes(programId), bytes(mint)], ASSOCIATED_TOKEN_PROGRAM_ID)[0]
+
+
+def formatAmount(raw, decimals):
+    return format(Decimal(raw).scaleb(-int(decimals)).normalize(), 'f')
+
+
+def getMultipleAccounts(client, addresses, encoding='base64'):
+    '''
+    批量读取账户信息，按 SOL_ACCOUNTS_PER_CALL 拆分，多个调用打包并发发送
+    :param client: utils_rpc.RpcPool
+    :param addresses: 地址字符串列表
+    :param encoding: base64 时只返回账户元信息（不含数据），jsonParsed 时返回解析后的数据
+    :return: 与 addresses 顺序一致的账户信息，账户不存在为None，读取失败或返回格式错误为异常实例
+    '''
+    config = {'encoding': encoding, 'commitment': 'confirmed'}
+    if encoding == 'base64':
+        # 只需要 lamports，不下载账户数据
+        config['dataSlice'] = {'offset': 0, 'length': 0}
+    chunks = [addresses[i:i + SOL_ACCOUNTS_PER_CALL] for i in range(0, len(addresses), SOL_ACCOUNTS_PER_CALL)]
+    calls = [('getMultipleAccounts', [chunk, config]) for chunk in chunks]
+    responses = utils_rpc.runBatches(client, calls, SOL_CALLS_PER_REQUEST, SOL_SCAN_CONCURRENCY)
+
+    results = []
+    for (chunk, response) in zip(chunks, responses):
+        if not isinstance(response, Exception):
+            value = response.get('value') if isinstance(response, dict) else None
+            if isinstance(value, list) and len(value) == len(chunk):
+                results.extend(value)
+                continue
+            logger.warning(f'[getMultipleAccounts] 返回格式错误: {str(response)[:200]}')
+            response = ValueError('getMultipleAccounts 返回格式错误')
+        results.extend([response] * len(chunk))
+    return results
+
+
+def fetchMintInfo(client, mints):
+    '''
+    批量读取代币mint信息（精度、所属代币程序）
+    :param client: utils_rpc.RpcPool
+    :param mints: mint地址列表
+    :return: {mint: {"decimals", "program"}}，读取失败的 mint decimals 为 None
+    '''
+    accounts = getMultipleAccounts(client, mints, encoding='jsonParsed')
+    info = {}
+    for (mint, account) in zip(mints, accounts):
+        try:
+            info[mint] = {
+                'decimals': account['data']['parsed']['info']['decimals'],
+                'program': account['owner']
+            }
+        except Exception:
+            info[mint] = {'decimals': None, 'program': None}
+    return info
+
+
+def _accountError(account):
+    return str(account) if isinstance(account, Exception) else None
+
+
+def _parseLamports(account):
+    '''
+    解析账户SOL余额，账户不存在为0
+    :return: lamports，格式错误时抛出 ValueError
+    '''
+    if account is None:
+        return 0
+    try:
+        return int(account['lamports'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'账户数据格式错误: {e!r}')
+
+
+def _parseTokenAmount(account):
+    '''
+    解析代币账户（jsonParsed）余额，关联代币账户不存在即余额为0
+    :return: 最小单位整数，格式错误（如节点未能解析账户数据）时抛出 ValueError
+    '''
+    if account is None:
+        return 0
+    try:
+        return int(account['data']['parsed']['info']['tokenAmount']['amount'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'代币账户数据格式错误: {e!r}')
+
+
+def _scanAllTokens(client, owners):
+    '''
+    通过 getTokenAccountsByOwner 扫描每个地址在 Token / Token-2022 程序下的全部代币账户
+    :return: 与 owners 顺序一致的 {mint: {"raw", "decimals"}}，读取失败或返回格式错误为异常实例
+    '''
+    calls = []
+    for owner in owners:
+        for programId in (TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID):
+            calls.append(('getTokenAccountsByOwner', [owner, {'programId': str(programId)},
+                                                      {'encoding': 'jsonParsed', 'commitment': 'confirmed'}]))
+    responses = utils_rpc.runBatches(client, calls, SOL_CALLS_PER_REQUEST, SOL_SCAN_CONCURRENCY)
+
+    results = []
+    for i in range(len(owners)):
+        pair = responses[i * 2:i * 2 + 2]
+        error = next((response for response in pair if isinstance(response, Exception)), None)
+        if error is not None:
+            results.append(error)
+            continue
+        holdings = {}
+        try:
+            for response in pair:
+                for item in response['value']:
+                    tokenInfo = item['account']['data']['parsed']['info']
+                    amount = tokenInfo['tokenAmount']
+                    holding = holdings.setdefault(tokenInfo['mint'], {'raw': 0, 'decimals': amount['decimals']})
+                    holding['raw'] += int(amount['amount'])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f'[scanAllTokens] {owners[i]} 代币账户数据格式错误: {e!r}')
+            results.append(ValueError(f'代币账户数据格式错误: {e!r}'))
+            continue
+        results.append(holdings)
+    return results
+
+
+def getBalances(addresses=None, project=None, mints=None, allTokens=False, rpcUrl=None):
+    '''
+    批量查询Solana地址的SOL和SPL代币余额
+    :param addresses: 地址列表（与 project 二选一）
+    :param project: 项目名称，查询该项目下全部钱包
+    :param mints: SPL代币mint地址列表（可选），按关联代币账户读取
+    :param allTokens: 为True时扫描地址下全部代币账户（getTokenAccountsByOwner），忽略 mints
+    :param rpcUrl: 自定义RPC地址（可选，默认使用 utils_rpc 中 "solana" 的节点池）
+    :return: {'success', 'msg', 'data'}
+    '''
+    if not addresses and project:
+        addresses = utils_db.queryProjectAddresses(project)
+    addresses = list(dict.fromkeys(addresses or []))
+    mints = [] if allTokens else list(dict.fromkeys(mints or []))
+
+    owners = {address: parsePubkey(address) for address in addresses}
+    invalid = [address for address in addresses if owners[address] is None]
+    addresses = [address for address in addresses if owners[address] is not None]
+    invalidMints = [mint for mint in mints if parsePubkey(mint) is None]
+    if invalidMints:
+        return {'success': False, 'msg': f'代币地址格式错误: {invalidMints[0]}', 'data': None}
+    if not addresses:
+        return {'success': False, 'msg': '没有可查询的Solana地址', 'data': None}
+    if len(addresses) > SOL_SCAN_MAX_ADDRESSES:
+        return {'success': False, 'msg': f'单次最多查询 {SOL_SCAN_MAX_ADDRESSES} 个地址', 'data': None}
+
+    client = utils_rpc.getRpcClient('solana', rpcUrl)
+    logger.info(f'[getBalances] 查询余额: 地址数={len(addresses)}, 代币数={len(mints)}, allTokens={allTokens}, '
+                f'忽略无效地址={len(invalid)}')
+    started = time.monotonic()
+
+    try:
+        # 1. SOL余额
+        solAccounts = getMultipleAccounts(client, addresses)
+
+        # 2. 代币余额
+        mintInfo = fetchMintInfo(client, mints) if mints else {}
+        tokenAccounts = []
+        if allTokens:
+            holdings = _scanAllTokens(client, addresses)
+        elif mints:
+            ataAddresses = []
+            for address in addresses:
+                for mint in mints:
+                    program = mintInfo[mint]['program'] or str(TOKEN_PROGRAM_ID)
+                    ataAddresses.append(str(getAssociatedTokenAddress(owners[address], Pubkey.from_string(mint),
+                                                                      Pubkey.from_string(program))))
+            tokenAccounts = getMultipleAccounts(client, ataAddresses, encoding='jsonParsed')
+    except Exception as e:
+        logger.error(f'[getBalances] 查询失败: {e}')
+        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+
+    items = []
+    failed = 0
+    for (i, address) in enumerate(addresses):
+        account = solAccounts[i]
+        error = _accountError(account)
+        if not error:
+            try:
+                lamports = _parseLamports(account)
+            except ValueError as e:
+                error = str(e)
+        if error:
+            sol = {'raw': None, 'balance': None, 'error': error}
+        else:
+            sol = {'raw': str(lamports), 'balance': formatAmount(lamports, LAMPORTS_DECIMALS)}
+
+        tokens = []
+        if allTokens:
+            holding = holdings[i]
+            if isinstance(holding, Exception):
+                tokens = None
+                error = error or str(holding)
+            else:
+                tokens = [{'mint': mint, 'raw': str(value['raw']), 'balance': formatAmount(value['raw'], value['decimals'])}
+                          for (mint, value) in holding.items() if value['raw'] > 0]
+        else:
+            for (j, mint) in enumerate(mints):
+                tokenAccount = tokenAccounts[i * len(mints) + j]
+                tokenError = _accountError(tokenAccount)
+                if not tokenError:
+                    try:
+                        raw = _parseTokenAmount(tokenAccount)
+                    except ValueError as e:
+                        tokenError = str(e)
+                if tokenError:
+                    tokens.append({'mint': mint, 'raw': None, 'balance': None, 'error': tokenError})
+                    error = error or tokenError
+                    continue
+                decimals = mintInfo[mint]['decimals']
+                tokens.append({'mint': mint, 'raw': str(raw),
+                               'balance': formatAmount(raw, decimals) if decimals is not None else None})
+
+        if error:
+            failed += 1
+        items.append({'address': address, 'sol': sol, 'tokens': tokens})
+
+    elapsed = round(time.monotonic() - started, 3)
+    logger.info(f'[getBalances] 查询完成: 地址数={len(items)}, 部分失败={failed}, 耗时={elapsed}s')
+    return {
+        'success': True,
+        'msg': 'ok',
+        'data': {
+            'tokens': [{'mint': mint, **mintInfo[mint]} for mint in mints],
+            'list': items,
+            'invalid': invalid,
+            'failed': failed,
+            'elapsed': elapsed
+        }
+    }
@@ -0,0 +1,483 @@
+# coding:utf-8
+'''
+Description: EVM批量转账执行器
+私钥只在服务端用 utils_encrypt.decrypt 解密并保存在内存中；
+每批只查询一次 nonce 和 gas 价格，按发送方在本地分配 nonce，离线签名后连续广播（不等待上一笔确认），
+不同发送方之间并发执行，回执由后台线程批量轮询
+'''
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from eth_account import Account
+from eth_utils import to_checksum_address
+
+import service_chain_evm
+import utils_db
+import utils_encrypt
+import utils_rpc
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# 同时广播的发送方数量
+TRANSFER_CONCURRENCY = int(os.getenv('TRANSFER_CONCURRENCY', '8'))
+# 单批最多转账笔数
+TRANSFER_MAX_ITEMS = int(os.getenv('TRANSFER_MAX_ITEMS', '5000'))
+# 回执轮询间隔和总等待时间（秒）
+TRANSFER_RECEIPT_POLL_INTERVAL = float(os.getenv('TRANSFER_RECEIPT_POLL_INTERVAL', '2'))
+TRANSFER_RECEIPT_TIMEOUT = float(os.getenv('TRANSFER_RECEIPT_TIMEOUT', '300'))
+# ERC20 预估 gas 的放大系数
+TRANSFER_GAS_LIMIT_BUFFER = float(os.getenv('TRANSFER_GAS_LIMIT_BUFFER', '1.2'))
+# 节点不支持 eth_maxPriorityFeePerGas 时使用的小费（wei）
+TRANSFER_DEFAULT_PRIORITY_FEE = int(os.getenv('TRANSFER_DEFAULT_PRIORITY_FEE', str(10 ** 9)))
+# 进度回调最小间隔（秒），避免每笔都写一次任务进度
+TRANSFER_PROGRESS_INTERVAL = float(os.getenv('TRANSFER_PROGRESS_INTERVAL', '1'))
+
+NATIVE_GAS_LIMIT = 21000
+SELECTOR_TRANSFER = bytes.fromhex('a9059cbb')  # transfer(address,uint256)
+
+# 需要重新同步 nonce 的广播错误
+NONCE_ERROR_PATTERN = re.compile(r'nonce too low|nonce too high|replacement transaction underpriced|'
+                                 r'invalid nonce|nonce has already been used', re.IGNORECASE)
+# 节点已收到同一笔交易（如切换节点后重发），按广播成功处理
+KNOWN_TX_PATTERN = re.compile(r'already known|known transaction|already imported', re.IGNORECASE)
+
+
+class NonceManager:
+    '''
+    单个发送方的本地 nonce 分配：广播成功才前进，失败的 nonce 留给下一笔复用，避免出现空缺
+    '''
+
+    def __init__(self, address, start):
+        self.address = address
+        self._next = start
+        self._lock = threading.Lock()
+
+    def peek(self):
+        with self._lock:
+            return self._next
+
+    def commit(self, nonce):
+        with self._lock:
+            self._next = max(self._next, nonce + 1)
+
+    def resync(self, client):
+        '''
+        从节点重新读取 pending nonce
+        '''
+        nonce = int(client.call('eth_getTransactionCount', [self.address, 'pending']), 16)
+        with self._lock:
+            self._next = nonce
+        logger.warning(f'[NonceManager] {self.address[:10]}... nonce 重新同步为 {nonce}')
+        return nonce
+
+
+class ReceiptTracker:
+    '''
+    后台回执跟踪：广播成功的交易加入后，按固定间隔把所有待确认交易合并为一个JSON-RPC批量请求查询回执
+    '''
+
+    def __init__(self, client, onReceipt, pollInterval=TRANSFER_RECEIPT_POLL_INTERVAL,
+                 timeout=TRANSFER_RECEIPT_TIMEOUT):
+        self.client = client
+        self.onReceipt = onReceipt
+        self.pollInterval = pollInterval
+        self.timeout = timeout
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='receipt-tracker', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, index, txHash):
+        with self._lock:
+            self._pending[index] = txHash
+
+    def close(self):
+        '''
+        不再有新交易加入
+        '''
+        self._closed.set()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        deadline = None
+        while True:
+            if self._closed.is_set() and deadline is None:
+                # 广播结束后开始计算超时
+                deadline = time.monotonic() + self.timeout
+            with self._lock:
+                pending = list(self._pending.items())
+            if pending:
+                try:
+                    self._poll(pending)
+                except Exception as e:
+                    # 单轮出错不能结束跟踪线程，下一轮继续查询
+                    logger.error(f'[ReceiptTracker] 查询回执出错: {e}')
+            with self._lock:
+                remaining = len(self._pending)
+            if self._closed.is_set() and remaining == 0:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning(f'[ReceiptTracker] 等待回执超时，未确认 {remaining} 笔')
+                return
+            time.sleep(self.pollInterval)
+
+    def _poll(self, pending):
+        calls = [('eth_getTransactionReceipt', [txHash]) for (_, txHash) in pending]
+        receipts = utils_rpc.runBatches(self.client, calls, utils_rpc.RPC_BATCH_SIZE, 1)
+        for ((index, txHash), receipt) in zip(pending, receipts):
+            if receipt is None or isinstance(receipt, Exception):
+                continue
+            with self._lock:
+                self._pending.pop(index, None)
+            try:
+                self.onReceipt(index, receipt)
+            except Exception as e:
+                logger.error(f'[ReceiptTracker] 处理第 {index} 笔回执出错: {e}')
+
+
+def _isTxKnown(client, signed):
+    '''
+    查询已签名交易是否已在节点中（交易池或已上链）
+    :return: True 已存在，False 不存在，None 查询失败
+    '''
+    txHash = '0x' + signed.hash.hex().removeprefix('0x')
+    try:
+        return client.call('eth_getTransactionByHash', [txHash]) is not None
+    except Exception as e:
+        logger.error(f'[_isTxKnown] 查询交易 {txHash} 失败: {e}')
+        return None
+
+
+def toBaseUnits(amount, decimals):
+    '''
+    将数量转换为最小单位整数
+    :param amount: 数量（字符串或数字，如 "1.5"）
+    :param decimals: 精度
+    :return: int
+    '''
+    value = Decimal(str(amount)).scaleb(int(decimals))
+    if value != value.to_integral_value():
+        raise ValueError(f'金额精度超过 {decimals} 位小数')
+    return int(value)
+
+
+def _fetchGasPrice(client, multiplier):
+    '''
+    每批查询一次gas价格：支持EIP-1559的链使用 maxFeePerGas = 2*baseFee + 小费，否则使用 gasPrice
+    :return: 交易gas字段
+    '''
+    block, gasPrice, priorityFee = client.batch([
+        ('eth_getBlockByNumber', ['latest', False]),
+        ('eth_gasPrice', []),
+        ('eth_maxPriorityFeePerGas', []),
+    ])
+    if isinstance(block, Exception):
+        raise block
+    baseFee = block.get('baseFeePerGas') if block else None
+    if baseFee:
+        priority = TRANSFER_DEFAULT_PRIORITY_FEE if isinstance(priorityFee, Exception) else int(priorityFee, 16)
+        priority = int(priority * multiplier)
+        return {'type': 2, 'maxPriorityFeePerGas': priority, 'maxFeePerGas': int(baseFee, 16) * 2 + priority}
+    if isinstance(gasPrice, Exception):
+        raise gasPrice
+    return {'gasPrice': int(int(gasPrice, 16) * multiplier)}
+
+
+def _loadSenderKeys(senders, pwd, project):
+    '''
+    查询发送方钱包并解密私钥（只保存在内存中）
+    :return: ({小写地址: 私钥}, {小写地址: 错误信息})
+    '''
+    wallets = utils_db.queryWalletsByAddresses(senders, project)
+    keys = {}
+    errors = {}
+    for sender in senders:
+        wallet = wallets.get(sender.lower())
+        if wallet is None:
+            errors[sender.lower()] = '发送方钱包不存在'
+            continue
+        privateKey = utils_encrypt.decrypt(wallet.private_key, pwd)
+        if not privateKey:
+            errors[sender.lower()] = '私钥解密失败'
+            continue
+        try:
+            if Account.from_key(privateKey).address.lower() != sender.lower():
+                errors[sender.lower()] = '私钥与地址不匹配'
+                continue
+        except Exception:
+            errors[sender.lower()] = '私钥格式错误'
+            continue
+        keys[sender.lower()] = privateKey
+    return keys, errors
+
+
+def batchTransfer(chainId, pwd, items, token=None, decimals=None, rpcUrl=None, project=None, concurrency=None,
+                  gasPriceMultiplier=None, gasLimit=None, waitReceipts=True, progress=None):
+    '''
+    批量转账（原生币或ERC20）
+    :param chainId: 链ID
+    :param pwd: 钱包解密密钥
+    :param items: [{"from", "to", "amount"}, ...]，from 必须是库中的钱包
+    :param token: ERC20合约地址（不传为原生币）
+    :param decimals: 代币精度（不传时从链上读取）
+    :param rpcUrl: 自定义RPC地址（可选）
+    :param project: 限定发送方钱包所属项目（可选）
+    :param concurrency: 同时广播的发送方数量，默认 TRANSFER_CONCURRENCY
+    :param gasPriceMultiplier: gas价格倍数，默认1
+    :param gasLimit: 固定gas上限（不传时原生币21000，ERC20按预估）
+    :param waitReceipts: 是否等待回执
+    :param progress: 进度回调 progress(stats)，按 TRANSFER_PROGRESS_INTERVAL 节流，回调出错不影响转账
+    :return: {'success', 'msg', 'data': {"list": [每笔结果], "summary": 统计}}
+    '''
+    if not items:
+        return {'success': False, 'msg': '转账列表为空', 'data': None}
+    if len(items) > TRANSFER_MAX_ITEMS:
+        return {'success': False, 'msg': f'单批最多 {TRANSFER_MAX_ITEMS} 笔', 'data': None}
+    if token and not service_chain_evm.isEvmAddress(token):
+        return {'success': False, 'msg': f'代币地址格式错误: {token}', 'data': None}
+    try:
+        client = utils_rpc.getRpcClient(chainId, rpcUrl)
+    except ValueError as e:
+        return {'success': False, 'msg': str(e), 'data': None}
+
+    concurrency = max(1, int(concurrency or TRANSFER_CONCURRENCY))
+    multiplier = float(gasPriceMultiplier or 1)
+    started = time.monotonic()
+
+    results = [{'index': i, 'from': item.get('from'), 'to': item.get('to'), 'amount': item.get('amount'),
+                'nonce': None, 'txHash': None, 'status': 'pending', 'error': None} for (i, item) in enumerate(items)]
+    stats = {'total': 0, 'sent': 0, 'unknown': 0, 'failed': 0, 'success': 0, 'reverted': 0}
+    statsLock = threading.Lock()
+    lastReport = [0.0]
+
+    def report(force=False, **deltas):
+        with statsLock:
+            for (key, delta) in deltas.items():
+                stats[key] += delta
+            now = time.monotonic()
+            if not progress or (not force and now - lastReport[0] < TRANSFER_PROGRESS_INTERVAL):
+                return
+            lastReport[0] = now
+            snapshot = dict(stats)
+        # 进度回调失败不能影响已广播交易的处理
+        try:
+            progress(snapshot)
+        except Exception as e:
+            logger.warning(f'[batchTransfer] 进度回调失败: {e}')
+
+    def fail(index, error):
+        results[index].update({'status': 'failed', 'error': error})
+        report(failed=1, total=1)
+
+    # 1. 参数校验、金额换算
+    try:
+        if token and decimals is None:
+            cacheChainId = service_chain_evm.resolveChainId(client, chainId)
+            decimals = service_chain_evm.getTokenMetadata(client, cacheChainId, [token])[token]['decimals']
+            if decimals is None:
+                return {'success': False, 'msg': '读取代币精度失败', 'data': None}
+        unitDecimals = int(decimals) if token else 18
+    except Exception as e:
+        logger.error(f'[batchTransfer] 读取代币精度失败: {e}')
+        return {'success': False, 'msg': f'读取代币精度失败: {str(e)}', 'data': None}
+
+    groups = {}
+    values = {}
+    for (i, item) in enumerate(items):
+        if not service_chain_evm.isEvmAddress(item.get('from')) or not service_chain_evm.isEvmAddress(item.get('to')):
+            fail(i, '地址格式错误')
+            continue
+        try:
+            values[i] = toBaseUnits(item.get('amount'), unitDecimals)
+            if values[i] <= 0:
+                raise ValueError('金额必须大于0')
+        except (ValueError, InvalidOperation, TypeError) as e:
+            fail(i, f'金额无效: {e}')
+            continue
+        groups.setdefault(item['from'].lower(), []).append(i)
+
+    if not groups:
+        return {'success': True, 'msg': 'ok', 'data': {'list': results, 'summary': stats}}
+
+    # 2. 解密发送方私钥
+    keys, keyErrors = _loadSenderKeys(list(groups.keys()), pwd, project)
+    for (sender, error) in keyErrors.items():
+        for i in groups.pop(sender):
+            fail(i, error)
+    if not groups:
+        return {'success': True, 'msg': 'ok', 'data': {'list': results, 'summary': stats}}
+
+    logger.info(f'[batchTransfer] 开始批量转账: chainId={chainId}, token={token}, 笔数={len(items)}, '
+                f'发送方={len(groups)}, concurrency={concurrency}')
+
+    # 3. 每批只查询一次：链ID、gas价格、各发送方 pending nonce
+    try:
+        senders = list(groups.keys())
+        responses = client.batch([('eth_chainId', [])] +
+                                 [('eth_getTransactionCount', [sender, 'pending']) for sender in senders])
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        signChainId = int(responses[0], 16)
+        if rpcUrl and chainId is not None and str(chainId) != str(signChainId):
+            return {'success': False, 'msg': f'节点链ID {signChainId} 与 chainId {chainId} 不一致', 'data': None}
+        nonces = {sender: NonceManager(sender, int(nonce, 16)) for (sender, nonce) in zip(senders, responses[1:])}
+        gasFields = _fetchGasPrice(client, multiplier)
+    except Exception as e:
+        logger.error(f'[batchTransfer] 查询nonce/gas失败: {e}')
+        return {'success': False, 'msg': f'查询nonce/gas失败: {str(e)}', 'data': None}
+
+    # 4. 组装交易（ERC20 在一个批量请求中预估 gas）
+    txs = {}
+    for (sender, indexes) in groups.items():
+        for i in indexes:
+            to = items[i]['to']
+            if token:
+                data = service_chain_evm.encodeCall(SELECTOR_TRANSFER, ['address', 'uint256'], [to.lower(), values[i]])
+                txs[i] = {'from': items[i]['from'], 'to': to_checksum_address(token), 'value': 0, 'data': '0x' + data.hex()}
+            else:
+                txs[i] = {'from': items[i]['from'], 'to': to_checksum_address(to), 'value': values[i], 'data': '0x'}
+
+    if gasLimit:
+        for tx in txs.values():
+            tx['gas'] = int(gasLimit)
+    elif token:
+        indexes = list(txs.keys())
+        calls = [('eth_estimateGas', [{'from': txs[i]['from'], 'to': txs[i]['to'], 'data': txs[i]['data']}])
+                 for i in indexes]
+        estimates = utils_rpc.runBatches(client, calls, utils_rpc.RPC_BATCH_SIZE, concurrency)
+        for (i, estimate) in zip(indexes, estimates):
+            if isinstance(estimate, Exception):
+                # 预估失败通常是代币余额不足，直接跳过该笔
+                fail(i, f'预估gas失败: {estimate}')
+                groups[items[i]['from'].lower()].remove(i)
+                del txs[i]
+            else:
+                txs[i]['gas'] = int(int(estimate, 16) * TRANSFER_GAS_LIMIT_BUFFER)
+    else:
+        for tx in txs.values():
+            tx['gas'] = NATIVE_GAS_LIMIT
+
+    # 5. 回执跟踪
+    def onReceipt(index, receipt):
+        success = int(receipt.get('status', '0x1'), 16) == 1
+        if results[index]['status'] == 'unknown':
+            # 广播结果未知的交易已上链，计入已广播
+            report(unknown=-1, sent=1)
+        results[index].update({
+            'status': 'success' if success else 'reverted',
+            'blockNumber': int(receipt['blockNumber'], 16) if receipt.get('blockNumber') else None,
+            'gasUsed': int(receipt['gasUsed'], 16) if receipt.get('gasUsed') else None,
+            'error': None if success else '交易执行失败'
+        })
+        report(**{'success' if success else 'reverted': 1})
+
+    tracker = ReceiptTracker(client, onReceipt).start() if waitReceipts else None
+
+    # 6. 按发送方顺序签名并连续广播，发送方之间并发
+    def sendOne(sender, i):
+        manager = nonces[sender]
+        for attempt in range(2):
+            nonce = manager.peek()
+            tx = {key: value for (key, value) in txs[i].items() if key != 'from'}
+            tx.update(gasFields)
+            tx.update({'nonce': nonce, 'chainId': signChainId})
+            signed = None
+            status = 'sent'
+            error = None
+            try:
+                signed = Account.sign_transaction(tx, keys[sender])
+                txHash = client.call('eth_sendRawTransaction', ['0x' + signed.raw_transaction.hex().removeprefix('0x')])
+            except Exception as e:
+                # nonce 错误可能是这笔交易自身已送达（如之前的请求超时但已被接收），先按本地哈希查询再决定是否重签
+                known = _isTxKnown(client, signed) if signed is not None and NONCE_ERROR_PATTERN.search(str(e)) \
+                    else False
+                if signed is not None and (KNOWN_TX_PATTERN.search(str(e)) or known is True):
+                    # 节点已有该交易，使用本地计算的交易哈希
+                    logger.warning(f'[batchTransfer] 第 {i} 笔交易已在节点中，按广播成功处理: {e}')
+                    txHash = None
+                elif signed is not None and (utils_rpc.isMaybeDelivered(e) or known is None):
+                    # 超时、5xx 等情况节点可能已接收交易：不能用该 nonce 重新签名（可能重复转账），
+                    # 占用该 nonce 并按本地交易哈希跟踪回执
+                    logger.error(f'[batchTransfer] 第 {i} 笔广播结果未知，按本地哈希跟踪: {e}')
+                    txHash = None
+                    status = 'unknown'
+                    error = f'广播结果未知: {e}'
+                else:
+                    if attempt == 0 and NONCE_ERROR_PATTERN.search(str(e)):
+                        try:
+                            manager.resync(client)
+                            continue
+                        except Exception as resyncError:
+                            logger.error(f'[batchTransfer] nonce 同步失败: {resyncError}')
+                    logger.error(f'[batchTransfer] 第 {i} 笔广播失败: {e}')
+                    fail(i, f'广播失败: {e}')
+                    return
+            manager.commit(nonce)
+            results[i].update({'nonce': nonce, 'txHash': txHash or '0x' + signed.hash.hex().removeprefix('0x'),
+                               'status': status, 'error': error})
+            report(total=1, **{status: 1})
+            if tracker:
+                tracker.add(i, results[i]['txHash'])
+            return
+
+    def sendGroup(sender):
+        for i in groups[sender]:
+            try:
+                sendOne(sender, i)
+            except Exception as e:
+                # 单笔意外出错不中断同一发送方后续交易
+                logger.error(f'[batchTransfer] 第 {i} 笔处理出错: {e}')
+                if results[i]['status'] == 'pending':
+                    fail(i, f'处理出错: {e}')
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(groups))) as executor:
+            list(executor.map(sendGroup, list(groups.keys())))
+    finally:
+        keys.clear()
+        if tracker:
+            tracker.close()
+
+    broadcastElapsed = round(time.monotonic() - started, 3)
+    logger.info(f'[batchTransfer] 广播完成: 成功={stats["sent"]}, 结果未知={stats["unknown"]}, '
+                f'失败={stats["failed"]}, 耗时={broadcastElapsed}s')
+    report(force=True)
+
+    if tracker:
+        tracker.join()
+        report(force=True)
+
+    elapsed = round(time.monotonic() - started, 3)
+    logger.info(f'[batchTransfer] 批量转账完成: 确认成功={stats["success"]}, 执行失败={stats["reverted"]}, '
+                f'未确认={stats["sent"] - stats["success"] - stats["reverted"]}, 结果未知={stats["unknown"]}, '
+                f'耗时={elapsed}s')
+    return {
+        'success': True,
+        'msg': 'ok',
+        'data': {
+            'list': results,
+            'summary': {**stats, 'broadcastElapsed': broadcastElapsed, 'elapsed': elapsed}
+        }
+    }
@@ -0,0 +1,403 @@
+# coding:utf-8
+'''
+Description: 交易所异步服务 - 基于 ccxt.async_support
+所有交易所请求运行在同一个后台事件循环线程中，共享 aiohttp 会话，
+Flask 路由通过同步封装函数桥接，单进程可同时保持大量交易所请求在途
+'''
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import aiohttp
+import ccxt.async_support as ccxt_async
+
+import service_exchange_withdraw
+from service_exchange_withdraw import (EXCHANGE_MAP, EXCHANGE_NAMES, build_balance_result, build_withdraw_error,
+                                       build_withdraw_result, build_withdraw_unknown, load_exchange_config,
+                                       lookup_withdraw_fees, merge_balances, parse_proxy)
+import utils_db
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# 共享 aiohttp 会话的最大连接数
+ASYNC_EXCHANGE_CONNECTION_LIMIT = int(os.getenv('ASYNC_EXCHANGE_CONNECTION_LIMIT', '200'))
+# 同步桥接等待结果的超时（秒）
+ASYNC_EXCHANGE_CALL_TIMEOUT = float(os.getenv('ASYNC_EXCHANGE_CALL_TIMEOUT', '60'))
+# 批量余额查询时，桥接超时在调用方超时之外额外预留的时间（秒），覆盖读取账户列表和配置的耗时
+ASYNC_BALANCES_TIMEOUT_MARGIN = 10
+
+
+class AsyncLoopThread:
+    '''
+    后台事件循环线程，供同步代码提交协程
+    '''
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='exchange-async-loop', daemon=True)
+                thread.start()
+                self._loop = loop
+                logger.info('[AsyncLoopThread] 事件循环线程已启动')
+            return self._loop
+
+    def run(self, coro, timeout=None, cancel_on_timeout=True):
+        '''
+        在事件循环中执行协程并等待结果（同步调用）
+        :param coro: 协程
+        :param timeout: 等待超时秒数
+        :param cancel_on_timeout: 超时后是否取消协程，只读请求取消即可；提现等请求可能已发出，应让其自然完成
+        :return: 协程返回值，超时抛出 concurrent.futures.TimeoutError
+        '''
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            logger.error(f'[AsyncLoopThread] 等待结果超时: {timeout}s, cancel={cancel_on_timeout}')
+            if cancel_on_timeout:
+                future.cancel()
+            raise
+
+    @property
+    def started(self):
+        return self._loop is not None
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+
+_loop_thread = AsyncLoopThread()
+
+
+class AsyncExchangeClientPool:
+    '''
+    ccxt 异步客户端池，键与同步客户端池一致（平台, 凭证哈希, 代理）
+    所有方法只在事件循环线程中调用，无需加锁；客户端共享同一个 aiohttp 会话
+    '''
+
+    def __init__(self, idle_ttl, connection_limit):
+        self.idle_ttl = idle_ttl
+        self.connection_limit = connection_limit
+        self._entries = {}
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, enable_cleanup_closed=True)
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        return self._session
+
+    def _create_client(self, config):
+        platform = config['platform']
+        logger.info(f'[AsyncExchangeClientPool] 创建 {EXCHANGE_NAMES.get(platform, platform)} 异步客户端')
+        params = {
+            'apiKey': config['api_key'],
+            'secret': config['secret'],
+            'enableRateLimit': True,
+            # 传入共享会话，ccxt 关闭客户端时不会关闭该会话
+            'session': self._get_session(),
+        }
+        proxy_url = parse_proxy(config['proxy_ip'])
+        if proxy_url:
+            params['httpsProxy'] = proxy_url
+        if platform in ('bitget', 'okx'):
+            params['password'] = config['password'] or ''
+        if platform == 'binance':
+            params['options'] = {'defaultType': 'spot'}
+        return getattr(ccxt_async, EXCHANGE_MAP[platform])(params)
+
+    async def acquire(self, name, config):
+        '''
+        获取异步客户端，不存在时创建
+        :param name: 交易所名称（用于按名称失效）
+        :param config: load_exchange_config 返回的配置
+        :return: ccxt 异步交易所对象
+        '''
+        key = service_exchange_withdraw.ExchangeClientPool.make_key(config)
+        await self._evict_idle()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {'client': self._create_client(config), 'names': set(), 'in_use': 0}
+            self._entries[key] = entry
+        entry['in_use'] += 1
+        entry['names'].add(name)
+        entry['last_used'] = time.monotonic()
+        return entry['client']
+
+    async def release(self, client):
+        for (key, entry) in list(self._entries.items()):
+            if entry['client'] is client:
+                entry['in_use'] = max(0, entry['in_use'] - 1)
+                entry['last_used'] = time.monotonic()
+                if entry.get('invalid') and entry['in_use'] == 0:
+                    del self._entries[key]
+                    await self._close(client)
+                return
+        # 已被移出池的客户端直接关闭
+        await self._close(client)
+
+    async def invalidate(self, name=None):
+        '''
+        失效客户端（交易所配置更新或删除时调用）
+        :param name: 交易所名称，为None时失效全部
+        '''
+        for (key, entry) in list(self._entries.items()):
+            if name is not None and name not in entry['names']:
+                continue
+            if entry['in_use'] == 0:
+                del self._entries[key]
+                await self._close(entry['client'])
+            else:
+                # 使用中的客户端在归还时关闭
+                entry['invalid'] = True
+        logger.info(f'[AsyncExchangeClientPool] 已失效客户端: name={name}')
+
+    async def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        for (key, entry) in list(self._entries.items()):
+            if entry['in_use'] == 0 and entry['last_used'] < deadline:
+                del self._entries[key]
+                await self._close(entry['client'])
+                logger.debug(f'[AsyncExchangeClientPool] 关闭空闲客户端: {key[0]}')
+
+    @staticmethod
+    async def _close(client):
+        try:
+            await client.close()
+        except:
+            pass
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'in_use': sum(entry['in_use'] for entry in list(self._entries.values())),
+            'idle_ttl': self.idle_ttl,
+            'connection_limit': self.connection_limit
+        }
+
+
+_client_pool = AsyncExchangeClientPool(service_exchange_withdraw.EXCHANGE_CLIENT_IDLE_TTL,
+                                       ASYNC_EXCHANGE_CONNECTION_LIMIT)
+
+
+def invalidate_exchange_clients(exchange_name=None):
+    '''
+    失效异步交易所客户端（交易所配置更新或删除时调用）
+    :param exchange_name: 交易所名称，为None时失效全部
+    '''
+    if not _loop_thread.started:
+        return
+    _loop_thread.call_soon(asyncio.ensure_future, _client_pool.invalidate(exchange_name))
+
+
+def get_client_pool_stats():
+    '''
+    获取异步客户端池统计
+    '''
+    return _client_pool.stats()
+
+
+async def _load_config(exchange_name, pwd, tag):
+    # 查库和解密是阻塞操作，放到默认线程池执行，不阻塞事件循环
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, load_exchange_config, exchange_name, pwd, tag)
+
+
+# ==================== 异步接口 ====================
+
+async def withdraw_async(exchange_name, pwd, to_address, network, coin, amount):
+    '''
+    交易所提现（异步）
+    :param exchange_name: 交易所名称（数据库中的name）
+    :param pwd: 解密密钥
+    :param to_address: 目标地址
+    :param network: 提现网络
+    :param coin: 代币符号（如 USDT, ETH）
+    :param amount: 提现金额
+    :return: 提现结果，结构同 service_exchange_withdraw.withdraw
+    '''
+    logger.info(f'[withdraw_async] 开始提现: exchange={exchange_name}, to={to_address[:10]}..., network={network}, coin={coin}, amount={amount}')
+
+    config, error = await _load_config(exchange_name, pwd, 'withdraw_async')
+    if error:
+        return error
+
+    client = await _client_pool.acquire(exchange_name, config)
+    try:
+        response = await client.withdraw(coin, amount, to_address, None, {'network': network})
+        return build_withdraw_result(config['platform'], response, to_address, network, coin, amount)
+    except Exception as e:
+        return build_withdraw_error(e, config['platform'], to_address, network, coin, amount)
+    finally:
+        await _client_pool.release(client)
+
+
+async def get_withdraw_fees_async(exchange_name, pwd, pairs):
+    '''
+    批量获取提现手续费（异步），与同步实现共享币种元数据缓存
+    :param exchange_name: 交易所名称
+    :param pwd: 解密密钥
+    :param pairs: [{"coin": "USDT", "network": "BSC"}, ...]
+    :return: 结构同 service_exchange_withdraw.get_withdraw_fees
+    '''
+    logger.info(f'[get_withdraw_fees_async] 批量查询手续费: exchange={exchange_name}, 数量={len(pairs)}')
+
+    config, error = await _load_config(exchange_name, pwd, 'get_withdraw_fees_async')
+    if error:
+        return error
+    platform = config['platform']
+    loop = asyncio.get_running_loop()
+
+    def loader():
+        # 在线程池（或缓存的后台刷新线程）中执行，把拉取请求提交回事件循环
+        return asyncio.run_coroutine_threadsafe(_fetch_currencies(exchange_name, config), loop).result()
+
+    try:
+        currencies = await loop.run_in_executor(
+            None, service_exchange_withdraw._currency_cache.get, platform, loader)
+    except Exception as e:
+        logger.error(f'[get_withdraw_fees_async] 查询失败: {e}')
+        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+
+    results = lookup_withdraw_fees(platform, currencies, pairs)
+    return {'success': True, 'msg': 'ok', 'data': results}
+
+
+async def _fetch_currencies(exchange_name, config):
+    client = await _client_pool.acquire(exchange_name, config)
+    try:
+        return await client.fetch_currencies()
+    finally:
+        await _client_pool.release(client)
+
+
+async def get_withdraw_fee_async(exchange_name, pwd, coin, network):
+    '''
+    获取提现手续费（异步）
+    '''
+    result = await get_withdraw_fees_async(exchange_name, pwd, [{'coin': coin, 'network': network}])
+    if not result['success']:
+        return result
+    return result['data'][0]
+
+
+async def get_balance_async(exchange_name, pwd, coin=None):
+    '''
+    获取交易所账户余额（异步）
+    :param exchange_name: 交易所名称
+    :param pwd: 解密密钥
+    :param coin: 代币符号（可选，不传则返回所有）
+    :return: 结构同 service_exchange_withdraw.get_balance
+    '''
+    logger.info(f'[get_balance_async] 查询余额: exchange={exchange_name}, coin={coin}')
+
+    config, error = await _load_config(exchange_name, pwd, 'get_balance_async')
+    if error:
+        return error
+
+    client = await _client_pool.acquire(exchange_name, config)
+    try:
+        return build_balance_result(await client.fetch_balance(), coin)
+    except Exception as e:
+        logger.error(f'[get_balance_async] 查询失败: {e}')
+        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+    finally:
+        await _client_pool.release(client)
+
+
+async def get_balances_async(pwd, exchange_names=None, coin=None, timeout=None):
+    '''
+    并发查询多个交易所账户余额并按币种汇总（异步）
+    :return: 结构同 service_exchange_withdraw.get_balances
+    '''
+    timeout = float(timeout or service_exchange_withdraw.BALANCE_FETCH_TIMEOUT)
+    if not exchange_names:
+        loop = asyncio.get_running_loop()
+        exchange_names = [item['name'] for item in
+                          await loop.run_in_executor(None, utils_db.queryAllExchangeNames)]
+    exchange_names = list(dict.fromkeys(exchange_names))
+    logger.info(f'[get_balances_async] 并发查询余额: 账户数={len(exchange_names)}, coin={coin}, timeout={timeout}')
+
+    async def fetch_one(name):
+        try:
+            return await asyncio.wait_for(get_balance_async(name, pwd, coin), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'[get_balances_async] {name} 查询超时')
+            return None
+        except Exception as e:
+            return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+
+    started = time.monotonic()
+    results = await asyncio.gather(*[fetch_one(name) for name in exchange_names])
+    elapsed = round(time.monotonic() - started, 3)
+    return {'success': True, 'msg': 'ok', 'data': merge_balances(exchange_names, results, elapsed)}
+
+
+# ==================== 同步桥接（供Flask路由调用，签名与 service_exchange_withdraw 一致） ====================
+
+def _timeout_result(tag, timeout):
+    logger.error(f'[{tag}] 等待交易所响应超时: {timeout}s')
+    return {'success': False, 'msg': f'请求超时（{int(timeout)}秒），请稍后重试', 'data': None}
+
+
+def withdraw(exchange_name, pwd, to_address, network, coin, amount):
+    try:
+        return _loop_thread.run(withdraw_async(exchange_name, pwd, to_address, network, coin, amount),
+                                ASYNC_EXCHANGE_CALL_TIMEOUT, cancel_on_timeout=False)
+    except FutureTimeoutError:
+        # 提现请求可能已被交易所受理，不能当作失败让调用方重试，返回结果未知
+        logger.error(f'[withdraw] 等待交易所响应超时: {ASYNC_EXCHANGE_CALL_TIMEOUT}s, 提现结果未知: '
+                     f'exchange={exchange_name}, to={to_address[:10]}..., coin={coin}, amount={amount}')
+        return build_withdraw_unknown(exchange_name, to_address, network, coin, amount,
+                                      f'等待交易所响应超时（{int(ASYNC_EXCHANGE_CALL_TIMEOUT)}秒）')
+
+
+def get_withdraw_fee(exchange_name, pwd, coin, network):
+    try:
+        return _loop_thread.run(get_withdraw_fee_async(exchange_name, pwd, coin, network),
+                                ASYNC_EXCHANGE_CALL_TIMEOUT)
+    except FutureTimeoutError:
+        return _timeout_result('get_withdraw_fee', ASYNC_EXCHANGE_CALL_TIMEOUT)
+
+
+def get_withdraw_fees(exchange_name, pwd, pairs):
+    try:
+        return _loop_thread.run(get_withdraw_fees_async(exchange_name, pwd, pairs), ASYNC_EXCHANGE_CALL_TIMEOUT)
+    except FutureTimeoutError:
+        return _timeout_result('get_withdraw_fees', ASYNC_EXCHANGE_CALL_TIMEOUT)
+
+
+def get_balance(exchange_name, pwd, coin=None):
+    try:
+        return _loop_thread.run(get_balance_async(exchange_name, pwd, coin), ASYNC_EXCHANGE_CALL_TIMEOUT)
+    except FutureTimeoutError:
+        return _timeout_result('get_balance', ASYNC_EXCHANGE_CALL_TIMEOUT)
+
+
+def get_balances(pwd, exchange_names=None, coin=None, timeout=None):
+    # 每个账户的超时由协程内部控制，桥接超时按调用方超时放宽，避免调用方超时大于全局超时时整体失败
+    fetch_timeout = float(timeout or service_exchange_withdraw.BALANCE_FETCH_TIMEOUT)
+    bridge_timeout = max(ASYNC_EXCHANGE_CALL_TIMEOUT, fetch_timeout + ASYNC_BALANCES_TIMEOUT_MARGIN)
+    try:
+        return _loop_thread.run(get_balances_async(pwd, exchange_names, coin, fetch_timeout), bridge_timeout)
+    except FutureTimeoutError:
+        return _timeout_result('get_balances', bridge_timeout)
@@ -6,9 +6,13 @@ Description: 交易所提现服务 - 支持 Binance, Bitget, OKX, Gate, Bybit
 '''
 
 import ccxt
+import hashlib
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import utils_db
 import utils_encrypt
@@ -33,6 +37,21 @@ EXCHANGE_MAP = {
     'bybit': 'bybit'
 }
 
+# 批量提现：每个交易所的并发数和两次请求之间的最小间隔（秒）
+WITHDRAW_BATCH_CONCURRENCY = int(os.getenv('WITHDRAW_BATCH_CONCURRENCY', '1'))
+WITHDRAW_BATCH_MIN_INTERVAL = float(os.getenv('WITHDRAW_BATCH_MIN_INTERVAL', '0.5'))
+
+# 交易所客户端池：空闲超过该秒数的客户端会被关闭
+EXCHANGE_CLIENT_IDLE_TTL = int(os.getenv('EXCHANGE_CLIENT_IDLE_TTL', '600'))
+
+# 币种元数据缓存：超过 REFRESH_AFTER 秒后台刷新，超过 TTL 秒同步重新加载
+CURRENCY_CACHE_TTL = int(os.getenv('CURRENCY_CACHE_TTL', '3600'))
+CURRENCY_CACHE_REFRESH_AFTER = int(os.getenv('CURRENCY_CACHE_REFRESH_AFTER', '1800'))
+
+# 多账户余额聚合：并发线程数和单账户超时（秒）
+BALANCE_FETCH_WORKERS = int(os.getenv('BALANCE_FETCH_WORKERS', '16'))
+BALANCE_FETCH_TIMEOUT = float(os.getenv('BALANCE_FETCH_TIMEOUT', '15'))
+
 # 交易所名称显示映射
 EXCHANGE_NAMES = {
     'binance': 'Binance',
@@ -147,29 +166,43 @@ def get_exchange_client(platform, api_key, secret, password=None, proxy_ip=None)
         return None
 
 
-def withdraw(exchange_name, pwd, to_address, network, coin, amount):
+class RateLimiter:
     '''
-    交易所提现
+    简单限速器：保证两次请求开始的间隔不小于 interval 秒（线程安全）
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+def load_exchange_config(exchange_name, pwd, tag):
+    '''
+    查询并解密交易所配置
     :param exchange_name: 交易所名称（数据库中的name）
     :param pwd: 解密密钥
-    :param to_address: 目标地址
-    :param network: 提现网络
-    :param coin: 代币符号（如 USDT, ETH）
-    :param amount: 提现金额
-    :return: 提现结果
+    :param tag: 日志标签（调用方函数名）
+    :return: (配置, 错误结果)，配置包含 platform, api_key, secret, password, proxy_ip
     '''
-    logger.info(f'[withdraw] 开始提现: exchange={exchange_name}, to={to_address[:10]}..., network={network}, coin={coin}, amount={amount}')
-
     # 1. 查询交易所信息
     exchange_info = utils_db.queryExchangeByName(exchange_name)
     if not exchange_info:
-        logger.error(f'[withdraw] 未找到交易所: {exchange_name}')
-        return {'success': False, 'msg': f'未找到交易所: {exchange_name}', 'data': None}
+        logger.error(f'[{tag}] 未找到交易所: {exchange_name}')
+        return None, {'success': False, 'msg': f'未找到交易所: {exchange_name}', 'data': None}
 
     platform = exchange_info['platform'].lower()
     if platform not in EXCHANGE_MAP:
-        logger.error(f'[withdraw] 不支持的平台: {platform}')
-        return {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
+        logger.error(f'[{tag}] 不支持的平台: {platform}')
+        return None, {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
 
     # 2. 解密敏感信息
     try:
@@ -178,373 +211,808 @@ def withdraw(exchange_name, pwd, to_address, network, coin, amount):
         password = utils_encrypt.decrypt(exchange_info['password'], pwd) if exchange_info['password'] else None
 
         if not api_key or not secret:
-            logger.error(f'[withdraw] API密钥或密钥为空')
-            return {'success': False, 'msg': 'API密钥配置不完整', 'data': None}
+            logger.error(f'[{tag}] API密钥或密钥为空')
+            return None, {'success': False, 'msg': 'API密钥配置不完整', 'data': None}
 
     except Exception as e:
-        logger.error(f'[withdraw] 解密失败: {e}')
-        return {'success': False, 'msg': '解密失败', 'data': None}
+        logger.error(f'[{tag}] 解密失败: {e}')
+        return None, {'success': False, 'msg': '解密失败', 'data': None}
 
-    # 3. 创建交易所客户端
-    proxy_ip = exchange_info.get('ip')
-    client = get_exchange_client(platform, api_key, secret, password, proxy_ip)
-    if not client:
-        return {'success': False, 'msg': '创建交易所客户端失败', 'data': None}
+    return {
+        'platform': platform,
+        'api_key': api_key,
+        'secret': secret,
+        'password': password,
+        'proxy_ip': exchange_info.get('ip')
+    }, None
 
-    try:
-        # 4. 执行提现
-        # CCXT withdraw 方法签名: withdraw(code, amount, address, tag=None, params={})
-        # network 参数需要通过 params 字典传递，键名为 'network'
-        params = {'network': network}
 
-        if platform == 'binance':
-            # Binance 提现
-            response = client.withdraw(
-                code=coin,
-                amount=amount,
-                address=to_address,
-                tag=None,  # 大部分代币不需要tag
-                params=params
-            )
+class ExchangeClientPool:
+    '''
+    进程内ccxt客户端池，按 (平台, 凭证哈希, 代理) 复用客户端
+    复用可保留已加载的市场信息、HTTP keep-alive 连接和限速状态
+    ccxt 同步客户端不是线程安全的：每个客户端同一时间只借给一个调用方，
+    并发调用同一账户时各自拿到独立的客户端
+    '''
 
-        elif platform == 'bitget':
-            # Bitget 提现 (必须提供 network 参数)
-            response = client.withdraw(
-                code=coin,
-                amount=amount,
-                address=to_address,
-                tag=None,
-                params=params
-            )
+    def __init__(self, idle_ttl):
+        self.idle_ttl = idle_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(config):
+        credentials = f"{config['api_key']}:{config['secret']}:{config['password'] or ''}"
+        return (config['platform'], hashlib.sha256(credentials.encode()).hexdigest(), config['proxy_ip'] or '')
+
+    def acquire(self, name, config):
+        '''
+        借出一个空闲客户端，没有空闲客户端时新建
+        :param name: 交易所名称（用于按名称失效）
+        :param config: load_exchange_config 返回的配置
+        :return: ccxt交易所对象（调用方独占，用完调用 release 归还），创建失败返回None
+        '''
+        key = self.make_key(config)
+        self._evict_idle()
+        with self._lock:
+            entry = self._entries.setdefault(key, {'names': set(), 'slots': []})
+            entry['names'].add(name)
+            for slot in entry['slots']:
+                if not slot['in_use']:
+                    slot['in_use'] = True
+                    logger.debug(f'[ExchangeClientPool] 复用 {name} 客户端')
+                    return slot['client']
+
+        client = get_exchange_client(config['platform'], config['api_key'], config['secret'],
+                                     config['password'], config['proxy_ip'])
+        if not client:
+            return None
 
-        elif platform == 'okx':
-            # OKX 提现
-            response = client.withdraw(
-                code=coin,
-                amount=amount,
-                address=to_address,
-                tag=None,
-                params=params
-            )
+        with self._lock:
+            entry = self._entries.setdefault(key, {'names': set(), 'slots': []})
+            entry['names'].add(name)
+            entry['slots'].append({'client': client, 'in_use': True, 'last_used': time.monotonic()})
+        return client
 
-        elif platform == 'gate':
-            # Gate 提现
-            response = client.withdraw(
-                code=coin,
-                amount=amount,
-                address=to_address,
-                tag=None,
-                params=params
-            )
+    def release(self, client):
+        with self._lock:
+            for entry in self._entries.values():
+                for slot in entry['slots']:
+                    if slot['client'] is client:
+                        slot['in_use'] = False
+                        slot['last_used'] = time.monotonic()
+                        return
+        # 已被移出池（失效）的客户端直接关闭
+        self._close(client)
+
+    def invalidate(self, name=None):
+        '''
+        失效客户端（交易所配置更新或删除时调用），使用中的客户端在归还时关闭
+        :param name: 交易所名称，为None时失效全部
+        '''
+        with self._lock:
+            for (key, entry) in list(self._entries.items()):
+                if name is not None and name not in entry['names']:
+                    continue
+                del self._entries[key]
+                for slot in entry['slots']:
+                    if not slot['in_use']:
+                        self._close(slot['client'])
+        logger.info(f'[ExchangeClientPool] 已失效客户端: name={name}')
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        with self._lock:
+            for (key, entry) in list(self._entries.items()):
+                for slot in list(entry['slots']):
+                    if not slot['in_use'] and slot['last_used'] < deadline:
+                        entry['slots'].remove(slot)
+                        self._close(slot['client'])
+                        logger.debug(f'[ExchangeClientPool] 关闭空闲客户端: {key[0]}')
+                if not entry['slots']:
+                    del self._entries[key]
+
+    @staticmethod
+    def _close(client):
+        try:
+            client.close()
+        except:
+            pass
 
-        elif platform == 'bybit':
-            # Bybit 提现
-            response = client.withdraw(
-                code=coin,
-                amount=amount,
-                address=to_address,
-                tag=None,
-                params=params
-            )
+    def stats(self):
+        with self._lock:
+            slots = [slot for entry in self._entries.values() for slot in entry['slots']]
+            return {
+                'accounts': len(self._entries),
+                'size': len(slots),
+                'in_use': sum(1 for slot in slots if slot['in_use']),
+                'idle_ttl': self.idle_ttl
+            }
 
-        else:
-            return {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
 
-        logger.info(f'[withdraw] 提现成功: {response}')
-        return {
-            'success': True,
-            'msg': '提现成功',
-            'data': {
-                'exchange': EXCHANGE_NAMES.get(platform, platform),
-                'txid': response.get('id', response.get('txid', '')),
-                'withdraw_id': response.get('id', ''),
-                'amount': amount,
-                'coin': coin,
-                'network': network,
-                'to_address': to_address,
-                'status': response.get('status', 'pending'),
-                'raw_response': response
-            }
+_client_pool = ExchangeClientPool(EXCHANGE_CLIENT_IDLE_TTL)
+
+
+def acquire_exchange_client(exchange_name, config):
+    '''
+    从客户端池借出交易所客户端（调用方独占，不可跨线程共享），用完需调用 release_exchange_client 归还
+    '''
+    return _client_pool.acquire(exchange_name, config)
+
+
+def release_exchange_client(client):
+    '''
+    归还交易所客户端
+    '''
+    _client_pool.release(client)
+
+
+def invalidate_exchange_clients(exchange_name=None):
+    '''
+    失效交易所客户端（交易所配置更新或删除时调用）
+    :param exchange_name: 交易所名称，为None时失效全部
+    '''
+    _client_pool.invalidate(exchange_name)
+
+
+def get_client_pool_stats():
+    '''
+    获取客户端池统计
+    :return: {"accounts": 账户数, "size": 客户端数, "in_use": 使用中数量, "idle_ttl": 空闲超时秒数}
+    '''
+    return _client_pool.stats()
+
+
+def build_withdraw_result(platform, response, to_address, network, coin, amount):
+    '''
+    组装提现成功结果（同步/异步实现共用）
+    '''
+    logger.info(f'[withdraw] 提现成功: {response}')
+    return {
+        'success': True,
+        'msg': '提现成功',
+        'data': {
+            'exchange': EXCHANGE_NAMES.get(platform, platform),
+            'txid': response.get('id', response.get('txid', '')),
+            'withdraw_id': response.get('id', ''),
+            'amount': amount,
+            'coin': coin,
+            'network': network,
+            'to_address': to_address,
+            'status': response.get('status', 'pending'),
+            'raw_response': response
         }
+    }
+
 
-    except ccxt.InsufficientFunds as e:
+def build_withdraw_unknown(exchange, to_address, network, coin, amount, reason):
+    '''
+    组装提现结果未知的结果：请求可能已被交易所受理，调用方不能当作失败直接重试
+    :param exchange: 交易所名称
+    :param reason: 原因（如 网络错误、等待超时）
+    '''
+    return {
+        'success': False,
+        'msg': f'{reason}，提现可能已提交，请先到交易所核实提现记录，切勿直接重试',
+        'data': {
+            'status': 'unknown',
+            'exchange': exchange,
+            'to_address': to_address,
+            'network': network,
+            'coin': coin,
+            'amount': amount
+        }
+    }
+
+
+def is_withdraw_unknown(result):
+    return bool(result.get('data')) and result['data'].get('status') == 'unknown'
+
+
+def build_withdraw_error(e, platform, to_address, network, coin, amount):
+    '''
+    组装提现失败结果（同步/异步实现共用，ccxt 异步版异常类型与同步版相同）
+    网络错误（含请求超时）时请求可能已到达交易所，返回结果未知
+    '''
+    if isinstance(e, ccxt.InsufficientFunds):
         logger.error(f'[withdraw] 余额不足: {e}')
         return {'success': False, 'msg': f'余额不足: {str(e)}', 'data': None}
-
-    except ccxt.NetworkError as e:
-        logger.error(f'[withdraw] 网络错误: {e}')
+    if isinstance(e, (ccxt.RateLimitExceeded, ccxt.InvalidNonce)):
+        # 交易所明确拒绝了请求
+        logger.error(f'[withdraw] 请求被拒绝: {e}')
         return {'success': False, 'msg': f'网络错误: {str(e)}', 'data': None}
-
-    except ccxt.ExchangeError as e:
+    if isinstance(e, ccxt.NetworkError):
+        logger.error(f'[withdraw] 网络错误，提现结果未知: {e}')
+        return build_withdraw_unknown(EXCHANGE_NAMES.get(platform, platform), to_address, network, coin, amount,
+                                      f'网络错误（{str(e)}）')
+    if isinstance(e, ccxt.ExchangeError):
         logger.error(f'[withdraw] 交易所错误: {e}')
         return {'success': False, 'msg': f'交易所错误: {str(e)}', 'data': None}
+    logger.error(f'[withdraw] 提现失败: {e}')
+    return {'success': False, 'msg': f'提现失败: {str(e)}', 'data': None}
 
-    except Exception as e:
-        logger.error(f'[withdraw] 提现失败: {e}')
-        return {'success': False, 'msg': f'提现失败: {str(e)}', 'data': None}
 
-    finally:
-        # 关闭连接
-        try:
-            client.close()
-        except:
-            pass
+def withdraw_with_client(client, platform, to_address, network, coin, amount):
+    '''
+    使用已创建的客户端执行提现
+    :param client: ccxt交易所对象
+    :param platform: 平台名称
+    :param to_address: 目标地址
+    :param network: 提现网络
+    :param coin: 代币符号
+    :param amount: 提现金额
+    :return: 提现结果
+    '''
+    try:
+        # CCXT withdraw 方法签名: withdraw(code, amount, address, tag=None, params={})
+        # network 参数需要通过 params 字典传递，键名为 'network'
+        # Binance, Bitget(必须提供 network), OKX, Gate, Bybit 调用方式一致，大部分代币不需要tag
+        params = {'network': network}
+
+        if platform not in EXCHANGE_MAP:
+            return {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
 
+        response = client.withdraw(
+            code=coin,
+            amount=amount,
+            address=to_address,
+            tag=None,
+            params=params
+        )
+        return build_withdraw_result(platform, response, to_address, network, coin, amount)
 
-def get_withdraw_fee(exchange_name, pwd, coin, network):
+    except Exception as e:
+        return build_withdraw_error(e, platform, to_address, network, coin, amount)
+
+
+def withdraw(exchange_name, pwd, to_address, network, coin, amount):
     '''
-    获取提现手续费
-    :param exchange_name: 交易所名称
+    交易所提现
+    :param exchange_name: 交易所名称（数据库中的name）
     :param pwd: 解密密钥
-    :param coin: 代币符号
+    :param to_address: 目标地址
     :param network: 提现网络
-    :return: 手续费信息
+    :param coin: 代币符号（如 USDT, ETH）
+    :param amount: 提现金额
+    :return: 提现结果
     '''
-    logger.info(f'[get_withdraw_fee] 查询手续费: exchange={exchange_name}, coin={coin}, network={network}')
+    logger.info(f'[withdraw] 开始提现: exchange={exchange_name}, to={to_address[:10]}..., network={network}, coin={coin}, amount={amount}')
 
-    # 1. 查询交易所信息
-    exchange_info = utils_db.queryExchangeByName(exchange_name)
-    if not exchange_info:
-        logger.error(f'[get_withdraw_fee] 未找到交易所: {exchange_name}')
-        return {'success': False, 'msg': f'未找到交易所: {exchange_name}', 'data': None}
+    # 1-2. 查询并解密交易所信息
+    config, error = load_exchange_config(exchange_name, pwd, 'withdraw')
+    if error:
+        return error
 
-    platform = exchange_info['platform'].lower()
-    if platform not in EXCHANGE_MAP:
-        logger.error(f'[get_withdraw_fee] 不支持的平台: {platform}')
-        return {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
+    # 3. 从客户端池获取交易所客户端
+    client = acquire_exchange_client(exchange_name, config)
+    if not client:
+        return {'success': False, 'msg': '创建交易所客户端失败', 'data': None}
 
-    # 2. 解密敏感信息
     try:
-        api_key = utils_encrypt.decrypt(exchange_info['apikey'], pwd) if exchange_info['apikey'] else None
-        secret = utils_encrypt.decrypt(exchange_info['secret'], pwd) if exchange_info['secret'] else None
-        password = utils_encrypt.decrypt(exchange_info['password'], pwd) if exchange_info['password'] else None
+        # 4. 执行提现
+        return withdraw_with_client(client, config['platform'], to_address, network, coin, amount)
 
-        if not api_key or not secret:
-            logger.error(f'[get_withdraw_fee] API密钥或密钥为空')
-            return {'success': False, 'msg': 'API密钥配置不完整', 'data': None}
+    finally:
+        # 归还客户端，连接保留复用
+        release_exchange_client(client)
 
-    except Exception as e:
-        logger.error(f'[get_withdraw_fee] 解密失败: {e}')
-        return {'success': False, 'msg': '解密失败', 'data': None}
 
-    # 3. 创建交易所客户端
-    proxy_ip = exchange_info.get('ip')
-    client = get_exchange_client(platform, api_key, secret, password, proxy_ip)
-    if not client:
-        return {'success': False, 'msg': '创建交易所客户端失败', 'data': None}
+def _validate_withdraw_item(item, interval):
+    '''
+    校验单笔提现参数（在任何提现执行前完成）
+    :param item: {"exchange", "toAddress", "network", "coin", "amount", "interval"(可选)}
+    :param interval: 默认等待秒数
+    :return: (等待秒数, 错误信息)，校验通过时错误信息为None
+    '''
+    if not isinstance(item, dict):
+        return None, '提现参数格式错误'
+    for field in ('exchange', 'toAddress', 'coin'):
+        if not isinstance(item.get(field), str) or not item[field].strip():
+            return None, f'提现参数不完整: {field}'
+    if item.get('network') is not None and not isinstance(item['network'], str):
+        return None, '提现网络格式错误'
+    try:
+        if float(item.get('amount')) <= 0:
+            return None, '提现金额必须大于0'
+    except (TypeError, ValueError):
+        return None, '提现金额格式错误'
+    delay = item.get('interval', interval)
+    try:
+        delay = float(delay) if delay else 0
+    except (TypeError, ValueError):
+        return None, '等待间隔格式错误'
+    if delay < 0:
+        return None, '等待间隔不能为负数'
+    return delay, None
+
 
+def withdraw_batch(pwd, items, concurrency=None, interval=None, progress=None):
+    '''
+    批量提现：交易所之间并行，交易所内按并发数和限速执行
+    所有参数在第一笔提现前校验完毕；单笔出错只影响该笔，不会中断整批
+    并发数大于1时每个并发借用独立的客户端（ccxt 同步客户端非线程安全）
+    :param pwd: 解密密钥
+    :param items: [{"exchange", "toAddress", "network", "coin", "amount", "interval"(可选)}, ...]
+    :param concurrency: 每个交易所的并发数，默认 WITHDRAW_BATCH_CONCURRENCY
+    :param interval: 每笔完成后的默认等待秒数（单笔 interval 优先）
+    :param progress: 进度回调 progress(stats)，每笔完成后调用；结果未知（data.status=unknown）的单独计入 unknown
+    :return: [{"index", "success", "msg", "data"}, ...]，与 items 顺序一致
+    '''
     try:
-        # 4. 查询提现费用
-        if platform == 'binance':
-            # Binance 需要查询网络信息
-            networks = client.fetch_networks(coin)
-            if network in networks:
-                network_info = networks[network]
-                return {
-                    'success': True,
-                    'data': {
-                        'coin': coin,
-                        'network': network,
-                        'fee': network_info.get('withdrawFee', 'N/A'),
-                        'min_withdraw': network_info.get('withdrawMin', 'N/A'),
-                        'enabled': network_info.get('enabled', False)
-                    }
-                }
+        concurrency = max(1, int(concurrency or WITHDRAW_BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        concurrency = WITHDRAW_BATCH_CONCURRENCY
+    items = items if isinstance(items, list) else []
+    logger.info(f'[withdraw_batch] 批量提现: 数量={len(items)}, concurrency={concurrency}, interval={interval}')
+
+    results = [None] * len(items)
+    stats = {'total': 0, 'success': 0, 'failed': 0, 'unknown': 0}
+    stats_lock = threading.Lock()
+
+    def finish(index, result):
+        results[index] = {'index': index, **result}
+        with stats_lock:
+            stats['total'] += 1
+            if result['success']:
+                stats['success'] += 1
             else:
-                return {'success': False, 'msg': f'未找到网络: {network}', 'data': None}
-
-        elif platform == 'bitget':
-            # Bitget 查询币种信息
-            currencies = client.fetch_currencies()
-            if coin in currencies:
-                currency = currencies[coin]
-                networks = currency.get('networks', {})
-                if network in networks:
-                    network_info = networks[network]
-                    return {
-                        'success': True,
-                        'data': {
-                            'coin': coin,
-                            'network': network,
-                            'fee': network_info.get('fee', 'N/A'),
-                            'min_withdraw': network_info.get('limits', {}).get('withdraw', {}).get('min', 'N/A')
-                        }
-                    }
-                else:
-                    return {'success': False, 'msg': f'未找到网络: {network}', 'data': None}
+                stats['unknown' if is_withdraw_unknown(result) else 'failed'] += 1
+            snapshot = dict(stats)
+        if progress:
+            # 进度回调失败不能影响已执行提现的结果
+            try:
+                progress(snapshot)
+            except Exception as e:
+                logger.warning(f'[withdraw_batch] 进度回调失败: {e}')
+
+    # 1. 先校验全部参数
+    groups = {}
+    for (index, item) in enumerate(items):
+        delay, error = _validate_withdraw_item(item, interval)
+        if error:
+            finish(index, {'success': False, 'msg': error, 'data': None})
+            continue
+        groups.setdefault(item['exchange'], []).append((index, item, delay))
+
+    def run_item(exchange_name, config, limiter, index, item, delay, last_index):
+        try:
+            limiter.wait()
+            logger.info(f'[withdraw_batch] {exchange_name} 第 {index} 笔: to={item["toAddress"][:10]}..., '
+                        f'coin={item["coin"]}, amount={item["amount"]}')
+            client = acquire_exchange_client(exchange_name, config)
+            if not client:
+                result = {'success': False, 'msg': '创建交易所客户端失败', 'data': None}
             else:
-                return {'success': False, 'msg': f'未找到币种: {coin}', 'data': None}
+                try:
+                    result = withdraw_with_client(client, config['platform'], item['toAddress'],
+                                                  item.get('network'), item['coin'], item['amount'])
+                finally:
+                    release_exchange_client(client)
+        except Exception as e:
+            logger.error(f'[withdraw_batch] {exchange_name} 第 {index} 笔执行异常: {e}')
+            result = {'success': False, 'msg': f'提现失败: {str(e)}', 'data': None}
+        finish(index, result)
+        if delay and index != last_index:
+            time.sleep(delay)
+
+    def run_group(exchange_name, group):
+        try:
+            config, error = load_exchange_config(exchange_name, pwd, 'withdraw_batch')
+        except Exception as e:
+            logger.error(f'[withdraw_batch] 读取 {exchange_name} 配置失败: {e}')
+            config, error = None, {'success': False, 'msg': f'读取交易所配置失败: {str(e)}', 'data': None}
+        if error:
+            for (index, _, _) in group:
+                finish(index, error)
+            return
+
+        limiter = RateLimiter(WITHDRAW_BATCH_MIN_INTERVAL)
+        last_index = group[-1][0]
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(group))) as executor:
+            list(executor.map(lambda entry: run_item(exchange_name, config, limiter, *entry, last_index), group))
+
+    # 2. 执行提现
+    if groups:
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            list(executor.map(lambda pair: run_group(*pair), groups.items()))
+
+    logger.info(f'[withdraw_batch] 批量提现完成: 成功={stats["success"]}, 失败={stats["failed"]}, '
+                f'结果未知={stats["unknown"]}')
+    return results
+
+
+class CurrencyMetadataCache:
+    '''
+    按平台缓存币种/网络元数据（fetch_currencies 结果），同平台的多个账户共享
+    超过 refresh_after 秒后台刷新并继续返回旧数据，超过 ttl 秒同步重新加载
+    '''
 
-        elif platform == 'okx':
-            # OKX 查询币种信息
-            currencies = client.fetch_currencies()
-            if coin in currencies:
-                currency = currencies[coin]
-                networks = currency.get('networks', {})
-                for net_code, network_info in networks.items():
-                    if network.upper() in net_code.upper():
-                        return {
-                            'success': True,
-                            'data': {
-                                'coin': coin,
-                                'network': network,
-                                'fee': network_info.get('fee', 'N/A'),
-                                'min_withdraw': network_info.get('limits', {}).get('withdraw', {}).get('min', 'N/A')
-                            }
-                        }
-                return {'success': False, 'msg': f'未找到网络: {network}', 'data': None}
-            else:
-                return {'success': False, 'msg': f'未找到币种: {coin}', 'data': None}
+    def __init__(self, ttl, refresh_after):
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, platform, loader):
+        '''
+        获取平台币种元数据
+        :param platform: 平台名称
+        :param loader: 无参加载函数，返回 fetch_currencies 结果
+        :return: {coin: currency}
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(platform)
+            age = now - entry['loaded_at'] if entry else None
+            if entry and age < self.ttl:
+                self.hits += 1
+                if age >= self.refresh_after and platform not in self._refreshing:
+                    self._refreshing.add(platform)
+                    threading.Thread(target=self._refresh, args=(platform, loader), daemon=True).start()
+                return entry['currencies']
+            self.misses += 1
 
-        elif platform == 'gate':
-            # Gate 查询币种信息
-            currencies = client.fetch_currencies()
-            if coin in currencies:
-                currency = currencies[coin]
-                networks = currency.get('networks', {})
-                if network in networks:
-                    network_info = networks[network]
-                    return {
-                        'success': True,
-                        'data': {
-                            'coin': coin,
-                            'network': network,
-                            'fee': network_info.get('fee', 'N/A'),
-                            'min_withdraw': network_info.get('limits', {}).get('withdraw', {}).get('min', 'N/A')
-                        }
-                    }
-                else:
-                    return {'success': False, 'msg': f'未找到网络: {network}', 'data': None}
+        try:
+            return self._load(platform, loader)
+        except Exception:
+            if entry:
+                logger.warning(f'[CurrencyMetadataCache] {platform} 重新加载失败，使用过期数据')
+                return entry['currencies']
+            raise
+
+    def _load(self, platform, loader):
+        currencies = loader()
+        with self._lock:
+            self._entries[platform] = {'currencies': currencies, 'loaded_at': time.monotonic()}
+        logger.info(f'[CurrencyMetadataCache] 已加载 {platform} 币种元数据: {len(currencies)} 个币种')
+        return currencies
+
+    def _refresh(self, platform, loader):
+        try:
+            self._load(platform, loader)
+        except Exception as e:
+            logger.error(f'[CurrencyMetadataCache] 后台刷新 {platform} 失败: {e}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(platform)
+
+    def invalidate(self, platform=None):
+        with self._lock:
+            if platform is None:
+                self._entries.clear()
             else:
-                return {'success': False, 'msg': f'未找到币种: {coin}', 'data': None}
+                self._entries.pop(platform, None)
 
-        elif platform == 'bybit':
-            # Bybit 查询币种信息
-            currencies = client.fetch_currencies()
-            if coin in currencies:
-                currency = currencies[coin]
-                networks = currency.get('networks', {})
-                for net_code, network_info in networks.items():
-                    if network.upper() in net_code.upper():
-                        return {
-                            'success': True,
-                            'data': {
-                                'coin': coin,
-                                'network': network,
-                                'fee': network_info.get('fee', 'N/A'),
-                                'min_withdraw': network_info.get('limits', {}).get('withdraw', {}).get('min', 'N/A')
-                            }
-                        }
-                return {'success': False, 'msg': f'未找到网络: {network}', 'data': None}
-            else:
-                return {'success': False, 'msg': f'未找到币种: {coin}', 'data': None}
+    def stats(self):
+        with self._lock:
+            return {
+                'name': 'currency',
+                'size': len(self._entries),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
 
-        else:
-            return {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
 
-    except Exception as e:
-        logger.error(f'[get_withdraw_fee] 查询失败: {e}')
-        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+_currency_cache = CurrencyMetadataCache(CURRENCY_CACHE_TTL, CURRENCY_CACHE_REFRESH_AFTER)
+
+
+def get_currency_cache_stats():
+    '''
+    获取币种元数据缓存统计
+    '''
+    return _currency_cache.stats()
 
+
+def _load_currencies(exchange_name, config):
+    '''
+    通过客户端池拉取平台全部币种元数据
+    '''
+    client = acquire_exchange_client(exchange_name, config)
+    if not client:
+        raise RuntimeError('创建交易所客户端失败')
+    try:
+        return client.fetch_currencies()
     finally:
+        release_exchange_client(client)
+
+
+def lookup_withdraw_fee(platform, currencies, coin, network):
+    '''
+    从币种元数据中查找提现手续费（纯内存查找）
+    :param platform: 平台名称
+    :param currencies: fetch_currencies 结果
+    :param coin: 代币符号
+    :param network: 提现网络（必填）
+    :return: 手续费信息
+    '''
+    if not network:
+        return {'success': False, 'msg': '提现网络不能为空', 'data': None}
+    if coin not in currencies:
+        return {'success': False, 'msg': f'未找到币种: {coin}', 'data': None}
+
+    networks = currencies[coin].get('networks', {}) or {}
+    network_info = networks.get(network)
+    if network_info is None and platform in ('okx', 'bybit'):
+        # OKX / Bybit 的网络代码带前缀，先按忽略大小写完全匹配，再按包含关系匹配
+        candidates = [info for (net_code, info) in networks.items() if net_code.upper() == network.upper()] or \
+                     [info for (net_code, info) in networks.items() if network.upper() in net_code.upper()]
+        network_info = candidates[0] if candidates else None
+
+    if network_info is None:
+        return {'success': False, 'msg': f'未找到网络: {network}', 'data': None}
+
+    limits = (network_info.get('limits') or {}).get('withdraw') or {}
+    data = {
+        'coin': coin,
+        'network': network,
+        'fee': network_info.get('fee') if network_info.get('fee') is not None else 'N/A',
+        'min_withdraw': limits.get('min') if limits.get('min') is not None else 'N/A'
+    }
+    if platform == 'binance':
+        data['enabled'] = network_info.get('withdraw', network_info.get('active', False))
+    return {'success': True, 'data': data}
+
+
+def lookup_withdraw_fees(platform, currencies, pairs):
+    '''
+    批量查找手续费（同步/异步实现共用），单对元数据格式异常时返回该对失败而不是抛出
+    :param pairs: [{"coin", "network"}, ...]
+    :return: 与 pairs 顺序一致的查询结果
+    '''
+    results = []
+    for pair in pairs:
+        pair = pair if isinstance(pair, dict) else {}
         try:
-            client.close()
-        except:
-            pass
+            results.append(lookup_withdraw_fee(platform, currencies, pair.get('coin'), pair.get('network') or ''))
+        except Exception as e:
+            logger.error(f'[lookup_withdraw_fees] 解析手续费失败: {pair}, 错误: {e}')
+            results.append({'success': False, 'msg': f'解析手续费失败: {str(e)}', 'data': None})
+    return results
 
 
-def get_balance(exchange_name, pwd, coin=None):
+def get_withdraw_fees(exchange_name, pwd, pairs):
     '''
-    获取交易所账户余额
+    批量获取提现手续费（同平台共享缓存的币种元数据）
     :param exchange_name: 交易所名称
     :param pwd: 解密密钥
+    :param pairs: [{"coin": "USDT", "network": "BSC"}, ...]
+    :return: {'success', 'msg', 'data': [每对的查询结果]}
+    '''
+    logger.info(f'[get_withdraw_fees] 批量查询手续费: exchange={exchange_name}, 数量={len(pairs)}')
+
+    # 1-2. 查询并解密交易所信息
+    config, error = load_exchange_config(exchange_name, pwd, 'get_withdraw_fees')
+    if error:
+        return error
+    platform = config['platform']
+
+    # 3. 读取缓存的币种元数据（未命中时通过客户端池拉取）
+    try:
+        currencies = _currency_cache.get(platform, lambda: _load_currencies(exchange_name, config))
+    except Exception as e:
+        logger.error(f'[get_withdraw_fees] 查询失败: {e}')
+        return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+
+    # 4. 内存中查找每对手续费
+    results = lookup_withdraw_fees(platform, currencies, pairs)
+    return {'success': True, 'msg': 'ok', 'data': results}
+
+
+def get_withdraw_fee(exchange_name, pwd, coin, network):
+    '''
+    获取提现手续费
+    :param exchange_name: 交易所名称
+    :param pwd: 解密密钥
+    :param coin: 代币符号
+    :param network: 提现网络
+    :return: 手续费信息
+    '''
+    logger.info(f'[get_withdraw_fee] 查询手续费: exchange={exchange_name}, coin={coin}, network={network}')
+
+    result = get_withdraw_fees(exchange_name, pwd, [{'coin': coin, 'network': network}])
+    if not result['success']:
+        return result
+    return result['data'][0]
+
+
+def build_balance_result(balances, coin=None):
+    '''
+    将 fetch_balance 结果整理为接口返回格式（同步/异步实现共用）
+    :param balances: fetch_balance 结果
     :param coin: 代币符号（可选，不传则返回所有）
     :return: 余额信息
     '''
-    logger.info(f'[get_balance] 查询余额: exchange={exchange_name}, coin={coin}')
+    if coin:
+        # 返回指定币种余额
+        if coin in balances.get('free', {}) or coin in balances.get('used', {}):
+            free = balances.get('free', {}).get(coin, 0)
+            used = balances.get('used', {}).get(coin, 0)
+            total = free + used
+            return {
+                'success': True,
+                'data': {
+                    'coin': coin,
+                    'free': free,
+                    'used': used,
+                    'total': total
+                }
+            }
+        else:
+            return {
+                'success': True,
+                'data': {
+                    'coin': coin,
+                    'free': 0,
+                    'used': 0,
+                    'total': 0
+                }
+            }
+    else:
+        # 返回所有余额
+        result = []
+        for currency, balance in balances.get('total', {}).items():
+            if balance and balance > 0:
+                result.append({
+                    'coin': currency,
+                    'total': balance,
+                    'free': balances.get('free', {}).get(currency, 0),
+                    'used': balances.get('used', {}).get(currency, 0)
+                })
+        return {
+            'success': True,
+            'data': result
+        }
 
-    # 1. 查询交易所信息
-    exchange_info = utils_db.queryExchangeByName(exchange_name)
-    if not exchange_info:
-        logger.error(f'[get_balance] 未找到交易所: {exchange_name}')
-        return {'success': False, 'msg': f'未找到交易所: {exchange_name}', 'data': None}
 
-    platform = exchange_info['platform'].lower()
-    if platform not in EXCHANGE_MAP:
-        logger.error(f'[get_balance] 不支持的平台: {platform}')
-        return {'success': False, 'msg': f'不支持的平台: {platform}', 'data': None}
+def merge_balances(exchange_names, results, elapsed):
+    '''
+    合并多个账户的余额结果（同步/异步实现共用）
+    :param exchange_names: 交易所名称列表
+    :param results: 与 exchange_names 对应的 get_balance 结果，超时为None
+    :param elapsed: 耗时（秒）
+    :return: {"coins": [按币种汇总], "accounts": [每个账户明细], "elapsed": 耗时}
+    '''
+    accounts = []
+    coins = {}
+    for (name, result) in zip(exchange_names, results):
+        if result is None:
+            accounts.append({'exchange': name, 'success': False, 'msg': '查询超时', 'balances': []})
+            continue
+        if not result['success']:
+            accounts.append({'exchange': name, 'success': False, 'msg': result['msg'], 'balances': []})
+            continue
+
+        balances = result['data'] if isinstance(result['data'], list) else [result['data']]
+        accounts.append({'exchange': name, 'success': True, 'msg': 'ok', 'balances': balances})
+        for balance in balances:
+            merged = coins.setdefault(balance['coin'], {
+                'coin': balance['coin'], 'free': 0, 'used': 0, 'total': 0, 'exchanges': []
+            })
+            merged['free'] += balance.get('free') or 0
+            merged['used'] += balance.get('used') or 0
+            merged['total'] += balance.get('total') or 0
+            if balance.get('total'):
+                merged['exchanges'].append(name)
 
-    # 2. 解密敏感信息
-    try:
-        api_key = utils_encrypt.decrypt(exchange_info['apikey'], pwd) if exchange_info['apikey'] else None
-        secret = utils_encrypt.decrypt(exchange_info['secret'], pwd) if exchange_info['secret'] else None
-        password = utils_encrypt.decrypt(exchange_info['password'], pwd) if exchange_info['password'] else None
+    failed = sum(1 for account in accounts if not account['success'])
+    logger.info(f'[merge_balances] 查询完成: 成功={len(accounts) - failed}, 失败={failed}, 耗时={elapsed}s')
+    return {
+        'coins': sorted(coins.values(), key=lambda item: item['coin']),
+        'accounts': accounts,
+        'elapsed': elapsed
+    }
 
-        if not api_key or not secret:
-            logger.error(f'[get_balance] API密钥或密钥为空')
-            return {'success': False, 'msg': 'API密钥配置不完整', 'data': None}
 
-    except Exception as e:
-        logger.error(f'[get_balance] 解密失败: {e}')
-        return {'success': False, 'msg': '解密失败', 'data': None}
+def get_balance(exchange_name, pwd, coin=None):
+    '''
+    获取交易所账户余额
+    :param exchange_name: 交易所名称
+    :param pwd: 解密密钥
+    :param coin: 代币符号（可选，不传则返回所有）
+    :return: 余额信息
+    '''
+    logger.info(f'[get_balance] 查询余额: exchange={exchange_name}, coin={coin}')
+
+    # 1-2. 查询并解密交易所信息
+    config, error = load_exchange_config(exchange_name, pwd, 'get_balance')
+    if error:
+        return error
 
-    # 3. 创建交易所客户端
-    proxy_ip = exchange_info.get('ip')
-    client = get_exchange_client(platform, api_key, secret, password, proxy_ip)
+    # 3. 从客户端池获取交易所客户端
+    client = acquire_exchange_client(exchange_name, config)
     if not client:
         return {'success': False, 'msg': '创建交易所客户端失败', 'data': None}
 
     try:
         # 4. 查询余额
-        balances = client.fetch_balance()
-
-        if coin:
-            # 返回指定币种余额
-            if coin in balances.get('free', {}) or coin in balances.get('used', {}):
-                free = balances.get('free', {}).get(coin, 0)
-                used = balances.get('used', {}).get(coin, 0)
-                total = free + used
-                return {
-                    'success': True,
-                    'data': {
-                        'coin': coin,
-                        'free': free,
-                        'used': used,
-                        'total': total
-                    }
-                }
-            else:
-                return {
-                    'success': True,
-                    'data': {
-                        'coin': coin,
-                        'free': 0,
-                        'used': 0,
-                        'total': 0
-                    }
-                }
-        else:
-            # 返回所有余额
-            result = []
-            for currency, balance in balances.get('total', {}).items():
-                if balance and balance > 0:
-                    result.append({
-                        'coin': currency,
-                        'total': balance,
-                        'free': balances.get('free', {}).get(currency, 0),
-                        'used': balances.get('used', {}).get(currency, 0)
-                    })
-            return {
-                'success': True,
-                'data': result
-            }
+        return build_balance_result(client.fetch_balance(), coin)
 
     except Exception as e:
         logger.error(f'[get_balance] 查询失败: {e}')
         return {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
 
     finally:
-        try:
-            client.close()
-        except:
-            pass
+        release_exchange_client(client)
+
+
+_balance_executor = None
+_balance_executor_lock = threading.Lock()
+
+
+def _get_balance_executor():
+    global _balance_executor
+    with _balance_executor_lock:
+        if _balance_executor is None:
+            _balance_executor = ThreadPoolExecutor(max_workers=BALANCE_FETCH_WORKERS,
+                                                   thread_name_prefix='exchange-balance')
+        return _balance_executor
+
+
+def get_balances(pwd, exchange_names=None, coin=None, timeout=None):
+    '''
+    并发查询多个交易所账户余额并按币种汇总，总耗时约等于最慢的账户
+    超时从每个账户开始执行时计算（不含在共享线程池中排队的时间）；
+    排队超过 timeout 仍未开始的账户直接取消，不会在返回后继续执行
+    :param pwd: 解密密钥
+    :param exchange_names: 交易所名称列表，为空时查询全部账户
+    :param coin: 代币符号（可选，不传则返回所有）
+    :param timeout: 单账户超时秒数，默认 BALANCE_FETCH_TIMEOUT
+    :return: {'success', 'msg', 'data': {"coins": [按币种汇总], "accounts": [每个账户明细]}}
+    '''
+    timeout = float(timeout or BALANCE_FETCH_TIMEOUT)
+    if not exchange_names:
+        exchange_names = [item['name'] for item in utils_db.queryAllExchangeNames()]
+    # 去重并保持顺序
+    exchange_names = list(dict.fromkeys(exchange_names))
+    logger.info(f'[get_balances] 并发查询余额: 账户数={len(exchange_names)}, coin={coin}, timeout={timeout}')
+
+    executor = _get_balance_executor()
+    started = time.monotonic()
+    begins = {}
+
+    def run(name):
+        begins[name] = time.monotonic()
+        return get_balance(name, pwd, coin)
+
+    futures = {executor.submit(run, name): name for name in exchange_names}
+    results = {}
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        deadlines = {}
+        for future in list(pending):
+            name = futures[future]
+            begin = begins.get(name)
+            deadline = begin + timeout if begin is not None else started + timeout
+            if deadline > now:
+                deadlines[future] = deadline
+            elif begin is None and future.cancel():
+                logger.warning(f'[get_balances] {name} 排队超时，已取消')
+                results[name] = {'success': False, 'msg': '排队超时，未执行', 'data': None}
+                pending.discard(future)
+            elif begin is not None:
+                # 超时的查询在后台继续执行完毕后归还客户端，结果丢弃
+                logger.warning(f'[get_balances] {name} 查询超时')
+                results[name] = None
+                pending.discard(future)
+            else:
+                # 取消失败说明刚开始执行，下一轮按开始时间计算超时
+                deadlines[future] = now + 0.01
+        if not pending:
+            break
+        done, _ = wait(pending, timeout=max(0.0, min(deadlines.values()) - time.monotonic()),
+                       return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = {'success': False, 'msg': f'查询失败: {str(e)}', 'data': None}
+
+    elapsed = round(time.monotonic() - started, 3)
+    return {'success': True, 'msg': 'ok',
+            'data': merge_balances(exchange_names, [results[name] for name in exchange_names], elapsed)}
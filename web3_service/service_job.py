@@ -0,0 +1,197 @@
+# coding:utf-8
+'''
+Description: 后台任务服务 - 批量创建/导入等耗时操作异步执行
+任务状态持久化在 job 表，任务分发通过可替换的队列后端（默认进程内队列）
+'''
+
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import uuid
+
+import service_chain_transfer
+import service_exchange_withdraw
+import service_wallet
+import utils_db
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# 任务执行线程数
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# 任务队列后端
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'local')
+
+
+class LocalJobQueue:
+    '''
+    进程内任务队列
+    任务参数（含解密后的pwd）只保存在内存中，不写入数据库
+    '''
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, task):
+        self._queue.put(task)
+
+    def get(self):
+        return self._queue.get()
+
+
+# 队列后端注册表，可通过 registerQueueBackend 扩展（如 Redis）
+_QUEUE_BACKENDS = {
+    'local': LocalJobQueue,
+}
+
+# 任务类型 -> 处理函数 handler(params, progress)
+_handlers = {}
+
+_queue = None
+_workers = []
+_lock = threading.Lock()
+
+
+def registerQueueBackend(name, backendClass):
+    '''
+    注册队列后端
+    :param name: 后端名称（JOB_QUEUE_BACKEND 取值）
+    :param backendClass: 实现 put(task) / get() 的类
+    '''
+    _QUEUE_BACKENDS[name] = backendClass
+
+
+def registerHandler(jobType, handler):
+    '''
+    注册任务处理函数
+    :param jobType: 任务类型
+    :param handler: handler(params, progress) -> 可JSON序列化的结果
+    '''
+    _handlers[jobType] = handler
+
+
+def _getQueue():
+    global _queue
+    with _lock:
+        if _queue is None:
+            if JOB_QUEUE_BACKEND not in _QUEUE_BACKENDS:
+                raise ValueError(f'不支持的任务队列后端: {JOB_QUEUE_BACKEND}')
+            _queue = _QUEUE_BACKENDS[JOB_QUEUE_BACKEND]()
+            for i in range(JOB_WORKERS):
+                worker = threading.Thread(target=_workerLoop, name=f'job-worker-{i}', daemon=True)
+                worker.start()
+                _workers.append(worker)
+            logger.info(f'[_getQueue] 任务队列已启动: backend={JOB_QUEUE_BACKEND}, workers={JOB_WORKERS}')
+    return _queue
+
+
+def _workerLoop():
+    while True:
+        task = _queue.get()
+        _runTask(task)
+
+
+def _runTask(task):
+    jobId = task['id']
+    jobType = task['type']
+    logger.info(f'[_runTask] 开始执行任务: id={jobId}, type={jobType}')
+    utils_db.updateJob(jobId, status='running')
+
+    def progress(stats):
+        utils_db.updateJob(jobId, processed=stats.get('total', 0),
+                           progress=json.dumps(stats, ensure_ascii=False))
+
+    try:
+        result = _handlers[jobType](task['params'], progress)
+        utils_db.updateJob(jobId, status='success', result=json.dumps(result, ensure_ascii=False))
+        logger.info(f'[_runTask] 任务完成: id={jobId}')
+    except Exception as e:
+        logger.error(f'[_runTask] 任务失败: id={jobId}, 错误: {e}')
+        try:
+            utils_db.updateJob(jobId, status='failed', error=str(e))
+        except Exception:
+            pass
+
+
+def submitJob(jobType, params, total=None):
+    '''
+    提交任务，立即返回任务id
+    :param jobType: 任务类型
+    :param params: 任务参数
+    :param total: 总数（可选，用于展示进度）
+    :return: 任务id
+    '''
+    if jobType not in _handlers:
+        raise ValueError(f'未知任务类型: {jobType}')
+
+    jobId = uuid.uuid4().hex
+    utils_db.insertJob(jobId, jobType, total)
+    _getQueue().put({'id': jobId, 'type': jobType, 'params': params})
+    logger.info(f'[submitJob] 任务已提交: id={jobId}, type={jobType}, total={total}')
+    return jobId
+
+
+def getJob(jobId):
+    '''
+    查询任务状态
+    :param jobId: 任务id
+    :return: 任务信息或None
+    '''
+    return utils_db.queryJob(jobId)
+
+
+def recoverJobs():
+    '''
+    启动时处理上次未完成的任务（进程内队列随进程退出丢失）
+    '''
+    if JOB_QUEUE_BACKEND == 'local':
+        utils_db.failUnfinishedJobs('服务重启，任务中断')
+
+
+# ==================== 任务处理函数 ====================
+
+def _createWalletHandler(params, progress):
+    result = service_wallet.createWalletList(params['type'], params['number'], params['project'], params['remark'],
+                                             params['pwd'], workers=params.get('workers'), hd=params.get('hd', False),
+                                             progress=progress)
+    if result is False:
+        raise ValueError(f'未知钱包类型: {params["type"]}')
+    return result
+
+
+def _insertWalletHandler(params, progress):
+    return service_wallet.importWallets(params['walletList'], params['project'], params['remark'],
+                                        params['pwd'], progress=progress)
+
+
+def _importMappingHandler(params, progress):
+    return service_wallet.batchImportWalletMapping(params['mappingList'], params['project'], params['remark'])
+
+
+def _withdrawBatchHandler(params, progress):
+    return service_exchange_withdraw.withdraw_batch(params['pwd'], params['items'], params.get('concurrency'),
+                                                    params.get('interval'), progress=progress)
+
+
+def _evmTransferBatchHandler(params, progress):
+    result = service_chain_transfer.batchTransfer(progress=progress, **params)
+    if not result['success']:
+        raise ValueError(result['msg'])
+    return result['data']
+
+
+registerHandler('wallet_create', _createWalletHandler)
+registerHandler('wallet_insert', _insertWalletHandler)
+registerHandler('mapping_import', _importMappingHandler)
+registerHandler('exchange_withdraw_batch', _withdrawBatchHandler)
+registerHandler('evm_transfer_batch', _evmTransferBatchHandler)
@@ -8,7 +8,13 @@ import json
 import logging
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 
+import service_chain_evm
+import service_exchange_async
+import service_exchange_withdraw
 import utils_db
 import utils_encrypt
 import utils_wallet_evm
@@ -26,6 +32,32 @@ if sys.platform == 'win32':
     handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
     logger.addHandler(handler)
 
+# 钱包批量解密/加密的线程池配置（pycryptodome在AES运算时会释放GIL）
+WALLET_CRYPTO_WORKERS = int(os.getenv('WALLET_CRYPTO_WORKERS', str(os.cpu_count() or 4)))
+WALLET_CRYPTO_CHUNK_SIZE = int(os.getenv('WALLET_CRYPTO_CHUNK_SIZE', '500'))
+
+# 钱包导入每块数量（每块一个事务，控制 IN 列表和 INSERT 包大小）
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+
+# 钱包分页查询每页最大数量
+WALLET_PAGE_MAX_SIZE = int(os.getenv('WALLET_PAGE_MAX_SIZE', '1000'))
+
+_crypto_executor = None
+_crypto_executor_lock = threading.Lock()
+
+
+def _getCryptoExecutor():
+    '''
+    获取进程内共享的加解密线程池
+    '''
+    global _crypto_executor
+    if _crypto_executor is None:
+        with _crypto_executor_lock:
+            if _crypto_executor is None:
+                _crypto_executor = ThreadPoolExecutor(max_workers=WALLET_CRYPTO_WORKERS,
+                                                      thread_name_prefix='wallet-crypto')
+    return _crypto_executor
+
 
 def getWalletProjects():
     '''
@@ -62,35 +94,120 @@ def walletList(address, project, pwd):
     result = utils_db.queryWalletByAddressOrProject(address, project)
     logger.info(f'[walletList] 数据库查询到 {len(result)} 个钱包')
     
-    resultList = []
-
-    for wallet in result:
-        try:
-            # 先用pwd解密，再用PWD_DECRYPT_KEY加密传输
-            logger.debug(f'[walletList] 解密钱包: {wallet.address[:10]}...')
-            decrypted_private_key = utils_encrypt.decrypt(wallet.private_key, pwd)
-            decrypted_phrase = utils_encrypt.decrypt(wallet.phrase, pwd)
-            
-            encrypted_private_key = utils_encrypt.encrypt_private_key(decrypted_private_key)
-            encrypted_phrase = utils_encrypt.encrypt_private_key(decrypted_phrase)
-            
-            resultList.append({
-                "index": wallet.index,
-                "address": wallet.address,
-                "publicKey": wallet.public_key,
-                "privateKey": encrypted_private_key,
-                "phrase": encrypted_phrase,
-                "project": wallet.project,
-                "remark": wallet.remark
-            })
-        except Exception as e:
-            logger.error(f'[walletList] 处理钱包失败: {wallet.address}, 错误: {e}')
-            continue
+    resultList = batchConvertWallets(result, pwd)
 
     logger.info(f'[walletList] 返回 {len(resultList)} 个钱包')
     return resultList
 
 
+def walletPage(address, project, pwd, pageSize, cursor=None):
+    '''
+    分页获取钱包列表
+    :param address:
+    :param project:
+    :param pwd: 解密密钥
+    :param pageSize: 每页数量（不超过 WALLET_PAGE_MAX_SIZE）
+    :param cursor: 上一页返回的nextCursor，首页不传
+    :return: {"list": [...], "nextCursor": "xxx" or None, "total": 总数}
+    '''
+    pageSize = max(1, min(int(pageSize), WALLET_PAGE_MAX_SIZE))
+    logger.info(f'[walletPage] 分页查询钱包: address={address}, project={project}, pageSize={pageSize}')
+
+    if address is None and project is None:
+        logger.warning('[walletPage] address和project都为空')
+        return {"list": [], "nextCursor": None, "total": 0}
+
+    result, nextCursor, total = utils_db.queryWalletPageByAddressOrProject(address, project, pageSize, cursor)
+    resultList = batchConvertWallets(result, pwd)
+
+    logger.info(f'[walletPage] 返回 {len(resultList)} 个钱包，总数: {total}')
+    return {"list": resultList, "nextCursor": nextCursor, "total": total}
+
+
+def walletListStream(address, project, pwd):
+    '''
+    流式获取钱包列表，逐个读取、逐个转换
+    :param address:
+    :param project:
+    :param pwd: 解密密钥
+    :return: 钱包信息生成器
+    '''
+    logger.info(f'[walletListStream] 流式查询钱包: address={address}, project={project}')
+
+    if address is None and project is None:
+        logger.warning('[walletListStream] address和project都为空')
+        return
+
+    count = 0
+    for wallet in utils_db.iterWalletByAddressOrProject(address, project):
+        item = convertWallet(wallet, pwd)
+        if item is None:
+            continue
+        count += 1
+        yield item
+
+    logger.info(f'[walletListStream] 返回 {count} 个钱包')
+
+
+def convertWallet(wallet, pwd):
+    '''
+    转换单个钱包：先用pwd解密，再用PWD_DECRYPT_KEY加密传输
+    :param wallet: 数据库钱包记录
+    :param pwd: 解密密钥
+    :return: 钱包信息，处理失败返回None
+    '''
+    try:
+        logger.debug(f'[convertWallet] 解密钱包: {wallet.address[:10]}...')
+        decrypted_private_key = utils_encrypt.decrypt(wallet.private_key, pwd)
+        decrypted_phrase = utils_encrypt.decrypt(wallet.phrase, pwd)
+
+        encrypted_private_key = utils_encrypt.encrypt_private_key(decrypted_private_key)
+        encrypted_phrase = utils_encrypt.encrypt_private_key(decrypted_phrase)
+
+        return {
+            "index": wallet.index,
+            "address": wallet.address,
+            "publicKey": wallet.public_key,
+            "privateKey": encrypted_private_key,
+            "phrase": encrypted_phrase,
+            "project": wallet.project,
+            "remark": wallet.remark,
+            "derivationPath": wallet.derivation_path
+        }
+    except Exception as e:
+        logger.error(f'[convertWallet] 处理钱包失败: {wallet.address}, 错误: {e}')
+        return None
+
+
+def _convertWalletChunk(chunk, pwd):
+    return [convertWallet(wallet, pwd) for wallet in chunk]
+
+
+def batchConvertWallets(wallets, pwd, chunkSize=None):
+    '''
+    批量转换钱包，按块分发到线程池并行处理
+    输出顺序与输入一致，处理失败的钱包会被跳过
+    :param wallets: 数据库钱包记录列表
+    :param pwd: 解密密钥
+    :param chunkSize: 每块数量，默认 WALLET_CRYPTO_CHUNK_SIZE
+    :return: 钱包信息列表
+    '''
+    chunkSize = chunkSize or WALLET_CRYPTO_CHUNK_SIZE
+    wallets = list(wallets)
+
+    # 数量不足一块时直接在当前线程处理，省去调度开销
+    if len(wallets) <= chunkSize or WALLET_CRYPTO_WORKERS <= 1:
+        converted = _convertWalletChunk(wallets, pwd)
+    else:
+        chunks = [wallets[i:i + chunkSize] for i in range(0, len(wallets), chunkSize)]
+        logger.debug(f'[batchConvertWallets] 分 {len(chunks)} 块并行处理 {len(wallets)} 个钱包')
+        converted = []
+        for chunkResult in _getCryptoExecutor().map(_convertWalletChunk, chunks, repeat(pwd)):
+            converted.extend(chunkResult)
+
+    return [item for item in converted if item is not None]
+
+
 def oneWallet(address, pwd):
     '''
     查询单个钱包
@@ -125,7 +242,8 @@ def oneWallet(address, pwd):
             "privateKey": encrypted_private_key,
             "phrase": encrypted_phrase,
             "project": result.project,
-            "remark": result.remark
+            "remark": result.remark,
+            "derivationPath": result.derivation_path
         }
         
         logger.info(f'[oneWallet] 找到钱包: {address[:10]}...')
@@ -135,10 +253,147 @@ def oneWallet(address, pwd):
         return None
 
 
+def _parseWalletLine(item):
+    '''
+    解析钱包行
+    :param item: "地址,私钥,助记词[,派生路径]"
+    :return: (地址, 私钥, 助记词, 派生路径)，派生路径不是 m/ 开头时为None，地址无效时返回None
+    '''
+    parts = item.split(',')
+    address = parts[0].strip()
+    if len(address) < 2:
+        return None
+    private = parts[1].strip() if len(parts) > 1 and parts[1].strip() else None
+    phrase = parts[2].strip() if len(parts) > 2 and parts[2].strip() else None
+    path = parts[3].strip()[:64] if len(parts) > 3 and parts[3].strip().startswith('m/') else None
+    return address, private, phrase, path
+
+
+def _encryptWalletField(value, pwd, encrypted):
+    '''
+    加密钱包字段用于存储
+    :param value: 字段值
+    :param pwd: 加密密钥
+    :param encrypted: 为True时value是用PWD_DECRYPT_KEY加密的，需要先解密
+    :return: 用pwd加密后的值
+    '''
+    if not value:
+        return None
+    if encrypted:
+        value = utils_encrypt.decrypt_private_key(value)
+        if not value:
+            return None
+    return utils_encrypt.encrypt(value, pwd)
+
+
+def _importWalletChunk(chunk, project, remark, pwd, encrypted, stats):
+    '''
+    导入一块钱包：解析 → 去重 → 加密 → 插入（一个事务）
+    :param chunk: [(index, "地址,私钥,助记词[,派生路径]"), ...]
+    :param stats: 累计统计，原地更新
+    '''
+    # 1. 解析并在块内去重
+    records = []
+    seen = set()
+    for (walletIndex, item) in chunk:
+        try:
+            parsed = _parseWalletLine(item)
+        except Exception as e:
+            logger.error(f'[importWallets] 解析钱包失败: {str(item)[:50]}..., 错误: {e}')
+            parsed = None
+        if parsed is None:
+            stats['skipped'] += 1
+            continue
+        if parsed[0] in seen:
+            stats['duplicated'] += 1
+            continue
+        seen.add(parsed[0])
+        records.append((walletIndex, parsed))
+
+    if not records:
+        return
+
+    # 2. 过滤数据库中已存在的地址（IN 列表大小不超过块大小），已存在的不再做加密
+    existing_addresses = utils_db.batchQueryExistingAddresses(project, [r[1][0] for r in records])
+    stats['duplicated'] += len(existing_addresses)
+
+    # 3. 加密
+    wallet_data_list = []
+    for (walletIndex, (address, private, phrase, path)) in records:
+        if address in existing_addresses:
+            continue
+        try:
+            wallet_data_list.append({
+                'index': walletIndex,
+                'address': address,
+                'public_key': None,
+                'private_key': _encryptWalletField(private, pwd, encrypted),
+                'phrase': _encryptWalletField(phrase, pwd, encrypted),
+                'project': project,
+                'remark': remark,
+                'derivation_path': path
+            })
+        except Exception as e:
+            logger.error(f'[importWallets] 加密钱包失败: {address[:10]}..., 错误: {e}')
+            stats['skipped'] += 1
+
+    # 4. 插入（INSERT IGNORE，并发导入时的重复由唯一索引兜底）
+    inserted = utils_db.batchInsertWallets(wallet_data_list)
+    stats['inserted'] += inserted
+    stats['duplicated'] += len(wallet_data_list) - inserted
+
+
+def importWallets(walletIter, project, remark, pwd, encrypted=True, chunkSize=None, progress=None):
+    '''
+    分块导入钱包，每块依次 解析 → 去重 → 加密 → 插入，内存占用只与块大小有关
+    :param walletIter: 钱包行（列表或生成器），格式："地址,私钥,助记词"
+    :param project: 项目名称
+    :param remark: 备注
+    :param pwd: 解密/加密密钥
+    :param encrypted: 私钥是否已用PWD_DECRYPT_KEY加密
+    :param chunkSize: 每块数量，默认 IMPORT_CHUNK_SIZE
+    :param progress: 进度回调，每块完成后调用 progress(stats)
+    :return: {"total": 总行数, "inserted": 新增数, "duplicated": 重复数, "skipped": 无效数, "chunks": 块数}
+    '''
+    chunkSize = chunkSize or IMPORT_CHUNK_SIZE
+    logger.debug(f'[importWallets] project={project}, chunkSize={chunkSize}')
+
+    stats = {"total": 0, "inserted": 0, "duplicated": 0, "skipped": 0, "chunks": 0}
+
+    # index 通过 project_stats 原子预留，并发导入同一项目不会重叠
+    # 已知总数时一次性预留整段连续区间，生成器输入则按块预留
+    baseIndex = None
+    if hasattr(walletIter, '__len__'):
+        baseIndex = utils_db.reserveProjectIndexes(project, len(walletIter)) - 1
+
+    def flush(chunk):
+        if baseIndex is None:
+            start = utils_db.reserveProjectIndexes(project, len(chunk))
+            chunk = [(start + offset, item) for (offset, (_, item)) in enumerate(chunk)]
+        _importWalletChunk(chunk, project, remark, pwd, encrypted, stats)
+        stats['chunks'] += 1
+        logger.info(f'[importWallets] 第 {stats["chunks"]} 块完成: 已处理={stats["total"]}, 新增={stats["inserted"]}, '
+                    f'重复={stats["duplicated"]}, 跳过={stats["skipped"]}')
+        if progress:
+            progress(dict(stats))
+
+    chunk = []
+    for item in walletIter:
+        chunk.append(((baseIndex or 0) + 1 + stats['total'], item))
+        stats['total'] += 1
+        if len(chunk) >= chunkSize:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    return stats
+
+
 def insertWalletList(walletList, project, remark, pwd, encrypted=True):
     '''
     批量导入钱包
-    :param walletList: 钱包列表，格式：["地址,私钥,助记词", ...]
+    :param walletList: 钱包列表，格式：["地址,私钥,助记词", ...]，可选第4列为HD派生路径
     :param project: 项目名称
     :param remark: 备注
     :param pwd: 解密/加密密钥
@@ -150,119 +405,45 @@ def insertWalletList(walletList, project, remark, pwd, encrypted=True):
     if not walletList:
         logger.debug('[insertWalletList] 钱包列表为空')
         return True
-    
-    baseIndex = utils_db.queryProjectLastIndex(project)
-    logger.debug(f'[insertWalletList] 项目 {project} 的最后索引: {baseIndex}')
-    
-    # 解析所有钱包数据
-    wallet_data_list = []
-    addresses = []
-    skip_count = 0
-    
-    for (index, item) in enumerate(walletList):
-        try:
-            parts = item.split(',')
-            address = parts[0].strip()
-            
-            if len(address) < 2:
-                skip_count += 1
-                continue
-            
-            private = None
-            phrase = None
-            
-            if encrypted:
-                # 前端传入的私钥是用PWD_DECRYPT_KEY加密的，需要先解密
-                if len(parts) > 1 and parts[1].strip():
-                    encrypted_private = parts[1].strip()
-                    org_private = utils_encrypt.decrypt_private_key(encrypted_private)
-                    private = utils_encrypt.encrypt(org_private, pwd) if org_private else None
-                    logger.debug(f'[insertWalletList] 解密私钥: {address[:10]}...')
-                
-                # 处理助记词
-                if len(parts) > 2 and parts[2].strip():
-                    encrypted_phrase = parts[2].strip()
-                    org_phrase = utils_encrypt.decrypt_private_key(encrypted_phrase)
-                    phrase = utils_encrypt.encrypt(org_phrase, pwd) if org_phrase else None
-            else:
-                # 私钥是明文的，直接加密存储
-                if len(parts) > 1 and parts[1].strip():
-                    private = utils_encrypt.encrypt(parts[1].strip(), pwd)
-                
-                # 处理助记词
-                if len(parts) > 2 and parts[2].strip():
-                    phrase = utils_encrypt.encrypt(parts[2].strip(), pwd)
-            
-            walletIndex = baseIndex + 1 + index
-            
-            wallet_data_list.append({
-                'index': walletIndex,
-                'address': address,
-                'public_key': None,
-                'private_key': private,
-                'phrase': phrase,
-                'project': project,
-                'remark': remark
-            })
-            addresses.append(address)
-        except Exception as e:
-            logger.error(f'[insertWalletList] 处理钱包失败: {item[:50]}..., 错误: {e}')
-            skip_count += 1
-            continue
-    
-    logger.info(f'[insertWalletList] 解析完成: 总数={len(walletList)}, 有效={len(wallet_data_list)}, 跳过={skip_count}')
-    
-    if not wallet_data_list:
-        logger.debug('[insertWalletList] 没有有效钱包数据')
-        return True
-    
-    # 批量查询已存在的地址
-    existing_addresses = utils_db.batchQueryExistingAddresses(project, addresses)
-    logger.debug(f'[insertWalletList] 已有地址数量: {len(existing_addresses)}')
-    
-    # 过滤掉已存在的地址
-    new_wallet_data = [w for w in wallet_data_list if w['address'] not in existing_addresses]
-    logger.debug(f'[insertWalletList] 新增地址数量: {len(new_wallet_data)}')
-    
-    if not new_wallet_data:
-        logger.info('[insertWalletList] 所有钱包都已存在')
-        return True
-    
-    # 批量插入
-    utils_db.batchInsertWallets(new_wallet_data)
-    
-    logger.info(f'[insertWalletList] 批量导入完成: 新增 {len(new_wallet_data)} 个钱包')
+
+    stats = importWallets(walletList, project, remark, pwd, encrypted=encrypted)
+
+    logger.info(f'[insertWalletList] 批量导入完成: 总数={stats["total"]}, 新增={stats["inserted"]}, '
+                f'重复={stats["duplicated"]}, 跳过={stats["skipped"]}')
     return True
 
 
-def createWalletList(walletType, walletNum, project, remark, pwd):
+def createWalletList(walletType, walletNum, project, remark, pwd, workers=None, hd=False, progress=None):
     '''
     批量创建钱包
+    生成、加密、入库按块流水线进行，内存占用与创建数量无关
     :param walletType: 钱包类型（evm/sol）
     :param walletNum: 创建数量
     :param project: 项目名称
     :param remark: 备注
     :param pwd: 加密密钥
+    :param workers: 生成并行度（可选，默认且最大为 WALLET_GEN_WORKERS）
+    :param hd: HD批量模式，一个助记词派生所有账户，derivation_path 记录派生路径
+    :param progress: 进度回调，每块入库后调用 progress(stats)
     :return: True
     '''
-    logger.info(f'[createWalletList] 创建钱包: type={walletType}, number={walletNum}, project={project}')
+    logger.info(f'[createWalletList] 创建钱包: type={walletType}, number={walletNum}, project={project}, workers={workers}, hd={hd}')
     
-    walletList = []
     if walletType == "evm":
         logger.debug(f'[createWalletList] 创建 {walletNum} 个EVM钱包')
-        walletList = utils_wallet_evm.createAccountsOutSeedMulit(walletNum)
+        walletIter = utils_wallet_evm.iterAccounts(walletNum, workers=workers, hd=hd)
     elif walletType == "sol":
         logger.debug(f'[createWalletList] 创建 {walletNum} 个Solana钱包')
-        walletList = utils_wallet_sol.create_sol_wallet(walletNum)
+        walletIter = utils_wallet_sol.iter_sol_wallet(walletNum, workers=workers, hd=hd)
     else:
         logger.error(f'[createWalletList] 未知钱包类型: {walletType}')
         return False
 
-    # 传入encrypted=False，因为walletList中的私钥是明文的
-    result = insertWalletList(walletList, project, remark, pwd, encrypted=False)
+    # 传入encrypted=False，因为生成的私钥是明文的
+    stats = importWallets(walletIter, project, remark, pwd, encrypted=False, progress=progress)
     
-    logger.info(f'[createWalletList] 创建完成: {result}')
-    return result
+    logger.info(f'[createWalletList] 创建完成: 生成={stats["total"]}, 新增={stats["inserted"]}')
+    return True
 
 
 def batchImportWalletMapping(mappingList, project, remark):
@@ -327,6 +508,19 @@ def getProjectStatistics():
     return result
 
 
+def getCacheStats():
+    '''
+    获取缓存命中统计
+    :return: {"caches": [{"name": ..., "size": ..., "ttl"/"maxsize": ..., "hits": ..., "misses": ...}], "exchangeClients": {...}, "asyncExchangeClients": {...}}
+    '''
+    return {
+        "caches": utils_db.getCacheStats() + [service_exchange_withdraw.get_currency_cache_stats(),
+                                              service_chain_evm.getTokenCacheStats()],
+        "exchangeClients": service_exchange_withdraw.get_client_pool_stats(),
+        "asyncExchangeClients": service_exchange_async.get_client_pool_stats()
+    }
+
+
 # ==================== 交易所信息相关 ====================
 
 def getExchangeNames():
@@ -446,6 +640,8 @@ def updateExchange(name, platform, apikey, secret, password, ip, pwd):
         new_password = utils_encrypt.encrypt(decrypted_password, pwd) if decrypted_password else None
 
     result = utils_db.updateExchange(name, new_platform, new_apikey, new_secret, new_password, new_ip)
+    service_exchange_withdraw.invalidate_exchange_clients(name)
+    service_exchange_async.invalidate_exchange_clients(name)
 
     logger.info(f'[updateExchange] 更新完成: {name}, 影响行数: {result}')
     return result
@@ -459,5 +655,7 @@ def deleteExchange(name):
     '''
     logger.info(f'[deleteExchange] 删除交易所: name={name}')
     result = utils_db.deleteExchange(name)
+    service_exchange_withdraw.invalidate_exchange_clients(name)
+    service_exchange_async.invalidate_exchange_clients(name)
     logger.info(f'[deleteExchange] 删除完成: {name}, 影响行数: {result}')
     return result
@@ -8,10 +8,24 @@ CREATE TABLE `wallet`
     `phrase`      varchar(255) DEFAULT NULL COMMENT '短语',
     `project`     varchar(50)  DEFAULT NULL COMMENT '项目',
     `remark`      varchar(50)  DEFAULT NULL COMMENT '备注',
-    PRIMARY KEY (`id`)
+    `derivation_path` varchar(64) DEFAULT NULL COMMENT 'HD派生路径',
+    PRIMARY KEY (`id`),
+    KEY `idx_address` (`address`),
+    UNIQUE KEY `uk_project_address` (`project`, `address`),
+    KEY `idx_project_index` (`project`, `index`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8 COMMENT='钱包';
 
 
+CREATE TABLE `project_stats`
+(
+    `project`      varchar(50) NOT NULL COMMENT '项目',
+    `wallet_count` int(11)     NOT NULL DEFAULT 0 COMMENT '钱包数量',
+    `max_index`    int(11)     NOT NULL DEFAULT 0 COMMENT '最大index',
+    `updated_at`   timestamp   DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    PRIMARY KEY (`project`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='项目统计';
+
+
 CREATE TABLE `wallet_mapping`
 (
     `id`           int(11)      NOT NULL AUTO_INCREMENT COMMENT 'id',
@@ -36,3 +50,33 @@ CREATE TABLE `exchange_info`
     `name` varchar(50) DEFAULT NULL COMMENT '名字，多交易所时，用此字段区分',
     PRIMARY KEY (`id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8 COMMENT='交易所配置';
+
+
+CREATE TABLE `job`
+(
+    `id`         varchar(32) NOT NULL COMMENT '任务id',
+    `job_type`   varchar(50) NOT NULL COMMENT '任务类型',
+    `status`     varchar(20) NOT NULL COMMENT '状态：pending,running,success,failed',
+    `total`      int(11)     DEFAULT NULL COMMENT '总数',
+    `processed`  int(11)     DEFAULT 0 COMMENT '已处理数',
+    `progress`   text COMMENT '进度详情（JSON）',
+    `result`     text COMMENT '执行结果（JSON）',
+    `error`      text COMMENT '错误信息',
+    `created_at` timestamp   DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    `updated_at` timestamp   DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    PRIMARY KEY (`id`),
+    KEY `ix_job_status` (`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='后台任务';
+
+
+CREATE TABLE `token_metadata`
+(
+    `id`         int(11)     NOT NULL AUTO_INCREMENT COMMENT 'id',
+    `chain_id`   int(11)     NOT NULL COMMENT '链ID',
+    `address`    varchar(50) NOT NULL COMMENT '代币合约地址（小写）',
+    `symbol`     varchar(64) DEFAULT NULL COMMENT '代币符号',
+    `decimals`   int(11)     NOT NULL COMMENT '精度',
+    `created_at` timestamp   DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    PRIMARY KEY (`id`),
+    UNIQUE KEY `uk_chain_address` (`chain_id`, `address`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COMMENT='代币元数据';
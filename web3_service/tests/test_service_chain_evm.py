@@ -0,0 +1,251 @@
+# coding:utf-8
+'''
+Description: service_chain_evm 测试：代币元数据缓存链ID、批量余额查询（本地 http.server 模拟EVM节点）
+'''
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from eth_abi import decode, encode
+
+import service_chain_evm
+import utils_cache
+import utils_rpc
+
+TOKEN = '0x' + '33' * 20
+BAD_TOKEN = '0x' + '44' * 20
+
+
+class FakeNode:
+
+    def __init__(self, nodeChainId, chainId=None):
+        self.nodeChainId = nodeChainId
+        self.chainId = chainId
+        self.url = 'fake'
+
+    def call(self, method, params=None):
+        assert method == 'eth_chainId'
+        if self.nodeChainId is None:
+            raise ConnectionError('node down')
+        return hex(self.nodeChainId)
+
+
+class ResolveChainIdTest(unittest.TestCase):
+
+    def test_configured_pool_uses_its_chain(self):
+        self.assertEqual(service_chain_evm.resolveChainId(FakeNode(None, chainId='56'), '56'), 56)
+
+    def test_custom_node_uses_node_chain_id(self):
+        self.assertEqual(service_chain_evm.resolveChainId(FakeNode(56)), 56)
+        self.assertEqual(service_chain_evm.resolveChainId(FakeNode(56), 56), 56)
+
+    def test_custom_node_mismatch_rejected(self):
+        with self.assertRaises(ValueError):
+            service_chain_evm.resolveChainId(FakeNode(56), 1)
+
+    def test_custom_node_unknown_chain_bypasses_cache(self):
+        self.assertIsNone(service_chain_evm.resolveChainId(FakeNode(None), 1))
+
+
+class TokenMetadataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(service_chain_evm, '_tokenCache', utils_cache.LRUCache('test', 10))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mismatched_custom_rpc_does_not_touch_cache(self):
+        with mock.patch.object(service_chain_evm.utils_rpc, 'getRpcClient', return_value=FakeNode(56)), \
+                mock.patch.object(service_chain_evm, 'fetchTokenMetadata') as fetch:
+            result = service_chain_evm.getTokens(1, [TOKEN], 'http://custom')
+        self.assertFalse(result['success'])
+        fetch.assert_not_called()
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_custom_rpc_caches_under_node_chain_id(self):
+        metadata = {TOKEN: {'symbol': 'T', 'decimals': 6}}
+        with mock.patch.object(service_chain_evm.utils_rpc, 'getRpcClient', return_value=FakeNode(56)), \
+                mock.patch.object(service_chain_evm, 'fetchTokenMetadata', return_value=metadata), \
+                mock.patch.object(service_chain_evm.utils_db, 'queryTokenMetadata', return_value={}), \
+                mock.patch.object(service_chain_evm.utils_db, 'batchInsertTokenMetadata') as insert:
+            result = service_chain_evm.getTokens(None, [TOKEN], 'http://custom')
+        self.assertEqual(result['data']['chainId'], 56)
+        self.assertEqual(self.cache.get((56, TOKEN.lower())), (True, metadata[TOKEN]))
+        self.assertEqual(insert.call_args[0][0], 56)
+
+
+
+class MockEvmNode:
+    '''
+    模拟EVM节点：支持单个/批量 JSON-RPC，multicall 为 True 时部署了 Multicall3
+    balances 为 {小写地址: 原生币余额}，tokenBalances 为 {小写代币地址: {小写地址: 余额}}，
+    不在 tokenBalances 中的代币调用会 revert
+    '''
+
+    def __init__(self, multicall, balances, tokenBalances):
+        self.multicall = multicall
+        self.balances = balances
+        self.tokenBalances = tokenBalances
+        # 每个HTTP请求的方法列表、每个 aggregate3 的子调用数
+        self.requests = []
+        self.aggregateSizes = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                items = payload if isinstance(payload, list) else [payload]
+                node.requests.append([item['method'] for item in items])
+                body = [node.handle(item) for item in items]
+                data = json.dumps(body if isinstance(payload, list) else body[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, item):
+        try:
+            result = self.dispatch(item['method'], item['params'])
+        except ValueError as e:
+            return {'jsonrpc': '2.0', 'id': item['id'], 'error': {'code': 3, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': item['id'], 'result': result}
+
+    def dispatch(self, method, params):
+        if method == 'eth_chainId':
+            return '0x1'
+        if method == 'eth_getCode':
+            return '0x6080' if self.multicall and params[0].lower() == service_chain_evm.MULTICALL3_ADDRESS.lower() else '0x'
+        if method == 'eth_getBalance':
+            return hex(self.balances.get(params[0].lower(), 0))
+        if method == 'eth_call':
+            target, data = params[0]['to'].lower(), bytes.fromhex(params[0]['data'][2:])
+            if target == service_chain_evm.MULTICALL3_ADDRESS.lower() and self.multicall:
+                return '0x' + self.aggregate3(data).hex()
+            return '0x' + self.contractCall(target, data).hex()
+        raise ValueError(f'unsupported method {method}')
+
+    def aggregate3(self, data):
+        assert data[:4] == service_chain_evm.SELECTOR_AGGREGATE3
+        subCalls = decode(['(address,bool,bytes)[]'], data[4:])[0]
+        self.aggregateSizes.append(len(subCalls))
+        results = []
+        for (target, allowFailure, callData) in subCalls:
+            assert allowFailure
+            try:
+                results.append((True, self.contractCall(target.lower(), callData)))
+            except ValueError:
+                results.append((False, b''))
+        return encode(['(bool,bytes)[]'], [results])
+
+    def contractCall(self, target, data):
+        selector = data[:4]
+        if target == service_chain_evm.MULTICALL3_ADDRESS.lower() and selector == service_chain_evm.SELECTOR_GET_ETH_BALANCE:
+            return encode(['uint256'], [self.balances.get(decode(['address'], data[4:])[0].lower(), 0)])
+        if target not in self.tokenBalances:
+            raise ValueError('execution reverted')
+        if selector == service_chain_evm.SELECTOR_BALANCE_OF:
+            return encode(['uint256'], [self.tokenBalances[target].get(decode(['address'], data[4:])[0].lower(), 0)])
+        if selector == service_chain_evm.SELECTOR_DECIMALS:
+            return encode(['uint8'], [6])
+        if selector == service_chain_evm.SELECTOR_SYMBOL:
+            return encode(['string'], ['USDT'])
+        raise ValueError('execution reverted')
+
+
+class GetBalancesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addresses = ['0x' + f'{i + 1:040x}' for i in range(7)]
+        self.balances = {address: (i + 1) * 10 ** 18 for (i, address) in enumerate(self.addresses)}
+        self.tokenBalances = {TOKEN: {address: (i + 1) * 1500000 for (i, address) in enumerate(self.addresses)}}
+        patches = [
+            mock.patch.object(service_chain_evm, '_tokenCache', utils_cache.LRUCache('test', 10)),
+            mock.patch.object(service_chain_evm.utils_db, 'queryTokenMetadata', return_value={}),
+            mock.patch.object(service_chain_evm.utils_db, 'batchInsertTokenMetadata'),
+            # 小分片，验证跨多个 aggregate3 / 批量请求时结果顺序正确
+            mock.patch.object(service_chain_evm, 'MULTICALL_CHUNK_SIZE', 4),
+            mock.patch.object(service_chain_evm, 'MULTICALL_PER_REQUEST', 2),
+            mock.patch.object(utils_rpc, 'RPC_BATCH_SIZE', 5),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def scan(self, multicall, addresses, tokens):
+        node = MockEvmNode(multicall, self.balances, self.tokenBalances)
+        self.addCleanup(node.close)
+        pool = utils_rpc.RpcPool('test', [node.url])
+        with mock.patch.object(service_chain_evm.utils_rpc, 'getRpcClient', return_value=pool):
+            result = service_chain_evm.getBalances(1, addresses, tokens=tokens)
+        return node, pool, result
+
+    def assertBalances(self, result):
+        self.assertTrue(result['success'], result['msg'])
+        data = result['data']
+        self.assertEqual(data['chainId'], 1)
+        self.assertEqual(data['tokens'], [{'token': TOKEN, 'symbol': 'USDT', 'decimals': 6},
+                                          {'token': BAD_TOKEN, 'symbol': None, 'decimals': None}])
+        self.assertEqual([item['address'] for item in data['list']], self.addresses)
+        for (i, item) in enumerate(data['list']):
+            self.assertEqual(item['native'], {'raw': str((i + 1) * 10 ** 18), 'balance': str(i + 1)})
+            self.assertEqual(item['tokens'][0], {'token': TOKEN, 'raw': str((i + 1) * 1500000),
+                                                 'balance': str((i + 1) * 1.5).rstrip('0').rstrip('.')})
+            # revert 的代币只标记该项失败
+            self.assertIsNone(item['tokens'][1]['raw'])
+            self.assertTrue(item['tokens'][1]['error'])
+        self.assertEqual(data['failed'], len(self.addresses))
+
+    def test_multicall(self):
+        node, pool, result = self.scan(True, self.addresses, [TOKEN, BAD_TOKEN])
+        self.assertBalances(result)
+        self.assertTrue(pool.capabilities['multicall3'])
+        # 代币元数据 4 个调用 1 个分片；余额 7 * 3 = 21 个调用按 4 个一片
+        self.assertEqual(node.aggregateSizes, [4] + [4] * 5 + [1])
+        self.assertNotIn('eth_getBalance', [method for methods in node.requests for method in methods])
+        # 每个HTTP请求最多打包 MULTICALL_PER_REQUEST 个 aggregate3
+        self.assertTrue(all(len(methods) <= 2 for methods in node.requests))
+
+    def test_batch_fallback_without_multicall(self):
+        node, pool, result = self.scan(False, self.addresses, [TOKEN, BAD_TOKEN])
+        self.assertBalances(result)
+        self.assertFalse(pool.capabilities['multicall3'])
+        self.assertEqual(node.aggregateSizes, [])
+        methods = [method for methods in node.requests for method in methods]
+        self.assertEqual(methods.count('eth_getBalance'), len(self.addresses))
+        # 每个HTTP批量请求最多 RPC_BATCH_SIZE 个调用
+        self.assertTrue(all(len(methods) <= 5 for methods in node.requests))
+
+    def test_invalid_addresses_ignored(self):
+        for multicall in (True, False):
+            node, pool, result = self.scan(multicall, ['0x1234', self.addresses[0], 'abc', self.addresses[0]], [])
+            self.assertTrue(result['success'], result['msg'])
+            self.assertEqual(result['data']['invalid'], ['0x1234', 'abc'])
+            self.assertEqual([item['address'] for item in result['data']['list']], [self.addresses[0]])
+            self.assertEqual(result['data']['list'][0]['native']['balance'], '1')
+            self.assertEqual(result['data']['failed'], 0)
+
+    def test_no_valid_address_or_invalid_token(self):
+        with mock.patch.object(service_chain_evm.utils_rpc, 'getRpcClient') as getRpcClient:
+            self.assertFalse(service_chain_evm.getBalances(1, ['0x1234'])['success'])
+            self.assertFalse(service_chain_evm.getBalances(1, self.addresses, tokens=['0x12'])['success'])
+        getRpcClient.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
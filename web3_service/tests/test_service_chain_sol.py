@@ -0,0 +1,212 @@
+# coding:utf-8
+'''
+Description: service_chain_sol 批量余额查询测试（本地 http.server 模拟Solana节点）
+'''
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from solders.pubkey import Pubkey
+
+import service_chain_sol
+import utils_rpc
+
+TOKEN_PROGRAM = str(service_chain_sol.TOKEN_PROGRAM_ID)
+TOKEN_2022_PROGRAM = str(service_chain_sol.TOKEN_2022_PROGRAM_ID)
+
+
+def mintAccount(program, decimals):
+    return {'lamports': 1461600, 'owner': program,
+            'data': {'program': 'spl-token', 'parsed': {'type': 'mint', 'info': {'decimals': decimals}}}}
+
+
+def tokenAccount(program, owner, mint, amount, decimals):
+    return {'lamports': 2039280, 'owner': program,
+            'data': {'program': 'spl-token', 'parsed': {'type': 'account', 'info': {
+                'owner': owner, 'mint': mint, 'tokenAmount': {'amount': str(amount), 'decimals': decimals}}}}}
+
+
+class MockSolNode:
+    '''
+    模拟Solana节点：accounts 为 {地址: jsonParsed 账户信息}，不在其中的账户返回 null；
+    getMultipleAccounts 的地址列表包含 malformed 中的地址时返回缺少 value 的响应
+    '''
+
+    def __init__(self, accounts, malformed=()):
+        self.accounts = accounts
+        self.malformed = set(malformed)
+        # 每次 getMultipleAccounts 的地址列表
+        self.accountCalls = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                items = payload if isinstance(payload, list) else [payload]
+                body = [{'jsonrpc': '2.0', 'id': item['id'], 'result': node.dispatch(item['method'], item['params'])}
+                        for item in items]
+                data = json.dumps(body if isinstance(payload, list) else body[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def dispatch(self, method, params):
+        context = {'slot': 1}
+        if method == 'getMultipleAccounts':
+            addresses, config = params
+            self.accountCalls.append(addresses)
+            if self.malformed & set(addresses):
+                return {'context': context}
+            value = []
+            for address in addresses:
+                account = self.accounts.get(address)
+                if account is not None and config['encoding'] == 'base64':
+                    account = {'lamports': account['lamports'], 'owner': account['owner'], 'data': ['', 'base64']}
+                value.append(account)
+            return {'context': context, 'value': value}
+        if method == 'getTokenAccountsByOwner':
+            owner, programFilter = params[0], params[1]['programId']
+            value = []
+            for (address, account) in self.accounts.items():
+                info = account['data']['parsed']['info'] if isinstance(account['data'], dict) else None
+                if account['owner'] == programFilter and (info is None or info.get('owner') == owner):
+                    value.append({'pubkey': address, 'account': account})
+            return {'context': context, 'value': value}
+        raise AssertionError(f'unexpected method {method}')
+
+
+class SolGetBalancesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.owners = [str(Pubkey.new_unique()) for _ in range(3)]
+        self.mint = str(Pubkey.new_unique())
+        self.mint2022 = str(Pubkey.new_unique())
+        self.accounts = {
+            self.mint: mintAccount(TOKEN_PROGRAM, 6),
+            self.mint2022: mintAccount(TOKEN_2022_PROGRAM, 9),
+            self.owners[0]: {'lamports': 1500000000, 'owner': '11111111111111111111111111111111', 'data': ['', 'base64']},
+            self.owners[1]: {'lamports': 1, 'owner': '11111111111111111111111111111111', 'data': ['', 'base64']},
+        }
+
+    def ata(self, owner, mint, program):
+        return str(service_chain_sol.getAssociatedTokenAddress(Pubkey.from_string(owner), Pubkey.from_string(mint),
+                                                               Pubkey.from_string(program)))
+
+    def scan(self, addresses, malformed=(), **kwargs):
+        node = MockSolNode(self.accounts, malformed)
+        self.addCleanup(node.close)
+        pool = utils_rpc.RpcPool('test', [node.url])
+        with mock.patch.object(service_chain_sol.utils_rpc, 'getRpcClient', return_value=pool):
+            result = service_chain_sol.getBalances(addresses, **kwargs)
+        self.assertTrue(result['success'], result['msg'])
+        return node, result['data']
+
+    def test_sol_balances_chunked_by_100(self):
+        addresses = self.owners[:2] + [str(Pubkey.new_unique()) for _ in range(148)]
+        node, data = self.scan(addresses + ['not-an-address'])
+        self.assertEqual([len(call) for call in node.accountCalls], [100, 50])
+        self.assertEqual(data['invalid'], ['not-an-address'])
+        self.assertEqual([item['address'] for item in data['list']], addresses)
+        self.assertEqual(data['list'][0]['sol'], {'raw': '1500000000', 'balance': '1.5'})
+        self.assertEqual(data['list'][1]['sol'], {'raw': '1', 'balance': '0.000000001'})
+        # 不存在的账户余额为0
+        self.assertEqual(data['list'][2]['sol'], {'raw': '0', 'balance': '0'})
+        self.assertEqual(data['failed'], 0)
+
+    def test_malformed_response_marks_chunk_failed(self):
+        addresses = self.owners[:2] + [str(Pubkey.new_unique()) for _ in range(148)]
+        node, data = self.scan(addresses, malformed=[addresses[120]])
+        self.assertEqual(data['failed'], 50)
+        self.assertEqual(data['list'][0]['sol']['raw'], '1500000000')
+        self.assertIsNone(data['list'][120]['sol']['raw'])
+        self.assertTrue(data['list'][120]['sol']['error'])
+
+    def test_ata_for_token_and_token_2022(self):
+        owner = self.owners[0]
+        ata, ata2022 = self.ata(owner, self.mint, TOKEN_PROGRAM), self.ata(owner, self.mint2022, TOKEN_2022_PROGRAM)
+        # 同一 owner/mint 在两个代币程序下的关联账户不同
+        self.assertNotEqual(ata2022, self.ata(owner, self.mint2022, TOKEN_PROGRAM))
+        self.accounts[ata] = tokenAccount(TOKEN_PROGRAM, owner, self.mint, 2500000, 6)
+        self.accounts[ata2022] = tokenAccount(TOKEN_2022_PROGRAM, owner, self.mint2022, 3 * 10 ** 9, 9)
+
+        node, data = self.scan(self.owners, mints=[self.mint, self.mint2022])
+        self.assertIn([ata, ata2022,
+                       self.ata(self.owners[1], self.mint, TOKEN_PROGRAM),
+                       self.ata(self.owners[1], self.mint2022, TOKEN_2022_PROGRAM),
+                       self.ata(self.owners[2], self.mint, TOKEN_PROGRAM),
+                       self.ata(self.owners[2], self.mint2022, TOKEN_2022_PROGRAM)], node.accountCalls)
+        self.assertEqual(data['tokens'], [{'mint': self.mint, 'decimals': 6, 'program': TOKEN_PROGRAM},
+                                          {'mint': self.mint2022, 'decimals': 9, 'program': TOKEN_2022_PROGRAM}])
+        self.assertEqual(data['list'][0]['tokens'], [
+            {'mint': self.mint, 'raw': '2500000', 'balance': '2.5'},
+            {'mint': self.mint2022, 'raw': '3000000000', 'balance': '3'},
+        ])
+        # 关联代币账户不存在即余额为0
+        self.assertEqual(data['list'][1]['tokens'][0], {'mint': self.mint, 'raw': '0', 'balance': '0'})
+        self.assertEqual(data['failed'], 0)
+
+    def test_malformed_token_account_marks_item_failed(self):
+        owner = self.owners[0]
+        ata = self.ata(owner, self.mint, TOKEN_PROGRAM)
+        # 节点无法解析账户数据时 jsonParsed 退回 base64
+        self.accounts[ata] = {'lamports': 2039280, 'owner': TOKEN_PROGRAM, 'data': ['AAAA', 'base64']}
+        node, data = self.scan(self.owners, mints=[self.mint])
+        self.assertIsNone(data['list'][0]['tokens'][0]['raw'])
+        self.assertTrue(data['list'][0]['tokens'][0]['error'])
+        self.assertEqual(data['list'][0]['sol']['raw'], '1500000000')
+        self.assertEqual(data['list'][1]['tokens'][0], {'mint': self.mint, 'raw': '0', 'balance': '0'})
+        self.assertEqual(data['failed'], 1)
+
+    def test_scan_all_tokens(self):
+        owner = self.owners[0]
+        self.accounts[self.ata(owner, self.mint, TOKEN_PROGRAM)] = tokenAccount(TOKEN_PROGRAM, owner, self.mint, 1000000, 6)
+        # 同一 mint 的非关联代币账户合并计算
+        self.accounts[str(Pubkey.new_unique())] = tokenAccount(TOKEN_PROGRAM, owner, self.mint, 500000, 6)
+        self.accounts[self.ata(owner, self.mint2022, TOKEN_2022_PROGRAM)] = tokenAccount(
+            TOKEN_2022_PROGRAM, owner, self.mint2022, 10 ** 9, 9)
+        # 余额为0的代币账户不返回
+        self.accounts[self.ata(self.owners[1], self.mint, TOKEN_PROGRAM)] = tokenAccount(
+            TOKEN_PROGRAM, self.owners[1], self.mint, 0, 6)
+
+        node, data = self.scan(self.owners[:3], allTokens=True, mints=[self.mint])
+        self.assertEqual(data['tokens'], [])
+        self.assertEqual(data['list'][0]['tokens'], [
+            {'mint': self.mint, 'raw': '1500000', 'balance': '1.5'},
+            {'mint': self.mint2022, 'raw': '1000000000', 'balance': '1'},
+        ])
+        self.assertEqual(data['list'][1]['tokens'], [])
+        self.assertEqual(data['failed'], 0)
+
+    def test_scan_all_tokens_malformed_account(self):
+        owner = self.owners[1]
+        self.accounts[self.ata(self.owners[0], self.mint, TOKEN_PROGRAM)] = tokenAccount(
+            TOKEN_PROGRAM, self.owners[0], self.mint, 1000000, 6)
+        self.accounts[self.ata(owner, self.mint, TOKEN_PROGRAM)] = tokenAccount(TOKEN_PROGRAM, owner, self.mint, 1, 6)
+        del self.accounts[self.ata(owner, self.mint, TOKEN_PROGRAM)]['data']['parsed']['info']['tokenAmount']
+
+        node = MockSolNode(self.accounts)
+        self.addCleanup(node.close)
+        holdings = service_chain_sol._scanAllTokens(utils_rpc.RpcPool('test', [node.url]), self.owners[:2])
+        self.assertEqual(holdings[0], {self.mint: {'raw': 1000000, 'decimals': 6}})
+        self.assertIsInstance(holdings[1], ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
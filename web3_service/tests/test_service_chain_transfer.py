@@ -0,0 +1,125 @@
+# coding:utf-8
+'''
+Description: service_chain_transfer 批量转账测试（模拟节点，不访问链）
+'''
+import unittest
+from unittest import mock
+
+import requests
+from eth_account import Account
+from eth_utils import keccak
+
+import service_chain_transfer
+import utils_rpc
+
+KEY = '0x' + '11' * 32
+SENDER = Account.from_key(KEY).address
+TO = '0x' + '22' * 20
+
+
+class FakeChainClient:
+    '''
+    模拟节点：sendErrors 按顺序决定每次广播抛出的异常（None 为正常受理）
+    '''
+
+    def __init__(self, sendErrors=None, mined=True, knownTx=False):
+        self.sendErrors = list(sendErrors or [])
+        self.mined = mined
+        self.knownTx = knownTx
+        self.sent = []
+        self.url = 'fake'
+
+    def call(self, method, params=None):
+        if method == 'eth_sendRawTransaction':
+            raw = bytes.fromhex(params[0][2:])
+            self.sent.append(raw)
+            error = self.sendErrors.pop(0) if self.sendErrors else None
+            if error:
+                raise error
+            return '0x' + keccak(raw).hex()
+        if method == 'eth_getTransactionCount':
+            return '0x5'
+        if method == 'eth_getTransactionByHash':
+            return {'hash': params[0]} if self.knownTx else None
+        raise AssertionError(method)
+
+    def batch(self, calls):
+        results = []
+        for (method, params) in calls:
+            if method == 'eth_chainId':
+                results.append('0x38')
+            elif method == 'eth_getTransactionCount':
+                results.append('0x5')
+            elif method == 'eth_getBlockByNumber':
+                results.append({'baseFeePerGas': '0x3b9aca00'})
+            elif method in ('eth_gasPrice', 'eth_maxPriorityFeePerGas'):
+                results.append('0x3b9aca00')
+            elif method == 'eth_getTransactionReceipt':
+                results.append({'status': '0x1', 'blockNumber': '0x10', 'gasUsed': '0x5208'} if self.mined else None)
+            else:
+                raise AssertionError(method)
+        return results
+
+
+class BatchTransferTest(unittest.TestCase):
+
+    def run_batch(self, client, progress=None, waitReceipts=True):
+        items = [{'from': SENDER, 'to': TO, 'amount': '0.1'}, {'from': SENDER, 'to': TO, 'amount': '0.2'}]
+        with mock.patch.object(utils_rpc, 'getRpcClient', return_value=client), \
+                mock.patch.object(service_chain_transfer, '_loadSenderKeys',
+                                  return_value=({SENDER.lower(): KEY}, {})), \
+                mock.patch.object(service_chain_transfer.ReceiptTracker.__init__, '__defaults__', (0.01, 5)):
+            return service_chain_transfer.batchTransfer(56, 'pwd', items, waitReceipts=waitReceipts,
+                                                        progress=progress)
+
+    def test_timeout_after_signing_is_unknown_and_keeps_nonce(self):
+        client = FakeChainClient([requests.exceptions.ReadTimeout('read timed out')], mined=False)
+        result = self.run_batch(client, waitReceipts=False)
+        first, second = result['data']['list']
+        self.assertEqual(first['status'], 'unknown')
+        self.assertEqual(first['nonce'], 5)
+        self.assertTrue(first['txHash'].startswith('0x'))
+        # 结果未知的 nonce 不被复用，不会重新签名同一笔转账
+        self.assertEqual(second['nonce'], 6)
+        self.assertEqual(len(client.sent), 2)
+        self.assertEqual(result['data']['summary']['unknown'], 1)
+
+    def test_unknown_confirmed_by_receipt(self):
+        error = requests.exceptions.HTTPError('502 Bad Gateway', response=mock.Mock(status_code=502))
+        client = FakeChainClient([error])
+        result = self.run_batch(client)
+        self.assertEqual([item['status'] for item in result['data']['list']], ['success', 'success'])
+        summary = result['data']['summary']
+        self.assertEqual((summary['unknown'], summary['sent'], summary['success']), (0, 2, 2))
+
+    def test_rejected_broadcast_reuses_nonce(self):
+        client = FakeChainClient([utils_rpc.RpcError({'code': -32000, 'message': 'insufficient funds'})])
+        result = self.run_batch(client, waitReceipts=False)
+        first, second = result['data']['list']
+        self.assertEqual(first['status'], 'failed')
+        self.assertEqual(second['nonce'], 5)
+
+    def test_nonce_too_low_for_own_tx_is_not_resigned(self):
+        client = FakeChainClient([utils_rpc.RpcError({'code': -32000, 'message': 'nonce too low'})], knownTx=True)
+        result = self.run_batch(client, waitReceipts=False)
+        first, second = result['data']['list']
+        self.assertEqual((first['status'], first['nonce']), ('sent', 5))
+        self.assertEqual(second['nonce'], 6)
+        self.assertEqual(len(client.sent), 2)
+
+    def test_nonce_too_low_resyncs_and_resigns(self):
+        client = FakeChainClient([utils_rpc.RpcError({'code': -32000, 'message': 'nonce too low'})])
+        result = self.run_batch(client, waitReceipts=False)
+        self.assertEqual([item['status'] for item in result['data']['list']], ['sent', 'sent'])
+        self.assertEqual(len(client.sent), 3)
+
+    def test_progress_error_does_not_abort(self):
+        progress = mock.Mock(side_effect=RuntimeError('db down'))
+        result = self.run_batch(FakeChainClient(), progress=progress)
+        self.assertTrue(result['success'])
+        self.assertEqual([item['status'] for item in result['data']['list']], ['success', 'success'])
+        self.assertTrue(progress.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# coding:utf-8
+'''
+Description: service_exchange_async 同步桥接超时测试（不访问交易所）
+'''
+import asyncio
+import unittest
+from unittest import mock
+
+import service_exchange_async
+
+
+class BridgeTimeoutTest(unittest.TestCase):
+
+    def test_withdraw_timeout_returns_unknown(self):
+        done = []
+
+        async def slow_withdraw(*args):
+            await asyncio.sleep(0.3)
+            done.append(True)
+            return {'success': True, 'msg': 'ok', 'data': {}}
+
+        with mock.patch.object(service_exchange_async, 'withdraw_async', slow_withdraw), \
+                mock.patch.object(service_exchange_async, 'ASYNC_EXCHANGE_CALL_TIMEOUT', 0.05):
+            result = service_exchange_async.withdraw('main', 'pwd', '0xabc', 'BSC', 'USDT', 1)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['data']['status'], 'unknown')
+        self.assertEqual(result['data']['amount'], 1)
+        # 提现协程不被取消，继续执行完成
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.5), service_exchange_async._loop_thread.loop).result()
+        self.assertEqual(done, [True])
+
+    def test_balances_bridge_follows_caller_timeout(self):
+        async def slow_balances(pwd, exchange_names, coin, timeout):
+            await asyncio.sleep(0.2)
+            return {'success': True, 'msg': 'ok', 'data': timeout}
+
+        with mock.patch.object(service_exchange_async, 'get_balances_async', slow_balances), \
+                mock.patch.object(service_exchange_async, 'ASYNC_EXCHANGE_CALL_TIMEOUT', 0.05), \
+                mock.patch.object(service_exchange_async, 'ASYNC_BALANCES_TIMEOUT_MARGIN', 0):
+            self.assertEqual(service_exchange_async.get_balances('pwd', timeout=1)['data'], 1.0)
+            result = service_exchange_async.get_balances('pwd', timeout=0.01)
+        self.assertFalse(result['success'])
+        self.assertIsNone(result['data'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# coding:utf-8
+'''
+Description: service_exchange_withdraw 测试（不访问交易所）
+'''
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import ccxt
+
+import service_exchange_withdraw
+
+CONFIG = {'platform': 'binance', 'api_key': 'key', 'secret': 'secret', 'password': None, 'proxy_ip': None}
+
+
+class FakeClient:
+
+    def __init__(self, *args):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ExchangeClientPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(service_exchange_withdraw, 'get_exchange_client', FakeClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = service_exchange_withdraw.ExchangeClientPool(600)
+
+    def test_concurrent_callers_get_own_client(self):
+        first = self.pool.acquire('acc', CONFIG)
+        second = self.pool.acquire('acc', CONFIG)
+        self.assertIsNot(first, second)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire('acc', CONFIG), first)
+        self.assertEqual(self.pool.stats()['size'], 2)
+
+    def test_invalidate_closes_busy_client_on_release(self):
+        client = self.pool.acquire('acc', CONFIG)
+        self.pool.invalidate('acc')
+        self.assertFalse(client.closed)
+        self.pool.release(client)
+        self.assertTrue(client.closed)
+        self.assertIsNot(self.pool.acquire('acc', CONFIG), client)
+
+
+class WithdrawBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        patches = [
+            mock.patch.object(service_exchange_withdraw, 'load_exchange_config', return_value=(CONFIG, None)),
+            mock.patch.object(service_exchange_withdraw, 'acquire_exchange_client', side_effect=lambda *args: FakeClient()),
+            mock.patch.object(service_exchange_withdraw, 'release_exchange_client'),
+            mock.patch.object(service_exchange_withdraw, 'withdraw_with_client', side_effect=self.fake_withdraw),
+            mock.patch.object(service_exchange_withdraw, 'WITHDRAW_BATCH_MIN_INTERVAL', 0),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_withdraw(self, client, platform, to_address, network, coin, amount):
+        self.calls.append(to_address)
+        if to_address == 'boom':
+            raise RuntimeError('unexpected')
+        if to_address == 'slow':
+            return service_exchange_withdraw.build_withdraw_error(ccxt.RequestTimeout('timed out'), platform,
+                                                                  to_address, network, coin, amount)
+        return {'success': True, 'msg': '提现成功', 'data': None}
+
+    def test_invalid_items_fail_before_any_withdrawal(self):
+        items = [
+            {'exchange': 'acc', 'toAddress': 'addr1', 'coin': 'USDT', 'amount': 1},
+            {'exchange': 'acc', 'toAddress': 123, 'coin': 'USDT', 'amount': 1},
+            {'exchange': 'acc', 'toAddress': 'addr3', 'coin': 'USDT', 'amount': 1, 'interval': 'abc'},
+            {'exchange': 'acc', 'toAddress': 'addr4', 'coin': 'USDT', 'amount': 'x'},
+        ]
+        results = service_exchange_withdraw.withdraw_batch('pwd', items)
+        self.assertEqual([result['success'] for result in results], [True, False, False, False])
+        self.assertEqual(self.calls, ['addr1'])
+
+    def test_item_errors_and_progress_errors_do_not_abort_batch(self):
+        items = [{'exchange': 'acc', 'toAddress': address, 'coin': 'USDT', 'amount': 1}
+                 for address in ('addr1', 'boom', 'addr3')]
+        progress = mock.Mock(side_effect=RuntimeError('db down'))
+        results = service_exchange_withdraw.withdraw_batch('pwd', items, progress=progress)
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertEqual(progress.call_count, 3)
+
+
+    def test_network_error_is_unknown_and_counted_separately(self):
+        items = [{'exchange': 'acc', 'toAddress': address, 'coin': 'USDT', 'amount': 1}
+                 for address in ('addr1', 'slow', 'boom')]
+        progress = mock.Mock()
+        results = service_exchange_withdraw.withdraw_batch('pwd', items, progress=progress)
+        self.assertEqual(results[1]['data']['status'], 'unknown')
+        self.assertEqual(results[1]['data']['to_address'], 'slow')
+        self.assertIsNone(results[2]['data'])
+        self.assertEqual(progress.call_args[0][0], {'total': 3, 'success': 1, 'failed': 1, 'unknown': 1})
+
+    def test_rejected_request_is_plain_failure(self):
+        result = service_exchange_withdraw.build_withdraw_error(ccxt.RateLimitExceeded('429'), 'binance',
+                                                                'addr', 'BSC', 'USDT', 1)
+        self.assertFalse(service_exchange_withdraw.is_withdraw_unknown(result))
+
+
+class LookupWithdrawFeeTest(unittest.TestCase):
+
+    CURRENCIES = {
+        'USDT': {'networks': {
+            'USDT-ERC20': {'fee': 5, 'limits': {'withdraw': {'min': 10}}},
+            'USDT-BSC': {'fee': 0.8, 'limits': None},
+        }}
+    }
+
+    def test_empty_network_is_rejected(self):
+        result = service_exchange_withdraw.lookup_withdraw_fee('okx', self.CURRENCIES, 'USDT', '')
+        self.assertFalse(result['success'])
+
+    def test_missing_limits(self):
+        result = service_exchange_withdraw.lookup_withdraw_fee('okx', self.CURRENCIES, 'USDT', 'BSC')
+        self.assertEqual(result['data']['fee'], 0.8)
+        self.assertEqual(result['data']['min_withdraw'], 'N/A')
+
+    def test_malformed_metadata_fails_only_that_pair(self):
+        currencies = dict(self.CURRENCIES, ETH={'networks': {'ETH': {'limits': {'withdraw': 'bad'}}}})
+        results = service_exchange_withdraw.lookup_withdraw_fees('binance', currencies, [
+            {'coin': 'ETH', 'network': 'ETH'}, {'coin': 'USDT', 'network': 'USDT-ERC20'}])
+        self.assertEqual([result['success'] for result in results], [False, True])
+
+
+class GetBalancesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        self.ran = []
+        patches = [
+            mock.patch.object(service_exchange_withdraw, '_get_balance_executor', return_value=self.executor),
+            mock.patch.object(service_exchange_withdraw, 'get_balance', side_effect=self.fake_balance),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_balance(self, name, pwd, coin):
+        self.ran.append(name)
+        time.sleep(0.3)
+        return {'success': True, 'data': [{'coin': 'USDT', 'free': 1, 'used': 0, 'total': 1}]}
+
+    def test_timeout_starts_when_task_begins(self):
+        # 单线程池：第二个账户排队0.3秒后开始，仍在自己的超时内完成
+        data = service_exchange_withdraw.get_balances('pwd', ['a', 'b'], timeout=0.5)['data']
+        self.assertEqual([account['success'] for account in data['accounts']], [True, True])
+
+    def test_queued_tasks_are_cancelled_at_deadline(self):
+        data = service_exchange_withdraw.get_balances('pwd', ['a', 'b', 'c'], timeout=0.2)['data']
+        self.assertEqual([account['msg'] for account in data['accounts']], ['查询超时', '排队超时，未执行', '排队超时，未执行'])
+        self.executor.shutdown(wait=True)
+        self.assertEqual(self.ran, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+# coding:utf-8
+'''
+Description: service_wallet 导入测试
+'''
+import unittest
+from unittest import mock
+
+import service_wallet
+
+
+class ImportWalletsTest(unittest.TestCase):
+
+    def test_parse_derivation_path(self):
+        self.assertEqual(service_wallet._parseWalletLine("0xabc,pk,phrase,m/44'/60'/0'/0/5"),
+                         ('0xabc', 'pk', 'phrase', "m/44'/60'/0'/0/5"))
+        # 第4列不是派生路径时忽略，不能覆盖index
+        self.assertEqual(service_wallet._parseWalletLine('0xabc,pk,phrase,5'), ('0xabc', 'pk', 'phrase', None))
+
+    def test_hd_wallets_use_reserved_indexes(self):
+        lines = [f"0x{i:040x},pk{i},phrase,m/44'/60'/0'/0/{i}" for i in range(3)]
+        with mock.patch.object(service_wallet, 'utils_db') as db, \
+                mock.patch.object(service_wallet.utils_encrypt, 'encrypt', side_effect=lambda value, pwd: value):
+            db.reserveProjectIndexes.return_value = 11
+            db.batchQueryExistingAddresses.return_value = set()
+            db.batchInsertWallets.side_effect = len
+            service_wallet.importWallets(lines, 'p1', None, 'pwd', encrypted=False)
+        rows = db.batchInsertWallets.call_args[0][0]
+        self.assertEqual([row['index'] for row in rows], [11, 12, 13])
+        self.assertEqual([row['derivation_path'] for row in rows], [f"m/44'/60'/0'/0/{i}" for i in range(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
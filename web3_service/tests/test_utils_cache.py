@@ -0,0 +1,51 @@
+# coding:utf-8
+'''
+Description: utils_cache 测试
+'''
+import threading
+import unittest
+
+import utils_cache
+
+
+class TTLCacheTest(unittest.TestCase):
+
+    def test_get_or_load_caches(self):
+        cache = utils_cache.TTLCache('test', 60)
+        self.assertEqual(cache.get_or_load('k', lambda: 1), 1)
+        self.assertEqual(cache.get_or_load('k', lambda: 2), 1)
+
+    def test_invalidate_during_load_discards_result(self):
+        cache = utils_cache.TTLCache('test', 60)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slowLoader():
+            started.set()
+            release.wait(5)
+            return 'stale'
+
+        thread = threading.Thread(target=lambda: cache.get_or_load('k', slowLoader))
+        thread.start()
+        started.wait(5)
+        cache.invalidate('k')
+        release.set()
+        thread.join()
+        self.assertEqual(cache.get('k'), (False, None))
+        self.assertEqual(cache.get_or_load('k', lambda: 'fresh'), 'fresh')
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = utils_cache.LRUCache('test', 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# coding:utf-8
+'''
+Description: utils_db 查询测试（SQLite内存库）
+'''
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import sessionmaker
+
+import db_model
+import utils_db
+
+
+class IterWalletTest(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        db_model.Base.metadata.create_all(engine)
+        self._session = utils_db.Session
+        utils_db.Session = sessionmaker(engine)
+        session = utils_db.Session()
+        for i in range(7):
+            session.add(db_model.Wallet(index=i, address=f'addr{i}', project='p1' if i % 2 else 'p2'))
+        session.commit()
+        session.close()
+
+    def tearDown(self):
+        utils_db.Session = self._session
+
+    def test_iter_by_project(self):
+        wallets = list(utils_db.iterWalletByAddressOrProject(None, 'p1', batchSize=2))
+        self.assertEqual([wallet.address for wallet in wallets], ['addr1', 'addr3', 'addr5'])
+
+    def test_iter_by_address(self):
+        wallets = list(utils_db.iterWalletByAddressOrProject('addr2', None, batchSize=2))
+        self.assertEqual([wallet.address for wallet in wallets], ['addr2'])
+
+    def test_iter_by_address_or_project(self):
+        wallets = list(utils_db.iterWalletByAddressOrProject('addr2', 'p1', batchSize=2))
+        self.assertEqual([wallet.address for wallet in wallets], ['addr1', 'addr2', 'addr3', 'addr5'])
+
+
+class ProjectStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        db_model.Base.metadata.create_all(engine)
+        self._session = utils_db.Session
+        utils_db.Session = sessionmaker(engine)
+
+    def tearDown(self):
+        utils_db.Session = self._session
+
+    def add_stats(self, *rows):
+        session = utils_db.Session()
+        for (project, count, maxIndex) in rows:
+            session.add(db_model.ProjectStats(project=project, wallet_count=count, max_index=maxIndex))
+        session.commit()
+        session.close()
+
+    def test_wallets_without_project_are_counted(self):
+        self.add_stats(('p1', 3, 3), (utils_db.NULL_PROJECT_KEY, 2, 9))
+        stats, total = utils_db._queryProjectStatistics()
+        self.assertEqual(stats, [{'project': None, 'count': 2}, {'project': 'p1', 'count': 3}])
+        self.assertEqual(total, 5)
+
+    def test_empty_null_bucket_is_hidden(self):
+        self.add_stats(('p1', 3, 3), (utils_db.NULL_PROJECT_KEY, 0, 9))
+        self.assertEqual(utils_db._queryProjectStatistics(), ([{'project': 'p1', 'count': 3}], 3))
+
+    def test_last_index_without_project_reads_counter_row(self):
+        self.add_stats((utils_db.NULL_PROJECT_KEY, 2, 9))
+        self.assertEqual(utils_db.queryProjectLastIndex(None), 9)
+
+
+class ReserveProjectIndexesTest(unittest.TestCase):
+
+    def reserve(self, project, lastIndex):
+        session = mock.MagicMock()
+        session.query.return_value.filter.return_value.with_for_update.return_value.scalar.return_value = lastIndex
+        with mock.patch.object(utils_db, 'Session', return_value=session):
+            start = utils_db.reserveProjectIndexes(project, 3)
+        seed = session.execute.call_args[0][0].compile(dialect=mysql.dialect(), compile_kwargs={'literal_binds': True})
+        filters = [str(call[0][0].compile(compile_kwargs={'literal_binds': True}))
+                   for call in session.query.return_value.filter.call_args_list]
+        return start, str(seed), filters
+
+    def test_reserve_without_project_locks_counter_row(self):
+        start, seed, filters = self.reserve(None, 4)
+        self.assertEqual(start, 5)
+        self.assertIn('wallet.project IS NULL', seed)
+        self.assertIn('ON DUPLICATE KEY UPDATE', seed)
+        self.assertEqual(set(filters), {"project_stats.project = '\x00'"})
+
+    def test_reserve_with_project(self):
+        start, seed, filters = self.reserve('p1', 0)
+        self.assertEqual(start, 1)
+        self.assertIn("wallet.project = 'p1'", seed)
+        self.assertEqual(set(filters), {"project_stats.project = 'p1'"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# coding:utf-8
+'''
+Description: utils_rpc 节点池测试（本地 http.server 模拟RPC节点）
+'''
+import json
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import utils_rpc
+
+
+class MockNode:
+    '''
+    模拟RPC节点：mode 为 ok / revert / http500 / http502 / http429，delay 为响应前等待秒数
+    '''
+
+    def __init__(self, result, mode='ok', delay=0):
+        self.result = result
+        self.mode = mode
+        self.delay = delay
+        self.methods = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                node.methods.append(payload['method'])
+                if node.delay:
+                    time.sleep(node.delay)
+                if node.mode.startswith('http'):
+                    self.send_response(int(node.mode[4:]))
+                    self.end_headers()
+                    return
+                if node.mode == 'revert':
+                    body = {'jsonrpc': '2.0', 'id': payload['id'],
+                            'error': {'code': 3, 'message': 'execution reverted'}}
+                else:
+                    body = {'jsonrpc': '2.0', 'id': payload['id'], 'result': node.result}
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def closedUrl():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+class RpcPoolTest(unittest.TestCase):
+
+    def node(self, result, mode='ok', delay=0):
+        node = MockNode(result, mode, delay)
+        self.addCleanup(node.close)
+        return node
+
+    def test_failover_on_endpoint_errors(self):
+        for mode in ('http500', 'http429'):
+            bad, good = self.node('0xbad', mode), self.node('0x1')
+            pool = utils_rpc.RpcPool('test', [bad.url, good.url])
+            self.assertEqual(pool.call('eth_blockNumber'), '0x1')
+            self.assertEqual((len(bad.methods), len(good.methods)), (1, 1))
+        good = self.node('0x2')
+        pool = utils_rpc.RpcPool('test', [closedUrl(), good.url])
+        self.assertEqual(pool.call('eth_blockNumber'), '0x2')
+
+    def test_no_failover_on_revert(self):
+        bad, good = self.node(None, 'revert'), self.node('0x1')
+        pool = utils_rpc.RpcPool('test', [bad.url, good.url])
+        with self.assertRaises(utils_rpc.RpcError):
+            pool.call('eth_call', [{}, 'latest'])
+        self.assertEqual(good.methods, [])
+        # 业务错误不计入节点失败
+        self.assertEqual(pool.endpoints[0].consecutiveFailures, 0)
+
+    def test_cooldown_and_backoff(self):
+        bad, good = self.node(None, 'http500'), self.node('0x1')
+        pool = utils_rpc.RpcPool('test', [bad.url, good.url])
+        badEndpoint, goodEndpoint = pool.endpoints
+        with mock.patch.object(utils_rpc, 'RPC_FAILURE_THRESHOLD', 2), \
+                mock.patch.object(utils_rpc, 'RPC_COOLDOWN', 30):
+            for _ in range(3):
+                # 让故障节点的分数始终更优，只有暂停才会跳过它
+                goodEndpoint.latency = 100
+                self.assertEqual(pool.call('eth_blockNumber'), '0x1')
+            self.assertEqual(len(bad.methods), 2)
+            self.assertGreater(badEndpoint.cooldownUntil - time.monotonic(), 25)
+            # 连续失败越多暂停越久，最多8倍
+            badEndpoint.recordFailure(0.1)
+            self.assertGreater(badEndpoint.cooldownUntil - time.monotonic(), 55)
+            for _ in range(5):
+                badEndpoint.recordFailure(0.1)
+            self.assertLessEqual(badEndpoint.cooldownUntil - time.monotonic(), 240)
+
+    def test_hedge_after_delay(self):
+        slow, fast = self.node('0xslow', delay=0.5), self.node('0xfast')
+        pool = utils_rpc.RpcPool('test', [slow.url, fast.url], hedgeDelay=0.05)
+        started = time.monotonic()
+        self.assertEqual(pool.call('eth_blockNumber'), '0xfast')
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(len(slow.methods), 1)
+
+    def test_no_hedge_for_send_raw_transaction(self):
+        slow, fast = self.node('0xhash', delay=0.3), self.node('0xother')
+        pool = utils_rpc.RpcPool('test', [slow.url, fast.url], hedgeDelay=0.05)
+        self.assertEqual(pool.call('eth_sendRawTransaction', ['0x00']), '0xhash')
+        self.assertEqual(fast.methods, [])
+
+    def test_no_write_failover_when_maybe_delivered(self):
+        bad, good = self.node(None, 'http502'), self.node('0xhash')
+        pool = utils_rpc.RpcPool('test', [bad.url, good.url])
+        with self.assertRaises(Exception) as context:
+            pool.call('eth_sendRawTransaction', ['0x00'])
+        self.assertTrue(utils_rpc.isMaybeDelivered(context.exception))
+        self.assertEqual(good.methods, [])
+        # 连接未建立时可以安全切换节点
+        pool = utils_rpc.RpcPool('test', [closedUrl(), good.url])
+        self.assertEqual(pool.call('eth_sendRawTransaction', ['0x00']), '0xhash')
+
+
+
+class GetRpcClientTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(utils_rpc, _pools={}, _customPools=utils_rpc.OrderedDict(),
+                                      RPC_CUSTOM_POOL_SIZE=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_redact_url(self):
+        self.assertEqual(utils_rpc.redactUrl('https://eth.example.com/v2/secret-key'), 'https://eth.example.com/***')
+        self.assertEqual(utils_rpc.redactUrl('http://127.0.0.1:8545?key=1'), 'http://127.0.0.1:8545/***')
+        self.assertEqual(utils_rpc.redactUrl('https://rpc.example.com'), 'https://rpc.example.com')
+
+    def test_custom_pools_bounded_and_hidden_from_stats(self):
+        first = utils_rpc.getRpcClient(url='https://a.example.com/key1')
+        self.assertIs(utils_rpc.getRpcClient(url='https://a.example.com/key1'), first)
+        self.assertEqual(first.name, 'https://a.example.com/***')
+        utils_rpc.getRpcClient(url='https://b.example.com/key2')
+        utils_rpc.getRpcClient(url='https://c.example.com/key3')
+        self.assertEqual(list(utils_rpc._customPools), ['https://b.example.com/key2', 'https://c.example.com/key3'])
+        self.assertIsNot(utils_rpc.getRpcClient(url='https://a.example.com/key1'), first)
+
+        utils_rpc.getRpcClient('56')
+        stats = utils_rpc.getRpcPoolStats()
+        self.assertEqual([pool['name'] for pool in stats], ['chain:56'])
+        self.assertNotIn('key', json.dumps(stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# coding:utf-8
+'''
+Description: utils_wallet_gen 测试
+'''
+import unittest
+from unittest import mock
+
+import utils_wallet_evm
+import utils_wallet_gen
+import utils_wallet_sol
+
+
+class ClampWorkersTest(unittest.TestCase):
+
+    def test_clamp_workers(self):
+        with mock.patch.object(utils_wallet_gen, 'WALLET_GEN_WORKERS', 4):
+            self.assertEqual(utils_wallet_gen.clampWorkers(None), 4)
+            self.assertEqual(utils_wallet_gen.clampWorkers(10000), 4)
+            self.assertEqual(utils_wallet_gen.clampWorkers(2), 2)
+            self.assertEqual(utils_wallet_gen.clampWorkers(-3), 1)
+
+
+
+class ParallelDeterministicTest(unittest.TestCase):
+    '''
+    相同 seed 下进程池（2个进程）生成的结果与顺序生成完全一致
+    '''
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(utils_wallet_gen, 'WALLET_GEN_WORKERS', 2),
+            mock.patch.object(utils_wallet_gen, 'WALLET_GEN_PARALLEL_MIN', 0),
+            mock.patch.object(utils_wallet_gen, '_executor', None),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self._shutdownExecutor)
+
+    @staticmethod
+    def _shutdownExecutor():
+        if utils_wallet_gen._executor is not None:
+            utils_wallet_gen._executor.shutdown(wait=True)
+
+    def assertSameAsSequential(self, iterFunc, createFunc, count=6):
+        sequential = list(iterFunc(createFunc, count, workers=1, seed='test', batchSize=4))
+        parallel = list(iterFunc(createFunc, count, workers=2, seed='test', batchSize=4))
+        self.assertIsNotNone(utils_wallet_gen._executor)
+        self.assertEqual(len(sequential), count)
+        self.assertEqual(len(set(sequential)), count)
+        self.assertEqual(parallel, sequential)
+
+    def test_evm_wallets(self):
+        self.assertSameAsSequential(utils_wallet_gen.iterWallets, utils_wallet_evm.createAccountFromMnemonic)
+
+    def test_evm_hd_wallets(self):
+        self.assertSameAsSequential(utils_wallet_gen.iterHdWallets, utils_wallet_evm.createAccountRangeFromMnemonic)
+
+    def test_sol_wallets(self):
+        self.assertSameAsSequential(utils_wallet_gen.iterWallets, utils_wallet_sol.create_sol_wallet_from_mnemonic)
+
+    def test_sol_hd_wallets(self):
+        self.assertSameAsSequential(utils_wallet_gen.iterHdWallets, utils_wallet_sol.create_sol_wallet_range)
+
+
+if __name__ == '__main__':
+    unittest.main()
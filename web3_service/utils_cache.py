@@ -0,0 +1,143 @@
+# coding:utf-8
+'''
+Description: 进程内TTL缓存、LRU缓存
+'''
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    '''
+    线程安全的进程内TTL缓存，带命中/未命中计数
+    name: 缓存名称（统计输出用）
+    ttl: 过期秒数
+    '''
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+        # 每次失效加1，加载期间发生过失效的结果不写入缓存
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        读取缓存
+        :param key:
+        :return: (是否命中, 值)
+        '''
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self.hits += 1
+                return True, item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_load(self, key, loader):
+        '''
+        读取缓存，未命中时调用loader加载并写入
+        :param key:
+        :param loader: 无参加载函数
+        :return: 值
+        '''
+        hit, value = self.get(key)
+        if hit:
+            return value
+        with self._lock:
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if self._generation == generation:
+                self._data[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        '''
+        失效缓存
+        :param key: 为None时清空全部
+        '''
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class LRUCache:
+    '''
+    线程安全的进程内LRU缓存（不过期，超过容量时淘汰最久未使用的项），带命中/未命中计数
+    name: 缓存名称（统计输出用）
+    maxsize: 最大条目数
+    '''
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        读取缓存
+        :param key:
+        :return: (是否命中, 值)
+        '''
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        '''
+        失效缓存
+        :param key: 为None时清空全部
+        '''
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses
+            }
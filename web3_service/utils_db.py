@@ -3,16 +3,24 @@
 Author: llq
 Date: 2024/7/13-15:22
 '''
+import base64
+import json
 import os
 
 import db_model
 import logging
 import sys
+import utils_cache
 from db_model import Wallet
 from db_model import WalletMapping
+from db_model import ProjectStats
+from db_model import Job
 from db_model import ExchangeInfo
-from sqlalchemy import create_engine, Column, Integer, String, update, or_
+from db_model import TokenMetadata
+from sqlalchemy import create_engine, Column, Integer, String, update, or_, and_, func, inspect, select, insert, literal
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from db_model import DB_URI
 from datetime import datetime
 
@@ -28,22 +36,120 @@ if sys.platform == 'win32':
     logger.addHandler(handler)
 
 
+# 进程内共享的engine和session工厂，避免每次查询都新建连接池
+_engine = create_engine(
+    DB_URI,
+    poolclass=QueuePool,
+    pool_size=db_model.DB_POOL_SIZE,
+    max_overflow=db_model.DB_MAX_OVERFLOW,
+    pool_timeout=db_model.DB_POOL_TIMEOUT,
+    pool_recycle=db_model.DB_POOL_RECYCLE,
+    pool_pre_ping=db_model.DB_POOL_PRE_PING,
+)  # , echo=True
+Session = sessionmaker(_engine)
+
+# 项目列表/项目统计缓存（批量/单个插入钱包时主动失效）
+PROJECT_CACHE_TTL = int(os.getenv('PROJECT_CACHE_TTL', '60'))
+_projectCache = utils_cache.TTLCache('project', PROJECT_CACHE_TTL)
+
+# 流式查询时每批从服务端游标读取的行数
+WALLET_STREAM_BATCH_SIZE = int(os.getenv('WALLET_STREAM_BATCH_SIZE', '500'))
+
+# project_stats 中代表“无项目”（project 为 NULL）钱包的行（主键不能为NULL）
+NULL_PROJECT_KEY = '\x00'
+
+
+def _statsKey(project):
+    return NULL_PROJECT_KEY if project is None else project
+
+
 def getDbEngine():
     '''
-    数据库链接
+    数据库链接（共享连接池）
+    '''
+    return _engine
+
+
+def initDb():
+    '''
+    启动时一次性建表
+    '''
+    logger.info('[initDb] 初始化数据库表结构')
+    db_model.Base.metadata.create_all(_engine)
+    checkTableIndexes()
+    checkTableColumns()
+    ensureProjectStats()
+
+
+def checkTableIndexes():
+    '''
+    检查模型中定义的索引是否存在于数据库中（create_all 不会给已存在的表补索引）
+    缺失时输出警告，需执行 migrate_wallet_index.sql
+    :return: 缺失的索引名列表
+    '''
+    inspector = inspect(_engine)
+    missing = []
+    for table in db_model.Base.metadata.sorted_tables:
+        if not table.indexes or not inspector.has_table(table.name):
+            continue
+        existing = {idx['name'] for idx in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                missing.append(f'{table.name}.{index.name}')
+
+    if missing:
+        logger.warning(f'[checkTableIndexes] 缺少索引: {", ".join(missing)}，请按 migrate_wallet_index.sql 中的步骤核对、备份重复钱包后添加索引')
+    else:
+        logger.info('[checkTableIndexes] 索引检查通过')
+    return missing
+
+
+def checkTableColumns():
+    '''
+    检查模型中定义的列是否存在于数据库中（create_all 不会给已存在的表补列）
+    缺失时输出警告，需执行 migrate_wallet_derivation_path.sql
+    :return: 缺失的列名列表
+    '''
+    inspector = inspect(_engine)
+    missing = []
+    for table in db_model.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in existing)
+
+    if missing:
+        logger.warning(f'[checkTableColumns] 缺少列: {", ".join(missing)}，请执行 migrate_wallet_derivation_path.sql')
+    return missing
+
+
+def invalidateProjectCache():
+    '''
+    失效项目列表和项目统计缓存
     '''
-    engine = create_engine(DB_URI)  # , echo=True
-    db_model.Base.metadata.create_all(engine)
-    return engine
+    _projectCache.invalidate()
+    logger.debug('[invalidateProjectCache] 项目缓存已失效')
+
+
+def getCacheStats():
+    '''
+    获取缓存命中统计
+    :return: [{"name": ..., "size": ..., "ttl": ..., "hits": ..., "misses": ...}]
+    '''
+    return [_projectCache.stats()]
 
 
 def queryAllProjectList():
     '''
-    查询所有的项目列表
+    查询所有的项目列表（带TTL缓存）
     :return:
     '''
+    return _projectCache.get_or_load('projects', _queryAllProjectList)
+
+
+def _queryAllProjectList():
     logger.debug('[queryAllProjectList] 开始查询所有项目')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     result = session.query(Wallet.project).group_by(Wallet.project).all()
     session.close()
     logger.debug(f'[queryAllProjectList] 查询到 {len(result)} 个项目')
@@ -57,11 +163,16 @@ def queryProjectLastIndex(project):
     :return:
     '''
     logger.debug(f'[queryProjectLastIndex] 查询项目 {project} 的最后索引')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
-        result = session.query(Wallet.index).filter(
-            Wallet.project == project
-        ).order_by(Wallet.index.desc()).limit(1).scalar()
+        # 优先读取 project_stats，无统计记录时回退到 wallet 表
+        result = session.query(ProjectStats.max_index).filter(
+            ProjectStats.project == _statsKey(project)
+        ).scalar()
+        if result is None:
+            result = session.query(Wallet.index).filter(
+                Wallet.project == project
+            ).order_by(Wallet.index.desc()).limit(1).scalar()
         last_index = result if result is not None else 0
         logger.debug(f'[queryProjectLastIndex] 项目 {project} 的最后索引: {last_index}')
         return last_index
@@ -69,6 +180,64 @@ def queryProjectLastIndex(project):
         session.close()
 
 
+def reserveProjectIndexes(project, count):
+    '''
+    原子预留项目的一段连续index（project_stats 行作为计数器，SELECT ... FOR UPDATE 加锁）
+    并发导入同一项目时各自拿到互不重叠的区间；无项目的钱包使用 NULL_PROJECT_KEY 计数行
+    :param project: 项目名称，为None时预留无项目钱包的index
+    :param count: 预留数量
+    :return: 区间起始index，预留区间为 [start, start + count)
+    '''
+    key = _statsKey(project)
+    logger.debug(f'[reserveProjectIndexes] 预留项目 {project} 的 {count} 个index')
+    session = Session()
+    try:
+        # 项目还没有统计行时，用 wallet 表现有数据初始化（已存在则不变）
+        seed = select(
+            literal(key),
+            func.count(Wallet.id),
+            func.coalesce(func.max(Wallet.index), 0),
+            func.now()
+        ).where(Wallet.project.is_(None) if project is None else Wallet.project == project)
+        stmt = mysql_insert(ProjectStats).from_select(
+            ['project', 'wallet_count', 'max_index', 'updated_at'], seed)
+        session.execute(stmt.on_duplicate_key_update(project=ProjectStats.project))
+
+        last_index = session.query(ProjectStats.max_index).filter(
+            ProjectStats.project == key
+        ).with_for_update().scalar() or 0
+        session.query(ProjectStats).filter(ProjectStats.project == key).update(
+            {ProjectStats.max_index: last_index + count, ProjectStats.updated_at: datetime.now()},
+            synchronize_session=False)
+        session.commit()
+        logger.debug(f'[reserveProjectIndexes] 项目 {project} 预留区间: {last_index + 1} ~ {last_index + count}')
+        return last_index + 1
+    except Exception as e:
+        logger.error(f'[reserveProjectIndexes] 预留失败: {e}')
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+
+def _walletByAddressOrProjectQuery(session, address, project):
+    '''
+    构造按地址或项目查询钱包的Query
+    MySQL 无法用单个索引处理 address OR project，这里拆成两个各自走索引的查询：
+    只传一个条件时只查一次（idx_address 或 idx_project_index），都传时用 UNION 合并去重
+    :param session:
+    :param address:
+    :param project:
+    :return: Query
+    '''
+    if project is None:
+        return session.query(Wallet).filter(Wallet.address == address)
+    if address is None:
+        return session.query(Wallet).filter(Wallet.project == project)
+    return session.query(Wallet).filter(Wallet.address == address).union(
+        session.query(Wallet).filter(Wallet.project == project))
+
+
 def queryWalletByAddressOrProject(address, project):
     '''
     根据项目和地址查询钱包
@@ -77,19 +246,105 @@ def queryWalletByAddressOrProject(address, project):
     :return:
     '''
     logger.debug(f'[queryWalletByAddressOrProject] address={address}, project={project}')
-    session = sessionmaker(getDbEngine())()
-    result = session.query(Wallet).filter(or_(Wallet.address == address, Wallet.project == project)).all()
+    session = Session()
+    result = _walletByAddressOrProjectQuery(session, address, project).order_by(Wallet.id.asc()).all()
     session.close()
     logger.debug(f'[queryWalletByAddressOrProject] 查询到 {len(result)} 个钱包')
     return result
 
 
+def iterWalletByAddressOrProject(address, project, batchSize=WALLET_STREAM_BATCH_SIZE):
+    '''
+    根据项目和地址流式查询钱包（服务端游标，逐批读取，内存占用与结果总数无关）
+    :param address:
+    :param project:
+    :param batchSize: 每批从游标读取的行数
+    :return: 钱包生成器
+    '''
+    logger.debug(f'[iterWalletByAddressOrProject] address={address}, project={project}, batchSize={batchSize}')
+    session = Session()
+    try:
+        query = _walletByAddressOrProjectQuery(session, address, project).order_by(Wallet.id.asc()) \
+            .yield_per(batchSize).execution_options(stream_results=True)
+        count = 0
+        for wallet in query:
+            count += 1
+            yield wallet
+        logger.debug(f'[iterWalletByAddressOrProject] 流式读取 {count} 个钱包')
+    finally:
+        session.close()
+
+
+def encodeWalletCursor(index, walletId):
+    '''
+    生成分页游标（对前端不透明）
+    :param index: 本页最后一条的index
+    :param walletId: 本页最后一条的id
+    :return: 游标字符串
+    '''
+    raw = json.dumps([index, walletId], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decodeWalletCursor(cursor):
+    '''
+    解析分页游标
+    :param cursor: 游标字符串
+    :return: (index, id)
+    '''
+    try:
+        index, walletId = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if (index is not None and not isinstance(index, int)) or not isinstance(walletId, int):
+            raise ValueError(cursor)
+        return index, walletId
+    except Exception:
+        raise ValueError(f'无效的分页游标: {cursor}')
+
+
+def queryWalletPageByAddressOrProject(address, project, pageSize, cursor=None):
+    '''
+    根据项目和地址分页查询钱包（按 index, id 做 keyset 分页，不使用 OFFSET）
+    :param address:
+    :param project:
+    :param pageSize: 每页数量
+    :param cursor: 上一页返回的游标，首页为None
+    :return: (钱包列表, 下一页游标或None, 总数)
+    '''
+    logger.debug(f'[queryWalletPageByAddressOrProject] address={address}, project={project}, pageSize={pageSize}, cursor={cursor}')
+    session = Session()
+    try:
+        query = _walletByAddressOrProjectQuery(session, address, project)
+        total = query.count()
+
+        if cursor:
+            lastIndex, lastId = decodeWalletCursor(cursor)
+            # MySQL 升序时 NULL 排在最前，index 为空的记录之后接非空 index
+            if lastIndex is None:
+                query = query.filter(or_(Wallet.index.isnot(None),
+                                         and_(Wallet.index.is_(None), Wallet.id > lastId)))
+            else:
+                query = query.filter(or_(Wallet.index > lastIndex,
+                                         and_(Wallet.index == lastIndex, Wallet.id > lastId)))
+
+        # 多取一条用于判断是否还有下一页
+        result = query.order_by(Wallet.index.asc(), Wallet.id.asc()).limit(pageSize + 1).all()
+        nextCursor = None
+        if len(result) > pageSize:
+            result = result[:pageSize]
+            nextCursor = encodeWalletCursor(result[-1].index, result[-1].id)
+
+        logger.debug(f'[queryWalletPageByAddressOrProject] 本页 {len(result)} 个钱包，总数 {total}')
+        return result, nextCursor, total
+    finally:
+        session.close()
+
+
 def queryWalletByAddress(address):
     '''
     根据地址查询钱包信息
     '''
     logger.debug(f'[queryWalletByAddress] 查询地址 {address}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     result = session.query(Wallet).filter(Wallet.address == address).limit(1).all()
     session.close()
     if len(result) > 0:
@@ -107,7 +362,7 @@ def checkWalletIsExist(address, project):
     :return:
     '''
     logger.debug(f'[checkWalletIsExist] 检查钱包是否存在: address={address}, project={project}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     result = session.query(Wallet).filter(Wallet.address == address).filter(
         Wallet.project == project).limit(1).all()
     session.close()
@@ -130,7 +385,7 @@ def batchQueryExistingAddresses(project, addresses):
         return set()
     
     logger.debug(f'[batchQueryExistingAddresses] 批量查询 {len(addresses)} 个地址，项目={project}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         result = session.query(Wallet.address).filter(
             Wallet.project == project,
@@ -143,24 +398,68 @@ def batchQueryExistingAddresses(project, addresses):
         session.close()
 
 
+def queryProjectAddresses(project):
+    '''
+    查询项目下全部钱包地址（只读地址列，不涉及私钥解密），按index排序
+    :param project: 项目名称
+    :return: 地址列表
+    '''
+    logger.debug(f'[queryProjectAddresses] 查询项目地址: project={project}')
+    session = Session()
+    try:
+        result = session.query(Wallet.address).filter(Wallet.project == project) \
+            .order_by(Wallet.index.asc(), Wallet.id.asc()).all()
+        addresses = [row[0] for row in result]
+        logger.debug(f'[queryProjectAddresses] 查询到 {len(addresses)} 个地址')
+        return addresses
+    finally:
+        session.close()
+
+
+def queryWalletsByAddresses(addresses, project=None):
+    '''
+    批量按地址查询钱包（地址不区分大小写），同一地址存在于多个项目时取最早的一条
+    :param addresses: 地址列表
+    :param project: 项目名称（可选，限定项目）
+    :return: {小写地址: Wallet}
+    '''
+    if not addresses:
+        return {}
+    logger.debug(f'[queryWalletsByAddresses] 批量查询 {len(addresses)} 个地址，项目={project}')
+    session = Session()
+    try:
+        query = session.query(Wallet).filter(Wallet.address.in_(list(addresses)))
+        if project:
+            query = query.filter(Wallet.project == project)
+        wallets = {}
+        for wallet in query.order_by(Wallet.id.asc()).all():
+            wallets.setdefault(wallet.address.lower(), wallet)
+        logger.debug(f'[queryWalletsByAddresses] 找到 {len(wallets)} 个钱包')
+        return wallets
+    finally:
+        session.close()
+
+
 def batchInsertWallets(wallet_data_list):
     '''
-    批量插入钱包记录
+    批量插入钱包记录（INSERT IGNORE，项目内已存在的地址由唯一索引 uk_project_address 跳过）
     :param wallet_data_list: 钱包数据列表，每项包含 index, address, public_key, private_key, phrase, project, remark
-    :return: 插入数量
+    :return: 实际插入数量
     '''
     if not wallet_data_list:
         logger.debug('[batchInsertWallets] 钱包数据列表为空')
         return 0
     
     logger.info(f'[batchInsertWallets] 批量插入 {len(wallet_data_list)} 个钱包')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
-        # 使用 bulk_insert_mappings 批量插入
-        session.bulk_insert_mappings(Wallet, wallet_data_list)
+        result = session.execute(insert(Wallet).prefix_with('IGNORE', dialect='mysql'), wallet_data_list)
+        inserted = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(wallet_data_list)
+        _incrProjectStats(session, wallet_data_list, inserted)
         session.commit()
-        logger.info(f'[batchInsertWallets] 成功插入 {len(wallet_data_list)} 个钱包')
-        return len(wallet_data_list)
+        invalidateProjectCache()
+        logger.info(f'[batchInsertWallets] 成功插入 {inserted} 个钱包，跳过重复 {len(wallet_data_list) - inserted} 个')
+        return inserted
     except Exception as e:
         logger.error(f'[batchInsertWallets] 插入失败: {e}')
         session.rollback()
@@ -185,7 +484,7 @@ def insertWallet(index, address, private, phrase, project, remark, public=None):
     if db_wallet is not None:
         logger.debug(f'[insertWallet] 钱包已存在，跳过')
         return
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         wallet = Wallet(
             index=index,
@@ -196,7 +495,9 @@ def insertWallet(index, address, private, phrase, project, remark, public=None):
             project=project,
             remark=remark)
         session.add(wallet)
+        _incrProjectStats(session, [{'project': project, 'index': index}])
         session.commit()
+        invalidateProjectCache()
         logger.debug(f'[insertWallet] 钱包插入成功')
     except Exception as e:
         logger.error(f'[insertWallet] 插入失败: {e}')
@@ -219,7 +520,7 @@ def batchInsertWalletMapping(mappingList, project, remark):
         return 0
     
     logger.info(f'[batchInsertWalletMapping] 批量导入 {len(mappingList)} 个映射')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     now = datetime.now()
     
     try:
@@ -297,7 +598,7 @@ def queryWalletMappingBySourceAddresses(sourceAddresses):
         return []
     
     logger.debug(f'[queryWalletMappingBySourceAddresses] 批量查询 {len(sourceAddresses)} 个映射')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     result = session.query(WalletMapping).filter(
         WalletMapping.source_address.in_(sourceAddresses)
     ).all()
@@ -323,7 +624,7 @@ def queryWalletMappingBySourceAddress(sourceAddress):
     :return: {"sourceAddress": "xxx", "targetAddress": "xxx"} or None
     '''
     logger.debug(f'[queryWalletMappingBySourceAddress] 查询 {sourceAddress}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     result = session.query(WalletMapping).filter(
         WalletMapping.source_address == sourceAddress
     ).first()
@@ -343,26 +644,30 @@ def queryWalletMappingBySourceAddress(sourceAddress):
 
 def queryProjectStatistics():
     '''
-    查询所有项目的统计信息
+    查询所有项目的统计信息（带TTL缓存）
     :return: [{"project": "项目名", "count": 钱包数量}, ...] 和总钱包数
     '''
+    return _projectCache.get_or_load('stats', _queryProjectStatistics)
+
+
+def _queryProjectStatistics():
     logger.debug('[queryProjectStatistics] 查询项目统计信息')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
-        from sqlalchemy import func
-
-        # 使用 SQL 的 COUNT() 和 GROUP BY 高效统计每个项目的钱包数量
+        # 直接读取 project_stats，只扫描 O(项目数) 行
         result = session.query(
-            Wallet.project,
-            func.count(Wallet.id).label('count')
-        ).group_by(Wallet.project).all()
+            ProjectStats.project,
+            ProjectStats.wallet_count.label('count')
+        ).order_by(ProjectStats.project).all()
 
-        # 构建返回数据
+        # 构建返回数据（无项目的钱包统计在 NULL_PROJECT_KEY 行，按 project=None 返回）
         project_stats = []
         total_count = 0
         for row in result:
+            if row.project == NULL_PROJECT_KEY and not row.count:
+                continue
             project_stats.append({
-                "project": row.project,
+                "project": None if row.project == NULL_PROJECT_KEY else row.project,
                 "count": row.count
             })
             total_count += row.count
@@ -373,6 +678,115 @@ def queryProjectStatistics():
         session.close()
 
 
+def _incrProjectStats(session, wallet_data_list, inserted=None):
+    '''
+    在当前事务内累加项目统计
+    :param session: 当前事务的session
+    :param wallet_data_list: 本次插入的钱包数据，每项包含 project, index
+    :param inserted: 实际插入行数，小于列表长度说明有重复被忽略
+    '''
+    delta = {}
+    for item in wallet_data_list:
+        project = _statsKey(item.get('project'))
+        count, max_index = delta.get(project, (0, 0))
+        delta[project] = (count + 1, max(max_index, item.get('index') or 0))
+    if not delta:
+        return
+
+    if inserted is not None and inserted < len(wallet_data_list):
+        if len(delta) == 1:
+            project, (_, max_index) = next(iter(delta.items()))
+            delta[project] = (inserted, max_index)
+        else:
+            # 多个项目且有行被忽略时无法区分各项目实际插入数，按索引重新计数
+            counts = dict(session.query(Wallet.project, func.count(Wallet.id)).filter(
+                Wallet.project.in_(list(delta))).group_by(Wallet.project).all())
+            if NULL_PROJECT_KEY in delta:
+                counts[NULL_PROJECT_KEY] = session.query(func.count(Wallet.id)).filter(
+                    Wallet.project.is_(None)).scalar()
+            now = datetime.now()
+            for project, (_, max_index) in delta.items():
+                stmt = mysql_insert(ProjectStats).values(
+                    project=project, wallet_count=counts.get(project, 0), max_index=max_index, updated_at=now)
+                session.execute(stmt.on_duplicate_key_update(
+                    wallet_count=stmt.inserted.wallet_count,
+                    max_index=func.greatest(ProjectStats.max_index, stmt.inserted.max_index),
+                    updated_at=stmt.inserted.updated_at,
+                ))
+            return
+
+    now = datetime.now()
+    stmt = mysql_insert(ProjectStats).values([
+        {'project': project, 'wallet_count': count, 'max_index': max_index, 'updated_at': now}
+        for project, (count, max_index) in delta.items()
+    ])
+    stmt = stmt.on_duplicate_key_update(
+        wallet_count=ProjectStats.wallet_count + stmt.inserted.wallet_count,
+        max_index=func.greatest(ProjectStats.max_index, stmt.inserted.max_index),
+        updated_at=stmt.inserted.updated_at,
+    )
+    session.execute(stmt)
+
+
+def rebuildProjectStats():
+    '''
+    根据 wallet 表重算 project_stats（用于已有数据或统计不一致时）
+    钱包数按 wallet 表覆盖；max_index 取已有值与 wallet 表最大index中较大者，保留进行中的导入已预留的区间
+    :return: 重算后的统计行数
+    '''
+    logger.info('[rebuildProjectStats] 开始重建项目统计')
+    session = Session()
+    try:
+        # 已没有钱包的项目钱包数归零（行保留，其 max_index 仍是已分配的index上限）
+        session.query(ProjectStats).update({ProjectStats.wallet_count: 0}, synchronize_session=False)
+        projectKey = func.coalesce(Wallet.project, NULL_PROJECT_KEY)
+        source = select(
+            projectKey,
+            func.count(Wallet.id),
+            func.coalesce(func.max(Wallet.index), 0),
+            func.now()
+        ).group_by(projectKey)
+        stmt = mysql_insert(ProjectStats).from_select(
+            ['project', 'wallet_count', 'max_index', 'updated_at'], source)
+        session.execute(stmt.on_duplicate_key_update(
+            wallet_count=stmt.inserted.wallet_count,
+            max_index=func.greatest(ProjectStats.max_index, stmt.inserted.max_index),
+            updated_at=stmt.inserted.updated_at,
+        ))
+        session.commit()
+        invalidateProjectCache()
+        count = session.query(func.count(ProjectStats.project)).scalar()
+        logger.info(f'[rebuildProjectStats] 重建完成: {count} 个统计行')
+        return count
+    except Exception as e:
+        logger.error(f'[rebuildProjectStats] 重建失败: {e}')
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+
+def ensureProjectStats():
+    '''
+    启动时检查：project_stats 为空但 wallet 有数据，或有无项目钱包但缺少其统计行时，自动重建一次
+    '''
+    session = Session()
+    try:
+        has_stats = session.query(ProjectStats.project).limit(1).first() is not None
+        has_wallet = session.query(Wallet.id).limit(1).first() is not None
+        has_null_wallet = session.query(Wallet.id).filter(Wallet.project.is_(None)).limit(1).first() is not None
+        has_null_stats = session.query(ProjectStats.project).filter(
+            ProjectStats.project == NULL_PROJECT_KEY).first() is not None
+    finally:
+        session.close()
+    if has_wallet and not has_stats:
+        logger.warning('[ensureProjectStats] project_stats 为空，自动重建')
+        rebuildProjectStats()
+    elif has_null_wallet and not has_null_stats:
+        logger.warning('[ensureProjectStats] 缺少无项目钱包的统计，自动重建')
+        rebuildProjectStats()
+
+
 # ==================== 交易所信息相关 ====================
 
 def queryAllExchangeNames():
@@ -381,7 +795,7 @@ def queryAllExchangeNames():
     :return: 交易所信息列表，包含 name 和 platform
     '''
     logger.debug('[queryAllExchangeNames] 开始查询所有交易所名称')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         result = session.query(ExchangeInfo.name, ExchangeInfo.platform).filter(
             ExchangeInfo.name.isnot(None)
@@ -400,7 +814,7 @@ def queryExchangeByName(name):
     :return: 交易所信息或None
     '''
     logger.debug(f'[queryExchangeByName] 查询交易所: name={name}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         result = session.query(ExchangeInfo).filter(
             ExchangeInfo.name == name
@@ -434,7 +848,7 @@ def insertExchange(platform, apikey, secret, password, ip, name):
     :return: 新增的交易所信息
     '''
     logger.debug(f'[insertExchange] 新增交易所: name={name}, platform={platform}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         exchange = ExchangeInfo(
             platform=platform,
@@ -476,7 +890,7 @@ def updateExchange(name, platform, apikey, secret, password, ip):
     :return: 更新的记录数
     '''
     logger.debug(f'[updateExchange] 更新交易所: name={name}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         result = session.query(ExchangeInfo).filter(
             ExchangeInfo.name == name
@@ -515,7 +929,7 @@ def deleteExchange(name):
     :return: 删除的记录数
     '''
     logger.debug(f'[deleteExchange] 删除交易所: name={name}')
-    session = sessionmaker(getDbEngine())()
+    session = Session()
     try:
         result = session.query(ExchangeInfo).filter(
             ExchangeInfo.name == name
@@ -529,3 +943,155 @@ def deleteExchange(name):
         raise e
     finally:
         session.close()
+
+
+
+# ==================== 后台任务相关 ====================
+
+def insertJob(jobId, jobType, total=None):
+    '''
+    新增任务
+    :param jobId: 任务id
+    :param jobType: 任务类型
+    :param total: 总数（可选）
+    '''
+    logger.debug(f'[insertJob] 新增任务: id={jobId}, type={jobType}, total={total}')
+    session = Session()
+    now = datetime.now()
+    try:
+        session.add(Job(id=jobId, job_type=jobType, status='pending', total=total, processed=0,
+                        created_at=now, updated_at=now))
+        session.commit()
+    except Exception as e:
+        logger.error(f'[insertJob] 新增失败: {e}')
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+
+def updateJob(jobId, **fields):
+    '''
+    更新任务字段
+    :param jobId: 任务id
+    :param fields: status, processed, progress, result, error 等
+    :return: 更新的记录数
+    '''
+    session = Session()
+    try:
+        fields['updated_at'] = datetime.now()
+        result = session.query(Job).filter(Job.id == jobId).update(fields, synchronize_session=False)
+        session.commit()
+        return result
+    except Exception as e:
+        logger.error(f'[updateJob] 更新失败: {e}')
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+
+def queryJob(jobId):
+    '''
+    查询任务
+    :param jobId: 任务id
+    :return: 任务信息或None
+    '''
+    logger.debug(f'[queryJob] 查询任务: id={jobId}')
+    session = Session()
+    try:
+        job = session.query(Job).filter(Job.id == jobId).first()
+        if not job:
+            return None
+        return {
+            "id": job.id,
+            "type": job.job_type,
+            "status": job.status,
+            "total": job.total,
+            "processed": job.processed,
+            "progress": json.loads(job.progress) if job.progress else None,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error,
+            "createdAt": job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+            "updatedAt": job.updated_at.strftime('%Y-%m-%d %H:%M:%S') if job.updated_at else None
+        }
+    finally:
+        session.close()
+
+
+def failUnfinishedJobs(error):
+    '''
+    将未完成的任务标记为失败（服务重启后进程内队列已丢失）
+    :param error: 错误信息
+    :return: 更新的记录数
+    '''
+    session = Session()
+    try:
+        result = session.query(Job).filter(Job.status.in_(['pending', 'running'])).update(
+            {Job.status: 'failed', Job.error: error, Job.updated_at: datetime.now()},
+            synchronize_session=False)
+        session.commit()
+        if result:
+            logger.warning(f'[failUnfinishedJobs] {result} 个未完成任务已标记为失败')
+        return result
+    except Exception as e:
+        logger.error(f'[failUnfinishedJobs] 更新失败: {e}')
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+
+# ==================== 代币元数据相关 ====================
+
+def queryTokenMetadata(chainId, addresses):
+    '''
+    批量查询代币元数据
+    :param chainId: 链ID
+    :param addresses: 代币地址列表（小写）
+    :return: {小写地址: {"symbol", "decimals"}}
+    '''
+    if not addresses:
+        return {}
+    logger.debug(f'[queryTokenMetadata] 批量查询代币: chainId={chainId}, 数量={len(addresses)}')
+    session = Session()
+    try:
+        result = session.query(TokenMetadata.address, TokenMetadata.symbol, TokenMetadata.decimals).filter(
+            TokenMetadata.chain_id == chainId,
+            TokenMetadata.address.in_(list(addresses))
+        ).all()
+        return {row[0]: {'symbol': row[1], 'decimals': row[2]} for row in result}
+    finally:
+        session.close()
+
+
+def batchInsertTokenMetadata(chainId, metadata):
+    '''
+    批量保存代币元数据（INSERT IGNORE，已存在的代币由唯一索引 uk_chain_address 跳过）
+    :param chainId: 链ID
+    :param metadata: {小写地址: {"symbol", "decimals"}}
+    :return: 实际插入数量
+    '''
+    if not metadata:
+        return 0
+    now = datetime.now()
+    rows = [{
+        'chain_id': chainId,
+        'address': address,
+        'symbol': value['symbol'][:64] if value['symbol'] else value['symbol'],
+        'decimals': value['decimals'],
+        'created_at': now
+    } for (address, value) in metadata.items()]
+    session = Session()
+    try:
+        result = session.execute(insert(TokenMetadata).prefix_with('IGNORE', dialect='mysql'), rows)
+        session.commit()
+        inserted = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+        logger.debug(f'[batchInsertTokenMetadata] chainId={chainId}, 插入 {inserted} 个代币')
+        return inserted
+    except Exception as e:
+        logger.error(f'[batchInsertTokenMetadata] 插入失败: {e}')
+        session.rollback()
+        raise e
+    finally:
+        session.close()
@@ -6,6 +6,7 @@ Date: 2024/7/13-15:27
 
 from Crypto.Cipher import AES
 import base64
+import functools
 import hashlib
 import os
 import logging
@@ -108,19 +109,50 @@ def decrypt_private_key(encrypted_private_key):
         return encrypted_private_key
 
 
+# 派生密钥缓存大小（按password缓存sha256结果，仅保存在进程内存中）
+KEY_CACHE_SIZE = int(os.getenv('KEY_CACHE_SIZE', '128'))
+
+BS = 16
+IV = b'0000000000000000'
+
+
+@functools.lru_cache(maxsize=KEY_CACHE_SIZE)
+def _derive_key(password):
+    '''
+    计算AES密钥（sha256(password)），结果按password缓存
+    :param password: 密码
+    :return: 32字节密钥
+    '''
+    return hashlib.sha256(password.encode()).digest()
+
+
+def clear_key_cache():
+    '''
+    清空派生密钥缓存
+    '''
+    _derive_key.cache_clear()
+    logger.debug('[clear_key_cache] 派生密钥缓存已清空')
+
+
+def _pad(s):
+    # 补全16位
+    return s + (BS - len(s) % BS) * chr(BS - len(s) % BS)
+
+
+def _unpad(s):
+    # 去除填充
+    return s[:-ord(s[-1])]
+
+
 # 加密
 def aes_encrypt(raw, password):
-    # 补全16位
-    BS = 16
-    pad = lambda s: s + (BS - len(s) % BS) * chr(BS - len(s) % BS)
-    raw = pad(raw)
+    raw = _pad(raw)
 
-    # 计算密钥
-    key = hashlib.sha256(password.encode()).digest()
+    # 计算密钥（命中缓存时不再重复sha256）
+    key = _derive_key(password)
 
     # 加密
-    iv = b'0000000000000000'
-    cipher = AES.new(key, AES.MODE_CBC, iv)
+    cipher = AES.new(key, AES.MODE_CBC, IV)
     encrypted = cipher.encrypt(raw.encode('utf-8'))
 
     # base64编码并返回结果
@@ -132,20 +164,15 @@ def aes_decrypt(encrypted, password):
     # base64解码
     encrypted = base64.b64decode(encrypted)
 
-    # 计算密钥
-    key = hashlib.sha256(password.encode()).digest()
+    # 计算密钥（命中缓存时不再重复sha256）
+    key = _derive_key(password)
 
     # 解密
-    iv = b'0000000000000000'
-    cipher = AES.new(key, AES.MODE_CBC, iv)
+    cipher = AES.new(key, AES.MODE_CBC, IV)
     decrypted = cipher.decrypt(encrypted).decode('utf-8')
 
-    # 去除填充
-    unpad = lambda s: s[:-ord(s[-1])]
-    decrypted = unpad(decrypted)
-
     # 返回解密结果
-    return decrypted
+    return _unpad(decrypted)
 
 
 # 加密
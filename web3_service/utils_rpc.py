@@ -0,0 +1,441 @@
+# coding:utf-8
+'''
+Description: JSON-RPC 客户端 - 连接池复用、批量请求
+每条链可配置多个RPC节点，按延迟和错误率打分路由到最健康的节点，
+节点出错时自动切换，只读请求可选对冲（慢请求同时发往第二个节点，取先返回的结果）；
+写请求（广播交易）只在确定未送达时切换节点，超时、5xx 等结果不明确的错误直接抛出，避免重复广播
+'''
+
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.exceptions import NewConnectionError
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# 每个RPC节点的HTTP连接池大小
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', '32'))
+# RPC请求超时（秒）
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '20'))
+# 单个HTTP请求中最多打包的JSON-RPC调用数
+RPC_BATCH_SIZE = int(os.getenv('RPC_BATCH_SIZE', '100'))
+# 连续失败多少次后暂停使用该节点，及暂停秒数（连续失败越多暂停越久，最多8倍）
+RPC_FAILURE_THRESHOLD = int(os.getenv('RPC_FAILURE_THRESHOLD', '3'))
+RPC_COOLDOWN = float(os.getenv('RPC_COOLDOWN', '30'))
+# 只读请求对冲延迟（秒）：首选节点超过该时间未返回时，同时发往次优节点；0为关闭
+RPC_HEDGE_DELAY = float(os.getenv('RPC_HEDGE_DELAY', '0'))
+# 对冲请求线程数
+RPC_HEDGE_WORKERS = int(os.getenv('RPC_HEDGE_WORKERS', '16'))
+# 请求中传入的自定义RPC地址最多保留的节点池数（按最近使用淘汰）
+RPC_CUSTOM_POOL_SIZE = int(os.getenv('RPC_CUSTOM_POOL_SIZE', '16'))
+
+# 默认RPC节点（链 -> 节点列表），可通过 CHAIN_RPC_URLS 环境变量（JSON）覆盖或补充
+# 链用 chainId 表示，Solana 使用 "solana"
+DEFAULT_RPC_URLS = {
+    '1': ['https://eth.llamarpc.com', 'https://ethereum-rpc.publicnode.com'],
+    '56': ['https://bsc-dataseed1.binance.org', 'https://bsc-dataseed2.binance.org', 'https://bsc-rpc.publicnode.com'],
+    '137': ['https://polygon-rpc.com', 'https://polygon-bor-rpc.publicnode.com'],
+    '42161': ['https://arb1.arbitrum.io/rpc', 'https://arbitrum-one-rpc.publicnode.com'],
+    '10': ['https://mainnet.optimism.io', 'https://optimism-rpc.publicnode.com'],
+    '43114': ['https://api.avax.network/ext/bc/C/rpc', 'https://avalanche-c-chain-rpc.publicnode.com'],
+    '8453': ['https://base.llamarpc.com', 'https://mainnet.base.org', 'https://base-rpc.publicnode.com'],
+    '324': ['https://zksync-era.public.blastapi.io', 'https://mainnet.era.zksync.io'],
+    '59144': ['https://linea.blockpi.network/v1/rpc/public', 'https://rpc.linea.build'],
+    '5000': ['https://rpc.mantle.xyz'],
+    '534352': ['https://rpc.scroll.io'],
+    '1088': ['https://andromeda.metis.io/?owner=1088'],
+    'solana': ['https://api.mainnet-beta.solana.com'],
+}
+
+# 会改变链上状态的方法：不对冲
+WRITE_METHODS = {'eth_sendRawTransaction', 'eth_sendTransaction', 'sendTransaction'}
+
+
+def _loadRpcUrls():
+    urls = {key: list(value) for (key, value) in DEFAULT_RPC_URLS.items()}
+    custom = os.getenv('CHAIN_RPC_URLS')
+    if custom:
+        try:
+            for (chain, value) in json.loads(custom).items():
+                urls[str(chain)] = [value] if isinstance(value, str) else list(value)
+        except Exception as e:
+            logger.error(f'[_loadRpcUrls] CHAIN_RPC_URLS 配置错误: {e}')
+    return urls
+
+
+RPC_URLS = _loadRpcUrls()
+
+
+def redactUrl(url):
+    '''
+    隐藏RPC地址中的路径和参数（常含服务商API Key），用于日志和统计输出
+    :return: 如 "https://eth-mainnet.example.com/***"
+    '''
+    try:
+        parts = urlsplit(url)
+        redacted = f'{parts.scheme}://{parts.hostname or ""}' + (f':{parts.port}' if parts.port else '')
+    except ValueError:
+        return '***'
+    if parts.path.strip('/') or parts.query or parts.fragment:
+        redacted += '/***'
+    return redacted
+
+
+class RpcError(Exception):
+    '''
+    JSON-RPC 返回的错误
+    '''
+
+    def __init__(self, error):
+        self.code = error.get('code') if isinstance(error, dict) else None
+        self.message = error.get('message') if isinstance(error, dict) else str(error)
+        super().__init__(f'RPC错误 {self.code}: {self.message}')
+
+
+class RpcClient:
+    '''
+    单个RPC节点的客户端，复用HTTP连接（线程安全）
+    '''
+
+    def __init__(self, url, timeout=RPC_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RPC_POOL_SIZE)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def _post(self, payload):
+        response = self._session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def call(self, method, params=None):
+        '''
+        单个调用
+        :param method: RPC方法名
+        :param params: 参数列表
+        :return: result，出错时抛出 RpcError
+        '''
+        data = self._post({'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params or []})
+        if data.get('error'):
+            raise RpcError(data['error'])
+        return data.get('result')
+
+    def batch(self, calls):
+        '''
+        批量调用：按 RPC_BATCH_SIZE 拆分，每组一个HTTP请求
+        :param calls: [(method, params), ...]
+        :return: 与 calls 顺序一致的结果列表，单个调用出错时对应位置为 RpcError 实例
+        '''
+        results = []
+        for start in range(0, len(calls), RPC_BATCH_SIZE):
+            chunk = calls[start:start + RPC_BATCH_SIZE]
+            ids = [next(self._ids) for _ in chunk]
+            payload = [{'jsonrpc': '2.0', 'id': rid, 'method': method, 'params': params or []}
+                       for (rid, (method, params)) in zip(ids, chunk)]
+            data = self._post(payload)
+            if isinstance(data, dict):
+                # 节点不支持批量或整体报错时返回单个错误对象
+                raise RpcError(data.get('error') or data)
+            byId = {item.get('id'): item for item in data}
+            for rid in ids:
+                item = byId.get(rid)
+                if item is None:
+                    results.append(RpcError({'code': None, 'message': '缺少响应'}))
+                elif item.get('error'):
+                    results.append(RpcError(item['error']))
+                else:
+                    results.append(item.get('result'))
+        return results
+
+
+def isEndpointError(e):
+    '''
+    判断是否为节点自身的问题（网络错误、HTTP错误、限流），需要切换节点
+    节点正常返回的业务错误（如合约revert）不切换
+    '''
+    if not isinstance(e, RpcError):
+        return True
+    message = (e.message or '').lower()
+    return e.code in (-32005, -32090, 429) or 'rate limit' in message or 'too many requests' in message \
+        or 'batch' in message
+
+
+def isMaybeDelivered(e):
+    '''
+    判断请求出错后节点是否可能已收到并执行（读取超时、5xx、连接中途断开等）
+    节点返回的JSON-RPC错误、连接未建立、限流视为未执行
+    '''
+    if isinstance(e, (RpcError, requests.exceptions.ConnectTimeout)):
+        return False
+    if isinstance(e, requests.exceptions.HTTPError):
+        return e.response is None or e.response.status_code != 429
+    if isinstance(e, requests.exceptions.ConnectionError) and e.args:
+        return not isinstance(getattr(e.args[0], 'reason', e.args[0]), NewConnectionError)
+    return True
+
+
+class RpcEndpoint:
+    '''
+    RPC节点及其健康状态：延迟和错误率用指数移动平均，连续失败达到阈值后暂停使用一段时间
+    '''
+
+    ALPHA = 0.2
+
+    def __init__(self, url):
+        self.url = url
+        self.label = redactUrl(url)
+        self.client = RpcClient(url)
+        self.latency = 0.5
+        self.errorRate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutiveFailures = 0
+        self.cooldownUntil = 0.0
+        self._lock = threading.Lock()
+
+    def score(self):
+        '''
+        分数越低越健康
+        '''
+        return self.latency * (1 + 5 * self.errorRate)
+
+    def available(self, now):
+        return self.cooldownUntil <= now
+
+    def recordSuccess(self, elapsed):
+        with self._lock:
+            self.requests += 1
+            self.latency = (1 - self.ALPHA) * self.latency + self.ALPHA * elapsed
+            self.errorRate = (1 - self.ALPHA) * self.errorRate
+            self.consecutiveFailures = 0
+
+    def recordFailure(self, elapsed):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self.latency = (1 - self.ALPHA) * self.latency + self.ALPHA * max(elapsed, self.latency)
+            self.errorRate = (1 - self.ALPHA) * self.errorRate + self.ALPHA
+            self.consecutiveFailures += 1
+            if self.consecutiveFailures >= RPC_FAILURE_THRESHOLD:
+                factor = min(2 ** (self.consecutiveFailures - RPC_FAILURE_THRESHOLD), 8)
+                self.cooldownUntil = time.monotonic() + RPC_COOLDOWN * factor
+                logger.warning(f'[RpcEndpoint] {self.label} 连续失败 {self.consecutiveFailures} 次，'
+                               f'暂停 {RPC_COOLDOWN * factor} 秒')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'url': self.label,
+                'latencyMs': round(self.latency * 1000, 1),
+                'errorRate': round(self.errorRate, 3),
+                'requests': self.requests,
+                'failures': self.failures,
+                'coolingDown': not self.available(time.monotonic())
+            }
+
+
+_hedgeExecutor = None
+_hedgeExecutorLock = threading.Lock()
+
+
+def _getHedgeExecutor():
+    global _hedgeExecutor
+    with _hedgeExecutorLock:
+        if _hedgeExecutor is None:
+            _hedgeExecutor = ThreadPoolExecutor(max_workers=RPC_HEDGE_WORKERS, thread_name_prefix='rpc-hedge')
+        return _hedgeExecutor
+
+
+class RpcPool:
+    '''
+    一条链的RPC节点池，接口与 RpcClient 相同（call / batch），可直接替换使用
+    '''
+
+    def __init__(self, name, urls, hedgeDelay=RPC_HEDGE_DELAY, chainId=None):
+        self.name = name
+        # 按链配置的节点池所属的链（自定义节点为None，链ID需向节点查询）
+        self.chainId = chainId
+        # 链上能力（如是否部署 Multicall3），由使用方按节点池记录
+        self.capabilities = {}
+        self.hedgeDelay = hedgeDelay
+        self.endpoints = [RpcEndpoint(url) for url in urls]
+
+    def _ranked(self):
+        '''
+        按健康度排序的节点列表；全部暂停时仍按分数返回，保证请求可以发出
+        '''
+        now = time.monotonic()
+        return sorted(self.endpoints, key=lambda endpoint: (not endpoint.available(now), endpoint.score()))
+
+    @staticmethod
+    def _attempt(endpoint, operation):
+        started = time.monotonic()
+        try:
+            result = operation(endpoint.client)
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            if isEndpointError(e):
+                endpoint.recordFailure(elapsed)
+            else:
+                endpoint.recordSuccess(elapsed)
+            raise
+        endpoint.recordSuccess(time.monotonic() - started)
+        return result
+
+    def _failover(self, endpoints, operation, readOnly=True):
+        '''
+        依次尝试节点，节点问题时切换到下一个，业务错误直接抛出
+        写请求出现可能已送达的错误时不切换，由调用方按结果未知处理
+        '''
+        lastError = None
+        for endpoint in endpoints:
+            try:
+                return self._attempt(endpoint, operation)
+            except Exception as e:
+                if not isEndpointError(e):
+                    raise
+                if not readOnly and isMaybeDelivered(e):
+                    logger.warning(f'[RpcPool] {self.name} 节点 {endpoint.label} 写请求结果未知，不切换节点: {e}')
+                    raise
+                lastError = e
+                logger.warning(f'[RpcPool] {self.name} 节点 {endpoint.label} 失败，切换节点: {e}')
+        raise lastError
+
+    def _execute(self, operation, readOnly):
+        endpoints = self._ranked()
+        if not readOnly or self.hedgeDelay <= 0 or len(endpoints) < 2:
+            return self._failover(endpoints, operation, readOnly)
+
+        # 对冲：首选节点超过 hedgeDelay 未返回时，剩余节点按顺序并行发起一次
+        executor = _getHedgeExecutor()
+        primary = executor.submit(self._failover, endpoints[:1], operation)
+        done, _ = wait([primary], timeout=self.hedgeDelay)
+        if done:
+            try:
+                return primary.result()
+            except Exception as e:
+                if not isEndpointError(e):
+                    raise
+                return self._failover(endpoints[1:], operation)
+
+        logger.debug(f'[RpcPool] {self.name} 首选节点慢于 {self.hedgeDelay}s，发起对冲请求')
+        secondary = executor.submit(self._failover, endpoints[1:], operation)
+        pending = {primary, secondary}
+        lastError = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    if not isEndpointError(e):
+                        raise
+                    lastError = e
+        raise lastError
+
+    def call(self, method, params=None):
+        return self._execute(lambda client: client.call(method, params), method not in WRITE_METHODS)
+
+    def batch(self, calls):
+        readOnly = all(method not in WRITE_METHODS for (method, _) in calls)
+        return self._execute(lambda client: client.batch(calls), readOnly)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'hedgeDelay': self.hedgeDelay,
+            'endpoints': [endpoint.stats() for endpoint in self._ranked()]
+        }
+
+
+def runBatches(client, calls, perRequest, concurrency):
+    '''
+    将RPC调用按 perRequest 分组为多个HTTP批量请求，以 concurrency 并发发送
+    :param client: RpcClient 或 RpcPool
+    :param calls: [(method, params), ...]
+    :param perRequest: 每个HTTP请求打包的调用数
+    :param concurrency: 并发HTTP请求数
+    :return: 与 calls 顺序一致的结果，失败位置为异常实例
+    '''
+    groups = [calls[i:i + perRequest] for i in range(0, len(calls), perRequest)]
+
+    def runGroup(group):
+        try:
+            return client.batch(group)
+        except Exception as e:
+            logger.error(f'[runBatches] 批量请求失败: {e}')
+            return [e] * len(group)
+
+    results = []
+    if not groups:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(groups)))) as executor:
+        for groupResult in executor.map(runGroup, groups):
+            results.extend(groupResult)
+    return results
+
+
+_pools = {}
+_customPools = OrderedDict()
+_poolsLock = threading.Lock()
+
+
+def getRpcClient(chainId=None, url=None):
+    '''
+    获取RPC节点池：按链配置的节点池常驻复用；请求传入的自定义地址只保留最近使用的 RPC_CUSTOM_POOL_SIZE 个
+    :param chainId: 链ID（Solana 为 "solana"），未传url时使用该链配置的节点
+    :param url: 自定义RPC地址（优先，单节点）
+    :return: RpcPool
+    '''
+    if url:
+        with _poolsLock:
+            pool = _customPools.get(url)
+            if pool is None:
+                pool = RpcPool(redactUrl(url), [url])
+                _customPools[url] = pool
+                # 淘汰的节点池不再被引用后，其连接随对象回收关闭
+                while len(_customPools) > RPC_CUSTOM_POOL_SIZE:
+                    _customPools.popitem(last=False)
+            _customPools.move_to_end(url)
+            return pool
+    key = str(chainId) if chainId is not None else None
+    urls = RPC_URLS.get(key)
+    if not urls:
+        raise ValueError(f'未配置链 {chainId} 的RPC节点')
+    with _poolsLock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = RpcPool(f'chain:{key}', urls, chainId=key)
+            _pools[key] = pool
+        return pool
+
+
+def getRpcPoolStats():
+    '''
+    获取按链配置的节点池的健康状态（不含请求传入的自定义节点，地址隐藏路径和参数）
+    :return: [{"name", "hedgeDelay", "endpoints": [{"url", "latencyMs", "errorRate", ...}]}]
+    '''
+    with _poolsLock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -6,33 +6,83 @@
 '''
 from hdwallet import BIP44HDWallet
 from hdwallet.cryptocurrencies import EthereumMainnet
-from hdwallet.utils import generate_mnemonic
+from hdwallet.derivations import BIP44Derivation
 
+import utils_wallet_gen
 
-def createAccountsOutSeedMulit(count):
+
+def createAccountFromMnemonic(mnemonic):
+    '''
+    根据助记词生成钱包（模块级函数，供进程池调用）
+    :param mnemonic: 助记词
+    :return: "地址,私钥,助记词"
+    '''
+    bip44_hdwallet: BIP44HDWallet = BIP44HDWallet(cryptocurrency=EthereumMainnet)
+    # Get Ethereum BIP44HDWallet from mnemonic
+    bip44_hdwallet.from_mnemonic(
+        mnemonic=mnemonic, language="english"  # , passphrase=PASSPHRASE
+    )
+    address = bip44_hdwallet.address()
+    privateKey = bip44_hdwallet.private_key()
+
+    # Clean default BIP44 derivation indexes/paths
+    bip44_hdwallet.clean_derivation()
+    return f"{address},{privateKey},{mnemonic}"
+
+
+def iterAccounts(count, workers=None, seed=None, hd=False):
+    '''
+    流式生成EVM钱包，边生成边产出
+    :param count: 钱包数量
+    :param workers: 生成进程数
+    :param seed: 确定性模式种子（仅测试用）
+    :param hd: HD批量模式，一个助记词派生所有账户
+    :return: 钱包行生成器
+    '''
+    if hd:
+        return utils_wallet_gen.iterHdWallets(createAccountRangeFromMnemonic, count, workers=workers, seed=seed)
+    return utils_wallet_gen.iterWallets(createAccountFromMnemonic, count, workers=workers, seed=seed)
+
+
+def createAccountsOutSeedMulit(count, workers=None, seed=None):
     '''
     生成短语种子钱包
     :param count: 钱包数量
-    :param fileName: 文件名
-    :param seed_length: 短语长度
-    :param seed: 已有短语
-    :return:
+    :param workers: 生成进程数，默认 WALLET_GEN_WORKERS，1表示顺序生成
+    :param seed: 确定性模式种子（仅测试用，相同seed下输出固定）
+    :return: ["地址,私钥,助记词", ...]
     '''
+    return utils_wallet_gen.generateWallets(createAccountFromMnemonic, count, workers=workers, seed=seed)
+
+
+def createAccountRangeFromMnemonic(mnemonic, start, end):
+    '''
+    从同一个助记词按 m/44'/60'/0'/0/i 派生账户（模块级函数，供进程池调用）
+    种子只派生一次，后续每个账户只做BIP32派生
+    :param mnemonic: 助记词
+    :param start: 起始派生序号（包含）
+    :param end: 结束派生序号（不包含）
+    :return: ["地址,私钥,助记词,派生路径", ...]
+    '''
+    bip44_hdwallet: BIP44HDWallet = BIP44HDWallet(cryptocurrency=EthereumMainnet)
+    bip44_hdwallet.from_mnemonic(mnemonic=mnemonic, language="english")
+    bip44_hdwallet.clean_derivation()
+
     walletInfoList = []
-    for i in range(count):
-        # 没有助记词,生成助记词
-        strength = int(128 * (12 / 12))
-        mnemonic = generate_mnemonic(language="english", strength=strength)
-        bip44_hdwallet: BIP44HDWallet = BIP44HDWallet(cryptocurrency=EthereumMainnet)
-        # Get Ethereum BIP44HDWallet from mnemonic
-        bip44_hdwallet.from_mnemonic(
-            mnemonic=mnemonic, language="english"  # , passphrase=PASSPHRASE
-        )
-        address = bip44_hdwallet.address()
-        privateKey = bip44_hdwallet.private_key()
-
-        # Clean default BIP44 derivation indexes/paths
+    for i in range(start, end):
+        bip44_derivation = BIP44Derivation(cryptocurrency=EthereumMainnet, account=0, change=False, address=i)
+        bip44_hdwallet.from_path(path=bip44_derivation)
+        walletInfoList.append(f"{bip44_hdwallet.address()},{bip44_hdwallet.private_key()},{mnemonic},m/44'/60'/0'/0/{i}")
         bip44_hdwallet.clean_derivation()
-        walletInfoList.append(f"{address},{privateKey},{mnemonic}")
-
     return walletInfoList
+
+
+def createAccountsFromOneMnemonic(count, workers=None, seed=None):
+    '''
+    HD批量模式：一个助记词派生多个账户
+    :param count: 账户数量
+    :param workers: 生成进程数
+    :param seed: 确定性模式种子（仅测试用）
+    :return: ["地址,私钥,助记词,派生路径", ...]
+    '''
+    return list(utils_wallet_gen.iterHdWallets(createAccountRangeFromMnemonic, count, workers=workers, seed=seed))
@@ -0,0 +1,164 @@
+# coding:utf-8
+'''
+Description: 钱包批量生成引擎 - 助记词生成和HD派生分发到进程池并行执行
+'''
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from mnemonic import Mnemonic
+
+# 配置日志
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('LOG_LEVEL') == 'DEBUG' else logging.INFO)
+
+if sys.platform == 'win32':
+    from logging import StreamHandler
+    handler = StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+
+# 生成进程数（默认CPU核数），即共享进程池大小，也是请求 workers 的上限
+WALLET_GEN_WORKERS = max(1, int(os.getenv('WALLET_GEN_WORKERS', str(os.cpu_count() or 1))))
+# 少于该数量时直接在当前进程生成，省去进程启动开销
+WALLET_GEN_PARALLEL_MIN = int(os.getenv('WALLET_GEN_PARALLEL_MIN', '50'))
+# 每批提交给进程池的数量，控制结果缓存大小
+WALLET_GEN_BATCH_SIZE = int(os.getenv('WALLET_GEN_BATCH_SIZE', '1000'))
+
+_mnemo = Mnemonic("english")
+
+# 进程内共享的生成进程池（首次并行生成时创建）
+_executor = None
+_executorLock = threading.Lock()
+
+
+def _getExecutor():
+    '''
+    获取共享进程池
+    子进程用 forkserver（Windows 为 spawn）启动，不从运行着 Flask 和任务线程的服务进程直接 fork
+    '''
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            logger.info(f'[getExecutor] 创建钱包生成进程池: workers={WALLET_GEN_WORKERS}, method={method}')
+            _executor = ProcessPoolExecutor(max_workers=WALLET_GEN_WORKERS,
+                                            mp_context=multiprocessing.get_context(method))
+        return _executor
+
+
+def _discardExecutor(executor):
+    '''
+    丢弃已损坏的进程池（子进程异常退出），下次使用时重新创建
+    '''
+    global _executor
+    with _executorLock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def clampWorkers(workers):
+    '''
+    限制请求的并行度在 [1, WALLET_GEN_WORKERS]
+    :param workers: 请求的进程数，为空时取 WALLET_GEN_WORKERS
+    '''
+    if not workers:
+        return WALLET_GEN_WORKERS
+    return max(1, min(int(workers), WALLET_GEN_WORKERS))
+
+
+def newMnemonic(index=None, seed=None):
+    '''
+    生成12词英文助记词
+    :param index: 钱包序号（确定性模式使用）
+    :param seed: 确定性模式种子，为None时使用随机熵
+    :return: 助记词
+    '''
+    if seed is None:
+        entropy = os.urandom(16)
+    else:
+        # 确定性模式：固定熵，仅用于测试并行结果与顺序结果一致，切勿用于真实钱包
+        entropy = hashlib.sha256(f'{seed}:{index}'.encode()).digest()[:16]
+    return _mnemo.to_mnemonic(entropy)
+
+
+def iterWallets(createOne, count, workers=None, seed=None, batchSize=None):
+    '''
+    批量生成钱包，按批提交到进程池，按顺序逐个产出
+    :param createOne: 模块级函数 createOne(mnemonic) -> "地址,私钥,助记词"
+    :param count: 钱包数量
+    :param workers: 并行度，默认 WALLET_GEN_WORKERS（上限），1表示顺序生成
+    :param seed: 确定性模式种子（相同seed下并行与顺序结果完全一致）
+    :param batchSize: 每批数量，默认 WALLET_GEN_BATCH_SIZE
+    :return: 钱包行生成器
+    '''
+    workers = clampWorkers(workers)
+    batchSize = batchSize or WALLET_GEN_BATCH_SIZE
+
+    if workers <= 1 or count < WALLET_GEN_PARALLEL_MIN:
+        logger.debug(f'[iterWallets] 顺序生成 {count} 个钱包')
+        for i in range(count):
+            yield createOne(newMnemonic(i, seed))
+        return
+
+    logger.info(f'[iterWallets] 使用 {workers} 个进程生成 {count} 个钱包')
+    executor = _getExecutor()
+    try:
+        for start in range(0, count, batchSize):
+            mnemonics = [newMnemonic(i, seed) for i in range(start, min(start + batchSize, count))]
+            chunksize = max(1, len(mnemonics) // (workers * 4))
+            for wallet in executor.map(createOne, mnemonics, chunksize=chunksize):
+                yield wallet
+    except BrokenProcessPool:
+        _discardExecutor(executor)
+        raise
+
+
+def generateWallets(createOne, count, workers=None, seed=None):
+    '''
+    批量生成钱包
+    :return: ["地址,私钥,助记词", ...]
+    '''
+    return list(iterWallets(createOne, count, workers=workers, seed=seed))
+
+
+def iterHdWallets(createRange, count, workers=None, seed=None, batchSize=None):
+    '''
+    HD批量模式：一个助记词按派生路径生成 count 个账户
+    派生区间按批分发到进程池，每个区间只做一次助记词到种子的派生
+    :param createRange: 模块级函数 createRange(mnemonic, start, end) -> ["地址,私钥,助记词,派生路径", ...]
+    :param count: 账户数量
+    :param workers: 并行度，默认 WALLET_GEN_WORKERS（上限），1表示顺序生成
+    :param seed: 确定性模式种子
+    :param batchSize: 每个区间的账户数，默认 WALLET_GEN_BATCH_SIZE
+    :return: 钱包行生成器
+    '''
+    workers = clampWorkers(workers)
+    batchSize = batchSize or WALLET_GEN_BATCH_SIZE
+    mnemonic = newMnemonic(0, seed)
+
+    if workers <= 1 or count < WALLET_GEN_PARALLEL_MIN:
+        logger.debug(f'[iterHdWallets] 顺序派生 {count} 个账户')
+        for start in range(0, count, batchSize):
+            for wallet in createRange(mnemonic, start, min(start + batchSize, count)):
+                yield wallet
+        return
+
+    # 区间不宜过大，保证每个进程都能分到任务
+    rangeSize = max(1, min(batchSize, -(-count // workers)))
+    ranges = [(start, min(start + rangeSize, count)) for start in range(0, count, rangeSize)]
+    logger.info(f'[iterHdWallets] 使用 {workers} 个进程派生 {count} 个账户，共 {len(ranges)} 个区间')
+    executor = _getExecutor()
+    try:
+        for batch in executor.map(createRange, [mnemonic] * len(ranges), [r[0] for r in ranges], [r[1] for r in ranges]):
+            for wallet in batch:
+                yield wallet
+    except BrokenProcessPool:
+        _discardExecutor(executor)
+        raise
@@ -4,27 +4,82 @@
     le: utils_wallet_sol.py
     Date: 2024/7/15-19:39
 '''
-from hdwallet.utils import generate_mnemonic
 import mnemonic
 from solders.keypair import Keypair
 
-def create_sol_wallet(num):
+import utils_wallet_gen
+
+
+def create_sol_wallet_from_mnemonic(phrase):
+    '''
+    根据助记词生成钱包（模块级函数，供进程池调用）
+    :param phrase: 助记词
+    :return: "地址,私钥,助记词"
+    '''
+    wallet = create_address(phrase=phrase)
+    address = wallet[0]
+    privateKey = wallet[1]
+    return f"{address},{privateKey},{phrase}"
+
+
+def iter_sol_wallet(num, workers=None, seed=None, hd=False):
+    '''
+    流式生成Solana钱包，边生成边产出
+    :param num: 钱包数量
+    :param workers: 生成进程数
+    :param seed: 确定性模式种子（仅测试用）
+    :param hd: HD批量模式，一个助记词派生所有账户
+    :return: 钱包行生成器
+    '''
+    if hd:
+        return utils_wallet_gen.iterHdWallets(create_sol_wallet_range, num, workers=workers, seed=seed)
+    return utils_wallet_gen.iterWallets(create_sol_wallet_from_mnemonic, num, workers=workers, seed=seed)
+
+
+def create_sol_wallet(num, workers=None, seed=None):
+    '''
+    生成Solana钱包
+    :param num: 钱包数量
+    :param workers: 生成进程数，默认 WALLET_GEN_WORKERS，1表示顺序生成
+    :param seed: 确定性模式种子（仅测试用，相同seed下输出固定）
+    :return: ["地址,私钥,助记词", ...]
+    '''
+    return utils_wallet_gen.generateWallets(create_sol_wallet_from_mnemonic, num, workers=workers, seed=seed)
+
+
+def create_sol_wallet_range(phrase, start, end):
+    '''
+    从同一个助记词按 m/44'/501'/i'/0' 派生账户（模块级函数，供进程池调用）
+    :param phrase: 助记词
+    :param start: 起始派生序号（包含）
+    :param end: 结束派生序号（不包含）
+    :return: ["地址,私钥,助记词,派生路径", ...]
+    '''
+    seed = mnemonic.Mnemonic("english").to_seed(phrase)
     walletInfoList = []
-    for i in range(0, num):
-        strength = int(128 * (12 / 12))
-        mnemonic = generate_mnemonic(language="english", strength=strength)
-        wallet = create_address(phrase=mnemonic)
-        address = wallet[0]
-        privateKey = wallet[1]
-        walletInfoList.append(f"{address},{privateKey},{mnemonic}")
+    for i in range(start, end):
+        public_key, private_key = create_address(phrase, account=i, seed=seed)
+        walletInfoList.append(f"{public_key},{private_key},{phrase},m/44'/501'/{i}'/0'")
     return walletInfoList
 
 
-def create_address(phrase):
-    # 通过短语创建钱包
-    mnemo = mnemonic.Mnemonic("english")
-    seed = mnemo.to_seed(phrase)
-    keypair = Keypair.from_seed_and_derivation_path(seed, "m/44'/501'/0'/0'")#"m/44'/501'/1'/0'"
+def create_sol_wallet_hd(num, workers=None, seed=None):
+    '''
+    HD批量模式：一个助记词派生多个Solana账户
+    :param num: 账户数量
+    :param workers: 生成进程数
+    :param seed: 确定性模式种子（仅测试用）
+    :return: ["地址,私钥,助记词,派生路径", ...]
+    '''
+    return list(utils_wallet_gen.iterHdWallets(create_sol_wallet_range, num, workers=workers, seed=seed))
+
+
+def create_address(phrase, account=0, seed=None):
+    # 通过短语创建钱包，seed 已派生时直接复用
+    if seed is None:
+        mnemo = mnemonic.Mnemonic("english")
+        seed = mnemo.to_seed(phrase)
+    keypair = Keypair.from_seed_and_derivation_path(seed, f"m/44'/501'/{account}'/0'")
     public_key = str(keypair.pubkey())
     private_key = str(keypair)
     return [public_key, private_key]